@@ -4,16 +4,35 @@
 
 from datetime import datetime, timedelta
 import os
+import re
+import gc
+import pickle
+import hashlib
+import sys
 import csv
-from io import StringIO
+import time
+import itertools
+import bisect
+import heapq
+import threading
+from collections import Counter
+from array import array
 
 from flask import (
-    Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response, Response
+    Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response, Response,
+    stream_with_context, abort,
 )
+import click
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail, Message
-from typing import Set, Dict, List
-from sqlalchemy import desc, func, UniqueConstraint, cast
+from typing import Set, Dict, List, Optional
+from sqlalchemy import (
+    desc, func, UniqueConstraint, cast, text, insert, update, delete, case, select, inspect, literal, union_all, tuple_, or_,
+)
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.types import Integer
 from sqlalchemy.exc import IntegrityError
 
@@ -24,8 +43,9 @@ app = Flask(__name__)
 # Simple dev secret key
 app.secret_key = "fallback-dev-key"
 
-# Database: hard-coded Render external URL (requires SSL)
-app.config["SQLALCHEMY_DATABASE_URI"] = (
+# Database: hard-coded Render external URL (requires SSL). Set
+# SQLALCHEMY_DATABASE_URI to point tests and benchmarks at a local database.
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("SQLALCHEMY_DATABASE_URI") or (
     "postgresql://servitech_db_user:"
     "79U6KaAxlHdUfOeEt1iVDc65KXFLPie2"
     "@dpg-d1ckf9ur433s73fti9p0-a.oregon-postgres.render.com"
@@ -115,16 +135,84 @@ class HiddenPart(db.Model):
     __tablename__ = "hidden_part"
     part_number = db.Column(db.String, primary_key=True)
 
+
+# Parts catalogue (source of truth; parts.csv is import/export only)
+class Part(db.Model):
+    __tablename__ = "part"
+    id = db.Column(db.Integer, primary_key=True)
+    part_number = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    description = db.Column(db.String(256), nullable=False, default="")
+    category = db.Column(db.String(120), nullable=False, default="", index=True)
+    make = db.Column(db.String(120), nullable=False, default="")
+    manufacturer = db.Column(db.String(120), nullable=False, default="")
+    image = db.Column(db.String(256), nullable=False, default="")
+    colour = db.Column(db.String(16), nullable=False, default="")
+    installs = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    is_reagent = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    # parts_catalogue cache version at which this row last changed
+    version = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+
+# Version counters shared by all gunicorn workers. A worker keeps its own
+# in-memory copy of cached data and only reloads it when the counter moves.
+class CacheVersion(db.Model):
+    __tablename__ = "cache_version"
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+
+def get_cache_version(name: str) -> int:
+    version = db.session.query(CacheVersion.version).filter_by(name=name).scalar()
+    return int(version or 0)
+
+
+def bump_cache_version(name: str):
+    """Increment a cache version in the current transaction (caller commits)."""
+    updated = CacheVersion.query.filter_by(name=name).update({"version": CacheVersion.version + 1})
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+
 #-- helper for hiding parts (not currently used)
 
 PART_NUMBER_KEY = "Product Code"  # match your CSV header exactly
+HIDDEN_PARTS_VERSION_KEY = "hidden_parts"
+# How long a worker trusts its hidden set before re-reading the version row
+HIDDEN_PARTS_RECHECK_SECONDS = 5.0
 
 def norm_pn(s: str) -> str:
     return (s or "").strip().upper()
 
-def get_hidden_part_numbers() -> Set[str]:
-    rows = db.session.query(HiddenPart.part_number).all()
-    return {norm_pn(pn) for (pn,) in rows}
+
+_NON_ALNUM_RE = re.compile(r"[^0-9A-Z]+")
+
+
+def compact_pn(s: str) -> str:
+    """Part code with case, spaces and punctuation folded away: "2ke/abl-001" -> "2KEABL001"."""
+    return _NON_ALNUM_RE.sub("", (s or "").upper())
+
+# (version, frozenset of norm_pn codes, monotonic time of last version check)
+_hidden_parts_cache = (None, frozenset(), 0.0)
+
+def get_hidden_parts_state():
+    """Return (version, hidden product codes uppercased), cached per worker.
+
+    The set is reloaded only when the hidden_parts version row changes; the
+    row is bumped by a trigger on hidden_part, so any writer invalidates it.
+    Within HIDDEN_PARTS_RECHECK_SECONDS of the last check no query is sent.
+    """
+    global _hidden_parts_cache
+    version, hidden, checked_at = _hidden_parts_cache
+    now = time.monotonic()
+    if version is not None and now - checked_at < HIDDEN_PARTS_RECHECK_SECONDS:
+        return version, hidden
+
+    current = get_cache_version(HIDDEN_PARTS_VERSION_KEY)
+    if current != version:
+        rows = db.session.query(HiddenPart.part_number).all()
+        hidden = frozenset(norm_pn(pn) for (pn,) in rows)
+    _hidden_parts_cache = (current, hidden, now)
+    return current, hidden
+
 
 
 
@@ -150,6 +238,11 @@ class Stocktake(db.Model):
     checked_by = db.Column(db.String(120), nullable=True)
     checked_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Denormalised counters (items + unfound lines), kept by recount_stocktake()
+    lines = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    total_qty = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    # Bumped on every line change; offline clients sync against it
+    revision = db.Column(db.Integer, default=0, server_default="0", nullable=False)
 
     run = db.relationship("StocktakeRun", backref="stocktakes")
     items = db.relationship("StocktakeItem", backref="stocktake", cascade="all, delete-orphan")
@@ -184,6 +277,43 @@ class StocktakeUnfoundItem(db.Model):
     stocktake = db.relationship("Stocktake", backref="unfound_items")
 
 
+class StocktakeRunTotal(db.Model):
+    """Master totals per run over its *submitted* stocktakes, kept incrementally."""
+    __tablename__ = "stocktake_run_total"
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey("stocktake_run.id"), nullable=False)
+    unfound = db.Column(db.Boolean, default=False, nullable=False)
+    part_number = db.Column(db.String(64), nullable=False)
+    # "" for catalogue parts; unfound lines are totalled per code + description
+    description = db.Column(db.String(256), default="", nullable=False)
+    total_qty = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("run_id", "unfound", "part_number", "description", name="uq_stocktake_run_total_key"),
+    )
+
+
+class StocktakeSyncOp(db.Model):
+    """Client op ids already applied by /sync, so retried batches apply once."""
+    __tablename__ = "stocktake_sync_op"
+    id = db.Column(db.Integer, primary_key=True)
+    stocktake_id = db.Column(db.Integer, db.ForeignKey("stocktake.id"), nullable=False)
+    op_id = db.Column(db.String(64), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("stocktake_id", "op_id", name="uq_stocktake_sync_op"),
+    )
+
+
+class SchemaMigration(db.Model):
+    """One applied entry of SCHEMA_MIGRATIONS."""
+    __tablename__ = "schema_migration"
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
 with app.app_context():
     try:
         db.create_all()
@@ -191,11 +321,166 @@ with app.app_context():
         logger.warning(f"Database auto-create skipped: {ex}")
 
 
+# Bump the hidden_parts cache version whenever hidden_part changes, whoever
+# writes it (this app, the Stock System or a manual SQL fix).
+HIDDEN_PART_VERSION_TRIGGER_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION bump_hidden_parts_version() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO cache_version (name, version) VALUES ('hidden_parts', 1)
+        ON CONFLICT (name) DO UPDATE SET version = cache_version.version + 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'hidden_part_bump_version') THEN
+            CREATE TRIGGER hidden_part_bump_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hidden_part
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_hidden_parts_version();
+        END IF;
+    END;
+    $$
+    """,
+]
+
+
+# Recompute Stocktake.lines / total_qty for every stocktake in one statement;
+# used to backfill the columns (schema migration 4) and by `flask recount-stocktakes`.
+STOCKTAKE_RECOUNT_ALL_SQL = """
+    UPDATE stocktake SET
+        lines = (SELECT COUNT(*) FROM stocktake_item i WHERE i.stocktake_id = stocktake.id)
+              + (SELECT COUNT(*) FROM stocktake_unfound_item u WHERE u.stocktake_id = stocktake.id),
+        total_qty = (SELECT COALESCE(SUM(i.quantity), 0) FROM stocktake_item i WHERE i.stocktake_id = stocktake.id)
+                  + (SELECT COALESCE(SUM(u.quantity), 0) FROM stocktake_unfound_item u WHERE u.stocktake_id = stocktake.id)
+"""
+
+
+# ── Schema migrations ─────────────────────────────────────────────────────────
+# create_all() only ever creates missing tables. Anything else (columns,
+# indexes, data fixes) is a numbered entry here, applied once per database in
+# version order and recorded in schema_migration. Never edit an entry that has
+# shipped; append a new one. Steps are SQL strings or callables.
+
+def _drop_reagent_order_items_column():
+    # Was migrate_drop_items.py: the JSON column replaced by reagent_order_item
+    if "items" in {c["name"] for c in inspect(db.engine).get_columns("reagent_order")}:
+        db.session.execute(text("ALTER TABLE reagent_order DROP COLUMN items"))
+
+
+def _add_stocktake_counter_columns():
+    # Databases created before the counters; new ones get them from create_all()
+    existing = {c["name"] for c in inspect(db.engine).get_columns("stocktake")}
+    missing = [name for name in ("lines", "total_qty", "revision") if name not in existing]
+    for name in missing:
+        db.session.execute(text(f"ALTER TABLE stocktake ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0"))
+    if {"lines", "total_qty"} & set(missing):
+        db.session.execute(text(STOCKTAKE_RECOUNT_ALL_SQL))
+
+
+def _create_hidden_part_version_trigger():
+    if db.engine.dialect.name == "postgresql":
+        for statement in HIDDEN_PART_VERSION_TRIGGER_SQL:
+            db.session.execute(text(statement))
+
+
+def _seed_stocktake_run_totals():
+    # Totals for runs submitted before they were kept incrementally. A rebuild
+    # replaces a run's rows, so databases seeded by the old start-up code end
+    # up the same.
+    run_ids = [
+        run_id for (run_id,) in
+        db.session.query(Stocktake.run_id).filter(Stocktake.status == "submitted").distinct()
+    ]
+    for run_id in run_ids:
+        rebuild_run_totals(run_id)
+
+
+SCHEMA_MIGRATIONS = [
+    (1, "Drop reagent_order.items", [_drop_reagent_order_items_column]),
+    (2, "Lowercase stored engineer emails", [
+        "UPDATE parts_order SET email = lower(email) WHERE email <> lower(email)",
+        "UPDATE reagent_order SET email = lower(email) WHERE email <> lower(email)",
+        "UPDATE dispatch_note SET engineer_email = lower(engineer_email) WHERE engineer_email <> lower(engineer_email)",
+    ]),
+    (3, "Indexes for per-engineer order and dispatch lookups", [
+        # Dispatch notes come from the Stock System, so match on lower(email)
+        "CREATE INDEX IF NOT EXISTS ix_dispatch_note_email_date ON dispatch_note (lower(engineer_email), date)",
+        "CREATE INDEX IF NOT EXISTS ix_dispatch_item_note_part ON dispatch_item (dispatch_note_id, part_number)",
+        "CREATE INDEX IF NOT EXISTS ix_parts_order_email_date ON parts_order (email, date)",
+        "CREATE INDEX IF NOT EXISTS ix_parts_order_item_order ON parts_order_item (order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_reagent_order_email_date ON reagent_order (email, date)",
+        "CREATE INDEX IF NOT EXISTS ix_reagent_order_item_order ON reagent_order_item (order_id)",
+        # stocktake_item is already covered by uq_stocktake_item_unique_part
+        "CREATE INDEX IF NOT EXISTS ix_stocktake_unfound_item_stocktake ON stocktake_unfound_item (stocktake_id)",
+    ]),
+    (4, "Stocktake lines / total_qty / revision counter columns", [_add_stocktake_counter_columns]),
+    (5, "hidden_part trigger bumping the hidden_parts cache version", [_create_hidden_part_version_trigger]),
+    (6, "Seed stocktake_run_total from submitted stocktakes", [_seed_stocktake_run_totals]),
+]
+# pg_advisory_xact_lock key: both gunicorn workers migrate on boot
+SCHEMA_MIGRATION_LOCK_KEY = 720431
+
+
+def applied_schema_migrations() -> Set[int]:
+    return {version for (version,) in db.session.query(SchemaMigration.version)}
+
+
+def apply_schema_migrations() -> List[int]:
+    """Apply pending SCHEMA_MIGRATIONS in order; returns the versions applied.
+
+    Each runs in its own transaction together with its schema_migration row,
+    so a failed step rolls back and stays pending for the next start.
+    """
+    applied = []
+    for version, description, steps in SCHEMA_MIGRATIONS:
+        if db.engine.dialect.name == "postgresql":
+            db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_MIGRATION_LOCK_KEY})
+        if version in applied_schema_migrations():
+            db.session.rollback()
+            continue
+        try:
+            for step in steps:
+                if callable(step):
+                    step()
+                else:
+                    db.session.execute(text(step))
+            db.session.add(SchemaMigration(version=version, description=description, applied_at=datetime.utcnow()))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        logger.info(f"Applied schema migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
 
 # ── CSV catalogue load ────────────────────────────────────────────────────────
 PARTS_CSV_PATH = "parts.csv"
+PARTS_CATALOGUE_VERSION_KEY = "parts_catalogue"
+# Rewritten after every catalogue edit so sibling workers notice with a stat()
+PARTS_VERSION_SIGNAL_PATH = "parts.version"
+# How often a worker re-reads the version row without a local signal
+PARTS_CATALOGUE_RECHECK_SECONDS = 5.0
+# Pickled, fully indexed catalogue reused across worker boots
+PARTS_SNAPSHOT_PATH = "parts.snapshot"
+# Bump whenever PartRecord / PartsCatalogue / index layouts change
+PARTS_SNAPSHOT_FORMAT = 3
 ALLOWED_COLOURS = ["Green", "Yellow", "Red", "Purple"]
 DEFAULT_STOCKTAKE_RUN_NAME = "April 2026 Stocktake"
+# Cache version bumped whenever the active run changes (see get_or_create_active_stocktake_run)
+STOCKTAKE_RUN_VERSION_KEY = "stocktake_run"
+# Upper bound on ops per /sync request and codes per /scan request
+STOCKTAKE_BATCH_MAX_CHANGES = 500
+# Largest single +/- step accepted from the client
+STOCKTAKE_MAX_DELTA = 1000
+# Rows fetched per round trip by export queries (server-side cursor on Postgres)
+EXPORT_YIELD_PER = 1000
+# Rows per chunk written by streamed CSV responses
+CSV_STREAM_CHUNK_ROWS = 500
 
 
 def normalize_colour(colour: str) -> str:
@@ -224,9 +509,557 @@ def part_to_csv_row(part: Dict[str, object]) -> Dict[str, str]:
     }
 
 
-def load_parts_catalogue() -> List[Dict[str, object]]:
-    loaded_parts: List[Dict[str, object]] = []
-    with open(PARTS_CSV_PATH, newline="", encoding="cp1252") as csvfile:
+def is_reagent_part(part: Dict[str, object]) -> bool:
+    return "reagent" in (str(part.get("category", "") or "")).lower()
+
+
+class PartRecord:
+    """One catalogue part.
+
+    Slotted rather than a dict to keep each worker's copy of a large
+    catalogue small; the repetitive category/make/manufacturer/colour values
+    are interned so every part shares one string. Supports part["x"] and
+    part.get("x") so code written against the old part dicts keeps working,
+    and templates can use plain attribute access.
+    """
+
+    __slots__ = (
+        "id", "part_number", "description", "category", "make",
+        "manufacturer", "image", "colour", "installs",
+    )
+
+    def __init__(self, part_number: str, description: str = "", category: str = "", make: str = "",
+                 manufacturer: str = "", image: str = "", colour: str = "", installs: bool = False, id=None):
+        self.id = id
+        self.part_number = part_number
+        self.description = description
+        self.category = sys.intern(category)
+        self.make = sys.intern(make)
+        self.manufacturer = sys.intern(manufacturer)
+        self.image = image
+        self.colour = sys.intern(colour)
+        self.installs = bool(installs)
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __reduce__(self):
+        # Positional rebuild pickles smaller and loads about twice as fast as slot state
+        return (PartRecord, (
+            self.part_number, self.description, self.category, self.make,
+            self.manufacturer, self.image, self.colour, self.installs, self.id,
+        ))
+
+    def __repr__(self):
+        return f"PartRecord({self.part_number!r})"
+
+
+class CatalogueJSONProvider(DefaultJSONProvider):
+    """Lets jsonify() serialise PartRecord objects like the old part dicts."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, PartRecord):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+
+app.json = CatalogueJSONProvider(app)
+
+
+SEARCH_NGRAM_SIZE = 3
+# Shorter tokens are looked up through the n-grams they start; a query made
+# up only of single characters would match nearly every part, so it matches
+# nothing.
+SEARCH_MIN_TOKEN_LENGTH = 2
+
+
+def posting_contains(posting, pos: int) -> bool:
+    i = bisect.bisect_left(posting, pos)
+    return i < len(posting) and posting[i] == pos
+
+
+class CatalogueSearchIndex:
+    """N-gram inverted index over part number, description, make and manufacturer.
+
+    Each query token of SEARCH_NGRAM_SIZE characters or more is narrowed to
+    candidates through the postings of its n-grams (a two-character token
+    through the union of the n-grams starting with it), then every candidate
+    is confirmed with a plain substring check so results match the old `in`
+    filtering. Multi-word queries are ANDed. Results come back ranked: exact
+    code, code prefix, code hit, description hit, then make/manufacturer hits,
+    ties kept in catalogue order.
+
+    Postings are sorted int arrays rather than sets (4 bytes per entry instead
+    of a set slot plus an int object), which is what keeps a 100k-part index
+    affordable per worker.
+    """
+
+    def __init__(self, parts: List[PartRecord]):
+        self.parts = parts
+        # "code\ndescription\nmake\nmanufacturer", lowercased, per position
+        self.haystacks: List[str] = []
+        self.postings: Dict[str, array] = {}
+        # Short prefix -> the indexed n-grams starting with it
+        self.extensions: Dict[str, Set[str]] = {}
+        # n-grams whose posting array is still shared with the index this one
+        # was copied from; copied before the first write
+        self.shared: Set[str] = set()
+
+        for pos, part in enumerate(parts):
+            self.add(pos, part)
+
+    def copy(self, parts: List[PartRecord]) -> "CatalogueSearchIndex":
+        """An index over `parts` (a copy of this one's list) that can be patched
+        without touching this one. Posting arrays are shared until written."""
+        clone = CatalogueSearchIndex.__new__(CatalogueSearchIndex)
+        clone.parts = parts
+        clone.haystacks = list(self.haystacks)
+        clone.postings = dict(self.postings)
+        clone.extensions = {prefix: set(grams) for prefix, grams in self.extensions.items()}
+        clone.shared = set(self.postings)
+        return clone
+
+    def _own_posting(self, gram: str):
+        posting = self.postings[gram]
+        if gram in self.shared:
+            self.shared.discard(gram)
+            posting = self.postings[gram] = array("i", posting)
+        return posting
+
+    @staticmethod
+    def ngrams(text: str) -> Set[str]:
+        return {text[i:i + SEARCH_NGRAM_SIZE] for i in range(len(text) - SEARCH_NGRAM_SIZE + 1)}
+
+    @staticmethod
+    def indexed_text(haystack: str) -> str:
+        # The trailing newline gives the last characters an n-gram of their own
+        # to be found through by shorter tokens.
+        return haystack + "\n"
+
+    @staticmethod
+    def tokenize(query: str) -> List[str]:
+        return (query or "").lower().split()
+
+    def add(self, pos: int, part: PartRecord):
+        """Index the part at `pos` (a new slot at the end, or a slot just removed)."""
+        haystack = "\n".join((
+            str(part.get("part_number", "") or "").lower(),
+            str(part.get("description", "") or "").lower(),
+            str(part.get("make", "") or "").lower(),
+            str(part.get("manufacturer", "") or "").lower(),
+        ))
+        if pos == len(self.haystacks):
+            self.haystacks.append(haystack)
+        else:
+            self.haystacks[pos] = haystack
+        for gram in self.ngrams(self.indexed_text(haystack)):
+            posting = self.postings.get(gram)
+            if posting is None:
+                self.postings[gram] = array("i", (pos,))
+                self.extensions.setdefault(gram[:SEARCH_MIN_TOKEN_LENGTH], set()).add(gram)
+            elif posting[-1] < pos:
+                self._own_posting(gram).append(pos)
+            else:
+                self._own_posting(gram).insert(bisect.bisect_left(posting, pos), pos)
+
+    def remove(self, pos: int):
+        for gram in self.ngrams(self.indexed_text(self.haystacks[pos])):
+            posting = self.postings.get(gram)
+            if posting is None:
+                continue
+            i = bisect.bisect_left(posting, pos)
+            if i < len(posting) and posting[i] == pos:
+                posting = self._own_posting(gram)
+                del posting[i]
+            if not posting:
+                del self.postings[gram]
+                self.shared.discard(gram)
+                prefix = gram[:SEARCH_MIN_TOKEN_LENGTH]
+                self.extensions[prefix].discard(gram)
+                if not self.extensions[prefix]:
+                    del self.extensions[prefix]
+
+    def _short_posting(self, token: str):
+        """Sorted positions whose haystack contains a token shorter than an n-gram."""
+        grams = self.extensions.get(token, ())
+        if len(grams) == 1:
+            return self.postings[next(iter(grams))]
+        return sorted(set().union(*(self.postings[gram] for gram in grams)))
+
+    def _candidates(self, tokens: List[str]):
+        grams = set()
+        short_tokens = set()
+        for token in tokens:
+            if len(token) >= SEARCH_NGRAM_SIZE:
+                grams |= self.ngrams(token)
+            elif len(token) >= SEARCH_MIN_TOKEN_LENGTH:
+                short_tokens.add(token)
+        if not grams and not short_tokens:
+            # Only single characters: too broad to be worth ranking
+            return []
+
+        postings = []
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        for token in short_tokens:
+            posting = self._short_posting(token)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        candidates = list(postings[0])
+        for posting in postings[1:]:
+            candidates = [pos for pos in candidates if posting_contains(posting, pos)]
+            if not candidates:
+                break
+        return candidates
+
+    def _rank(self, pos: int, phrase: str, tokens: List[str]) -> int:
+        haystack = self.haystacks[pos]
+        code_end = haystack.find("\n")
+        code = haystack[:code_end]
+        if code == phrase:
+            return 0
+        if code.startswith(phrase):
+            return 1
+        if phrase in code or any(t in code for t in tokens):
+            return 2
+        description = haystack[code_end + 1:haystack.find("\n", code_end + 1)]
+        if all(t in description for t in tokens):
+            return 3
+        return 4
+
+    def matches(self, pos: int, query: str) -> bool:
+        """Whether the part at `pos` is one of the results for `query`."""
+        tokens = self.tokenize(query)
+        if not any(len(t) >= SEARCH_MIN_TOKEN_LENGTH for t in tokens):
+            return False
+        haystack = self.haystacks[pos]
+        return all(t in haystack for t in tokens)
+
+    def search(self, query: str, limit: Optional[int] = None, after: Optional[int] = None, where=None) -> List[PartRecord]:
+        """Parts matching `query`, best first.
+
+        `where` is an extra per-part filter (view, category) applied before
+        ranking. `after` is the position of the last result already shown;
+        only results ranked after it are returned, and none at all if it no
+        longer matches. With a `limit` only that many results are ranked out
+        of the matches (a heap instead of a full sort).
+        """
+        tokens = self.tokenize(query)
+        if not tokens:
+            return list(self.parts)
+
+        phrase = " ".join(tokens)
+        # Candidates already contain every token that is exactly one n-gram long
+        unconfirmed = [t for t in tokens if not SEARCH_MIN_TOKEN_LENGTH <= len(t) <= SEARCH_NGRAM_SIZE]
+
+        def key(pos):
+            return (self._rank(pos, phrase, tokens), pos)
+
+        matches = self._candidates(tokens)
+        if unconfirmed:
+            matches = (pos for pos in matches if all(t in self.haystacks[pos] for t in unconfirmed))
+        if where is not None:
+            matches = (pos for pos in matches if where(self.parts[pos]))
+        if after is not None:
+            if not (0 <= after < len(self.parts) and self.matches(after, query)
+                    and (where is None or where(self.parts[after]))):
+                return []
+            after_key = key(after)
+            matches = (pos for pos in matches if key(pos) > after_key)
+
+        if limit is None:
+            ranked = sorted(matches, key=key)
+        else:
+            ranked = heapq.nsmallest(limit, matches, key=key)
+        return [self.parts[pos] for pos in ranked]
+
+
+SUGGEST_PREFIX_SCAN = 200
+
+
+class PartCodeMatcher:
+    """Compact-code index with prefix and typo-tolerant ("did you mean") lookup.
+
+    Codes are keyed by compact_pn, so "2keabl001", "2KE-ABL-001" and
+    "2KE/ABL/001" all land on the same part (first part wins on a clash).
+    Near misses are found by generating every code one edit away from the
+    query (insert, delete, substitute or swap two neighbours) and
+    intersecting that with the index, so a lookup costs the same however
+    large the catalogue is and needs no extra index memory.
+    """
+
+    def __init__(self):
+        self.by_code: Dict[str, PartRecord] = {}
+        # Sorted compact codes, for prefix scans
+        self.codes: List[str] = []
+        # Characters seen in any code; substitutions/insertions draw from these
+        self.alphabet: Set[str] = set()
+
+    def copy(self) -> "PartCodeMatcher":
+        clone = PartCodeMatcher()
+        clone.by_code = dict(self.by_code)
+        clone.codes = list(self.codes)
+        clone.alphabet = set(self.alphabet)
+        return clone
+
+    def add(self, part: PartRecord):
+        code = compact_pn(part["part_number"])
+        if not code or code in self.by_code:
+            return
+        self.by_code[code] = part
+        bisect.insort(self.codes, code)
+        self.alphabet.update(code)
+
+    def remove(self, part: PartRecord):
+        code = compact_pn(part["part_number"])
+        if self.by_code.get(code) is part:
+            del self.by_code[code]
+            del self.codes[bisect.bisect_left(self.codes, code)]
+
+    def get(self, part_number: str):
+        return self.by_code.get(compact_pn(part_number))
+
+    def one_edit_away(self, code: str) -> Set[str]:
+        """Codes in the index within one edit (Damerau-Levenshtein) of `code`."""
+        alphabet = self.alphabet
+        splits = [(code[:i], code[i:]) for i in range(len(code) + 1)]
+        variants = {head + tail[1:] for head, tail in splits if tail}
+        variants.update(head + tail[1] + tail[0] + tail[2:] for head, tail in splits if len(tail) > 1)
+        variants.update(head + ch + tail[1:] for head, tail in splits if tail for ch in alphabet)
+        variants.update(head + ch + tail for head, tail in splits for ch in alphabet)
+        variants.discard(code)
+        return variants & self.by_code.keys()
+
+    def suggest(self, query: str, limit: int = 8, accept=None):
+        """Best matches for a typed code as (match, part) pairs.
+
+        match is "exact" (same compact code), "prefix" (the typed code is the
+        start of a part code) or "typo" (one edit away). `accept` can restrict
+        results, e.g. to the parts of one catalogue view.
+        """
+        code = compact_pn(query)
+        if not code:
+            return []
+
+        results = []
+        seen = set()
+
+        def offer(match: str, known: str):
+            part = self.by_code.get(known)
+            if part is None or known in seen or (accept is not None and not accept(part)):
+                return
+            seen.add(known)
+            results.append((match, part))
+
+        offer("exact", code)
+
+        i = bisect.bisect_left(self.codes, code)
+        end = min(len(self.codes), i + SUGGEST_PREFIX_SCAN)
+        while i < end and len(results) < limit and self.codes[i].startswith(code):
+            offer("prefix", self.codes[i])
+            i += 1
+
+        if len(results) < limit and len(code) >= 3:
+            for known in sorted(self.one_edit_away(code)):
+                if len(results) >= limit:
+                    break
+                offer("typo", known)
+
+        return results
+
+
+class PartsCatalogue:
+    """In-memory parts catalogue.
+
+    Keeps the parts in catalogue order (so listings look the same as before)
+    plus a primary index keyed by part number (raw, norm_pn and compact_pn
+    forms) and secondary indexes by category, reagent flag and installs flag.
+    Iterating the catalogue yields the PartRecords, so it can be used anywhere
+    a list was.
+    """
+
+    _generations = itertools.count(1)
+
+    def __init__(self, parts: List[PartRecord], source_stamp=None):
+        self.generation = next(self._generations)
+        # Where the catalogue came from: ("db", version) or ("csv", inode, size, mtime)
+        self.source_stamp = source_stamp
+        self.parts = parts
+        self.by_number: Dict[str, PartRecord] = {}
+        self.by_norm_number: Dict[str, PartRecord] = {}
+        self.positions: Dict[str, int] = {}
+        self.position_of: Dict[int, int] = {id(part): pos for pos, part in enumerate(parts)}
+        # Part table id -> position, for patching rows in place
+        self.position_by_id: Dict[int, int] = {}
+        self.by_category: Dict[str, List[PartRecord]] = {}
+        self.reagents: List[PartRecord] = []
+        self.non_reagents: List[PartRecord] = []
+        self.installs: List[PartRecord] = []
+        self.code_matcher = PartCodeMatcher()
+
+        for pos, part in enumerate(parts):
+            self._index(pos, part, in_order=True)
+
+        self.categories = sorted(self.by_category)
+        self.search_index = CatalogueSearchIndex(parts)
+
+    @property
+    def version(self):
+        """Part table version this catalogue reflects (None when loaded from CSV)."""
+        if self.source_stamp and self.source_stamp[0] == "db":
+            return self.source_stamp[1]
+        return None
+
+    def _secondary_lists(self, part: PartRecord):
+        lists = [self.reagents if is_reagent_part(part) else self.non_reagents]
+        category = part.get("category") or ""
+        if category:
+            lists.append(self.by_category.setdefault(category, []))
+        if part.get("installs"):
+            lists.append(self.installs)
+        return lists
+
+    def _index(self, pos: int, part: PartRecord, in_order: bool = False):
+        part_number = part["part_number"]
+        # First row wins, same as the old next(...) scans
+        if part_number not in self.by_number:
+            self.by_number[part_number] = part
+            self.positions[part_number] = pos
+        self.by_norm_number.setdefault(norm_pn(part_number), part)
+        self.code_matcher.add(part)
+        if part.get("id") is not None:
+            self.position_by_id[part["id"]] = pos
+        for parts in self._secondary_lists(part):
+            if in_order:
+                parts.append(part)
+            else:
+                bisect.insort(parts, part, key=self.position)
+
+    def _unindex(self, pos: int, part: PartRecord):
+        part_number = part["part_number"]
+        if self.by_number.get(part_number) is part:
+            del self.by_number[part_number]
+            del self.positions[part_number]
+        if self.by_norm_number.get(norm_pn(part_number)) is part:
+            del self.by_norm_number[norm_pn(part_number)]
+        self.code_matcher.remove(part)
+        for parts in self._secondary_lists(part):
+            del parts[bisect.bisect_left(parts, pos, key=self.position)]
+        category = part.get("category") or ""
+        if category and not self.by_category.get(category):
+            self.by_category.pop(category, None)
+
+    def _copy(self) -> "PartsCatalogue":
+        """A catalogue sharing this one's PartRecords but none of its containers."""
+        clone = PartsCatalogue.__new__(PartsCatalogue)
+        clone.__dict__.update(self.__dict__)
+        clone.parts = list(self.parts)
+        for name in ("by_number", "by_norm_number", "positions", "position_of", "position_by_id"):
+            setattr(clone, name, dict(getattr(self, name)))
+        clone.by_category = {category: list(parts) for category, parts in self.by_category.items()}
+        clone.reagents = list(self.reagents)
+        clone.non_reagents = list(self.non_reagents)
+        clone.installs = list(self.installs)
+        clone.code_matcher = self.code_matcher.copy()
+        clone.search_index = self.search_index.copy(clone.parts)
+        return clone
+
+    def apply_changes(self, changed: List[PartRecord], version: int) -> "PartsCatalogue":
+        """Return a copy of the catalogue with changed/new Part rows patched in.
+
+        The indexes are copied rather than rebuilt, and only the entries of the
+        affected parts are touched. This catalogue is left as it was, so a
+        request still reading it in another thread never sees a half-applied
+        change; the caller swaps parts_db over to the result. Views keyed on
+        the generation are rebuilt lazily afterwards.
+        """
+        updated = self._copy()
+        for part in changed:
+            pos = updated.position_by_id.get(part["id"])
+            if pos is None:
+                pos = len(updated.parts)
+                updated.parts.append(part)
+            else:
+                old = updated.parts[pos]
+                updated._unindex(pos, old)
+                updated.search_index.remove(pos)
+                del updated.position_of[id(old)]
+                updated.parts[pos] = part
+            updated.position_of[id(part)] = pos
+            updated._index(pos, part)
+            updated.search_index.add(pos, part)
+
+        updated.categories = sorted(updated.by_category)
+        updated.source_stamp = ("db", version)
+        updated.generation = next(self._generations)
+        return updated
+
+    def __getstate__(self):
+        # position_of is keyed on id(), which means nothing in another process
+        state = self.__dict__.copy()
+        del state["position_of"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.position_of = {id(part): pos for pos, part in enumerate(self.parts)}
+        self.generation = next(self._generations)
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    def __len__(self):
+        return len(self.parts)
+
+    def get(self, part_number: str):
+        """Exact part number first, then the trimmed/uppercased form, then the
+        compact form (punctuation ignored)."""
+        part = self.by_number.get(part_number)
+        if part is None:
+            part = self.by_norm_number.get(norm_pn(part_number))
+        if part is None:
+            part = self.code_matcher.get(part_number)
+        return part
+
+    def suggest(self, query: str, limit: int = 8, accept=None):
+        return self.code_matcher.suggest(query, limit=limit, accept=accept)
+
+    def search(self, query: str, limit: Optional[int] = None, after: Optional[int] = None, where=None) -> List[PartRecord]:
+        return self.search_index.search(query, limit=limit, after=after, where=where)
+
+    def position(self, part) -> int:
+        return self.position_of[id(part)]
+
+    def admin_sort_key(self, part):
+        return ((part.get("part_number") or "").lower(), self.position(part))
+
+
+def parts_csv_stamp(stat_result) -> tuple:
+    return ("csv", stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+
+
+def read_parts_csv(path: str = PARTS_CSV_PATH):
+    """Parse parts.csv into PartRecords; returns (parts, file stamp)."""
+    loaded_parts: List[PartRecord] = []
+    with open(path, newline="", encoding="cp1252") as csvfile:
+        # Stamp the exact file we read; save_parts_catalogue swaps in a new inode
+        source_stamp = parts_csv_stamp(os.fstat(csvfile.fileno()))
         reader = csv.DictReader(csvfile)
         for row in reader:
             part_number = (row.get("Product Code") or "").strip().replace("\u00a0", "").replace("\r", "").replace("\n", "")
@@ -235,29 +1068,209 @@ def load_parts_catalogue() -> List[Dict[str, object]]:
 
             clean_filename = (row.get("image") or "").strip() or (part_number.replace("/", "") + ".png")
 
-            loaded_parts.append({
-                "part_number": part_number,
-                "description": (row.get("Description") or "").strip(),
-                "category": (row.get("Category") or "").strip(),
-                "make": (row.get("Make") or "").strip(),
-                "manufacturer": (row.get("Manufacturer") or "").strip(),
-                "image": clean_filename,
-                "colour": normalize_colour(row.get("Colour", "")),
-                "installs": normalize_installs(row.get("Installs", "")),
-            })
-    return loaded_parts
+            loaded_parts.append(PartRecord(
+                part_number=part_number,
+                description=(row.get("Description") or "").strip(),
+                category=(row.get("Category") or "").strip(),
+                make=(row.get("Make") or "").strip(),
+                manufacturer=(row.get("Manufacturer") or "").strip(),
+                image=clean_filename,
+                colour=normalize_colour(row.get("Colour", "")),
+                installs=normalize_installs(row.get("Installs", "")),
+            ))
+    return loaded_parts, source_stamp
 
 
-def save_parts_catalogue(parts: List[Dict[str, object]]):
+PART_COLUMNS = (
+    Part.id, Part.part_number, Part.description, Part.category, Part.make,
+    Part.manufacturer, Part.image, Part.colour, Part.installs,
+)
+
+
+def part_row_to_record(row) -> PartRecord:
+    return PartRecord(
+        id=row.id,
+        part_number=row.part_number,
+        description=row.description or "",
+        category=row.category or "",
+        make=row.make or "",
+        manufacturer=row.manufacturer or "",
+        image=row.image or (row.part_number.replace("/", "") + ".png"),
+        colour=row.colour or "",
+        installs=row.installs,
+    )
+
+
+def parts_csv_snapshot_key(path: str = PARTS_CSV_PATH):
+    """("csv", size, mtime, sha256) of parts.csv plus its catalogue stamp."""
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return ("csv", st.st_size, st.st_mtime_ns, digest), parts_csv_stamp(st)
+
+
+def parts_db_snapshot_key(version: int):
+    """("db", database fingerprint, part table version) for the snapshot header.
+
+    Versions only count edits within one database, so the fingerprint (a
+    hash of the database URI, password left out) stops a snapshot built
+    against another database at the same version from being loaded.
+    """
+    url = db.engine.url.render_as_string(hide_password=True)
+    return ("db", hashlib.sha256(url.encode()).hexdigest()[:16], version)
+
+
+def read_parts_snapshot(key):
+    """The pickled catalogue for `key`, or None if the snapshot is missing or stale."""
+    gc_was_enabled = gc.isenabled()
+    try:
+        with open(PARTS_SNAPSHOT_PATH, "rb") as f:
+            # Header first, so a stale snapshot costs one small read
+            if pickle.load(f) != (PARTS_SNAPSHOT_FORMAT, key):
+                return None
+            # Unpickling allocates millions of objects; the cyclic GC would
+            # otherwise rescan them over and over for nothing
+            gc.disable()
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as ex:
+        logger.warning(f"Parts snapshot unreadable, rebuilding: {ex}")
+        return None
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def write_parts_snapshot(catalogue: PartsCatalogue, key):
+    tmp_path = f"{PARTS_SNAPSHOT_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump((PARTS_SNAPSHOT_FORMAT, key), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(catalogue, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, PARTS_SNAPSHOT_PATH)
+    except Exception as ex:
+        logger.warning(f"Parts snapshot not written: {ex}")
+
+
+def load_parts_catalogue() -> PartsCatalogue:
+    """Load the catalogue from the part table, falling back to parts.csv.
+
+    A snapshot of the built catalogue is reused when it matches the current
+    part table version (or parts.csv contents), so a worker only queries and
+    indexes every part when the catalogue changed since the last boot.
+    """
+    try:
+        # Read the version before the rows: a concurrent edit then shows up
+        # as a newer version on the next check instead of being skipped.
+        version = get_cache_version(PARTS_CATALOGUE_VERSION_KEY)
+        key = parts_db_snapshot_key(version)
+        catalogue = read_parts_snapshot(key) if version else None
+        if catalogue is not None:
+            logger.info(f"Parts catalogue loaded from snapshot (version {version})")
+            return catalogue
+        rows = db.session.query(*PART_COLUMNS).order_by(Part.id.asc()).all()
+    except Exception as ex:
+        db.session.rollback()
+        logger.warning(f"Part table unavailable, loading {PARTS_CSV_PATH}: {ex}")
+        rows = []
+
+    if rows:
+        catalogue = PartsCatalogue([part_row_to_record(r) for r in rows], source_stamp=("db", version))
+    else:
+        key, source_stamp = parts_csv_snapshot_key()
+        catalogue = read_parts_snapshot(key)
+        if catalogue is not None:
+            catalogue.source_stamp = source_stamp
+            logger.info(f"Parts catalogue loaded from snapshot ({PARTS_CSV_PATH})")
+            return catalogue
+        parts, source_stamp = read_parts_csv()
+        catalogue = PartsCatalogue(parts, source_stamp=source_stamp)
+    write_parts_snapshot(catalogue, key)
+    return catalogue
+
+
+def save_parts_catalogue(parts: List[PartRecord], path: str = PARTS_CSV_PATH):
+    """Export parts to CSV (kept for tools that still read parts.csv)."""
     fieldnames = ["Product Code", "Description", "Category", "Make", "Manufacturer", "image", "Colour", "Installs"]
-    with open(PARTS_CSV_PATH, "w", newline="", encoding="cp1252") as csvfile:
+    # Write a temp file and rename it over the target so readers never see a
+    # half-written catalogue and always see a new file stamp.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="", encoding="cp1252") as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
         for part in parts:
             writer.writerow(part_to_csv_row(part))
+    os.replace(tmp_path, path)
+
+
+def import_parts_csv(path: str = PARTS_CSV_PATH) -> int:
+    """One-shot bulk import of parts.csv into the part table.
+
+    Codes already in the table are left alone, as are repeated codes within
+    the CSV (first row wins, as in the catalogue). Returns rows inserted.
+    """
+    parts, _ = read_parts_csv(path)
+    existing = {pn for (pn,) in db.session.query(Part.part_number).all()}
+
+    bump_cache_version(PARTS_CATALOGUE_VERSION_KEY)
+    version = get_cache_version(PARTS_CATALOGUE_VERSION_KEY)
+    rows = []
+    for part in parts:
+        if part["part_number"] in existing:
+            continue
+        existing.add(part["part_number"])
+        rows.append({
+            "part_number": part["part_number"],
+            "description": part["description"],
+            "category": part["category"],
+            "make": part["make"],
+            "manufacturer": part["manufacturer"],
+            "image": part["image"],
+            "colour": part["colour"],
+            "installs": bool(part["installs"]),
+            "is_reagent": is_reagent_part(part),
+            "version": version,
+        })
+    if rows:
+        db.session.execute(insert(Part), rows)
+    db.session.commit()
+    signal_parts_catalogue_change(version)
+    return len(rows)
 
 
-parts_db = load_parts_catalogue()
+def signal_parts_catalogue_change(version: int):
+    """Tell the other workers on this host that the part table moved on."""
+    tmp_path = f"{PARTS_VERSION_SIGNAL_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(str(version))
+        os.replace(tmp_path, PARTS_VERSION_SIGNAL_PATH)
+    except OSError as ex:
+        logger.warning(f"Parts version signal not written: {ex}")
+
+
+def parts_signal_stamp():
+    try:
+        st = os.stat(PARTS_VERSION_SIGNAL_PATH)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns)
+
+
+with app.app_context():
+    try:
+        if db.session.query(Part.id).first() is None:
+            imported = import_parts_csv()
+            logger.info(f"Imported {imported} parts from {PARTS_CSV_PATH} into the part table")
+    except Exception as ex:
+        db.session.rollback()
+        logger.warning(f"Parts CSV import skipped: {ex}")
+    parts_db = load_parts_catalogue()
+
+_parts_reload_lock = threading.Lock()
+# (signal file stamp, monotonic time of last version row check)
+_parts_version_check = (parts_signal_stamp(), time.monotonic())
 
 
 def refresh_parts_catalogue():
@@ -265,12 +1278,228 @@ def refresh_parts_catalogue():
     parts_db = load_parts_catalogue()
 
 
-def get_categories(parts):
-    return sorted({p["category"] for p in parts if p.get("category")})
+def sync_parts_catalogue():
+    """Bring this worker's catalogue up to the current part table version.
+
+    Only rows edited since our version are fetched and patched into a copy,
+    which then replaces parts_db in one assignment.
+    """
+    global parts_db
+    catalogue = parts_db
+    if catalogue.version is None:
+        refresh_parts_catalogue()
+        return
+    version = get_cache_version(PARTS_CATALOGUE_VERSION_KEY)
+    if version == catalogue.version:
+        return
+    rows = (
+        db.session.query(*PART_COLUMNS)
+        .filter(Part.version > catalogue.version)
+        .order_by(Part.id.asc())
+        .all()
+    )
+    parts_db = catalogue.apply_changes([part_row_to_record(r) for r in rows], version)
+    logger.info(f"Parts catalogue synced to version {version} ({len(rows)} changed)")
+
+
+def ensure_parts_catalogue_current():
+    """Make sure this worker serves the current catalogue.
+
+    For a part-table catalogue: one stat() of the local signal file per
+    request, and a read of the version row only when the signal changed or
+    every PARTS_CATALOGUE_RECHECK_SECONDS (edits made from another host).
+    For a CSV catalogue: one stat() of parts.csv. If another thread is
+    already reloading we carry on with the current catalogue rather than wait.
+    """
+    global _parts_version_check
+    catalogue = parts_db
+    if catalogue.version is None:
+        try:
+            if parts_csv_stamp(os.stat(PARTS_CSV_PATH)) == catalogue.source_stamp:
+                return
+        except OSError as ex:
+            logger.warning(f"Parts catalogue stat failed: {ex}")
+            return
+    else:
+        signal = parts_signal_stamp()
+        last_signal, checked_at = _parts_version_check
+        now = time.monotonic()
+        if signal == last_signal and now - checked_at < PARTS_CATALOGUE_RECHECK_SECONDS:
+            return
+        _parts_version_check = (signal, now)
+
+    if not _parts_reload_lock.acquire(blocking=False):
+        return
+    try:
+        if catalogue.version is None:
+            refresh_parts_catalogue()
+            logger.info(f"Parts catalogue reloaded ({len(parts_db)} parts)")
+        else:
+            sync_parts_catalogue()
+    finally:
+        _parts_reload_lock.release()
+
+
+def save_part(part: Part):
+    """Commit a single added/edited Part row and patch it into the catalogue."""
+    part.is_reagent = is_reagent_part({"category": part.category})
+    bump_cache_version(PARTS_CATALOGUE_VERSION_KEY)
+    part.version = get_cache_version(PARTS_CATALOGUE_VERSION_KEY)
+    db.session.add(part)
+    db.session.commit()
+
+    with _parts_reload_lock:
+        sync_parts_catalogue()
+    signal_parts_catalogue_change(part.version)
+
+
+class CatalogueView:
+    """The parts one portal can see, with its own category index.
+
+    Views are materialised once per catalogue generation and hidden-set
+    version, so a request only pays for the user's own category/search filter.
+    """
+
+    def __init__(self, catalogue: PartsCatalogue, parts: List[PartRecord]):
+        self.catalogue = catalogue
+        self.parts = parts
+        self.ids = {id(p) for p in parts}
+        self.by_category: Dict[str, List[PartRecord]] = {}
+        for part in parts:
+            category = part.get("category") or ""
+            if category:
+                self.by_category.setdefault(category, []).append(part)
+        self.categories = sorted(self.by_category)
+
+    def filter(self, category=None, search: str = ""):
+        if search:
+            return self.search(search, category)
+        if category:
+            return self.by_category.get(category, [])
+        return self.parts
+
+    def search(self, search: str, category=None, limit: Optional[int] = None, after: Optional[int] = None):
+        """Ranked search results in this view; see CatalogueSearchIndex.search."""
+        def visible(part):
+            return id(part) in self.ids and (not category or part.get("category") == category)
+
+        return self.catalogue.search(search, limit=limit, after=after, where=visible)
+
+    def contains(self, part: PartRecord, category=None, search: str = "") -> bool:
+        """Whether `part` is in filter(category, search), without building it."""
+        if id(part) not in self.ids or (category and part.get("category") != category):
+            return False
+        return not search or self.catalogue.search_index.matches(self.catalogue.position(part), search)
+
+
+CATALOGUE_PAGE_SIZE = 40
+CATALOGUE_MAX_PAGE_SIZE = 200
+PARTS_ADMIN_PAGE_SIZE = 100
+# Live search results per stocktake keystroke
+STOCKTAKE_SEARCH_LIMIT = 250
+# Older dispatch lines per My Orders page / load-more call
+DISPATCH_HISTORY_PAGE_SIZE = 50
+
+
+def parse_page_args(default_limit: int = CATALOGUE_PAGE_SIZE):
+    """Read ?cursor=&limit= from the request (cursor None = first page)."""
+    try:
+        cursor = int(request.args.get("cursor", ""))
+    except ValueError:
+        cursor = None
+    try:
+        limit = int(request.args.get("limit", default_limit))
+    except ValueError:
+        limit = default_limit
+    return cursor, max(1, min(limit, CATALOGUE_MAX_PAGE_SIZE))
+
+
+def paginate_parts(catalogue: PartsCatalogue, parts, cursor=None, limit: int = CATALOGUE_PAGE_SIZE, key=None):
+    """Return (page, next_cursor) for a list of parts.
+
+    A cursor is the catalogue position of the last part already shown, so it
+    stays valid when parts before it are hidden or filtered differently.
+    `key` is the sort key `parts` is ordered by (catalogue order when the
+    list came straight from a view). Ranked search results are paged by
+    paginate_view instead.
+
+    A cursor outside the catalogue ends the listing instead of restarting at
+    page 1, which infinite scroll would append as duplicates.
+    """
+    start = 0
+    if cursor is not None:
+        if not 0 <= cursor < len(catalogue.parts):
+            return [], None
+        key = key or catalogue.position
+        start = bisect.bisect_right(parts, key(catalogue.parts[cursor]), key=key)
+
+    page = parts[start:start + limit]
+    next_cursor = catalogue.position(page[-1]) if page and start + limit < len(parts) else None
+    return page, next_cursor
+
+
+def paginate_view(view: CatalogueView, category=None, search: str = "", cursor=None, limit: int = CATALOGUE_PAGE_SIZE):
+    """Return (page, next_cursor) for a view listing.
+
+    Search results are ranked, so their cursor is the last part shown and the
+    index only ranks the next limit + 1 results after it (the extra one says
+    whether there is another page). A cursor part that has since dropped out
+    of the results ends the listing.
+    """
+    if not search:
+        return paginate_parts(view.catalogue, view.filter(category), cursor, limit)
+    parts = view.search(search, category, limit=limit + 1, after=cursor)
+    page = parts[:limit]
+    next_cursor = view.catalogue.position(page[-1]) if len(parts) > limit else None
+    return page, next_cursor
+
+
+def part_to_json(part: PartRecord) -> Dict[str, object]:
+    image = part.get("image") or ""
+    return {
+        "part_number": part.get("part_number", ""),
+        "description": part.get("description", "") or "",
+        "category": part.get("category", "") or "",
+        "make": part.get("make", "") or "",
+        "manufacturer": part.get("manufacturer", "") or "",
+        "colour": part.get("colour", "") or "",
+        "installs": bool(part.get("installs")),
+        "image_url": url_for("static", filename="images/" + image) if image and image != "placeholder.png" else "",
+    }
+
+
+# ((catalogue generation, hidden version), {view name: CatalogueView})
+_catalogue_views = (None, {})
+
+
+def get_catalogue_view(name: str) -> CatalogueView:
+    """Visible parts for a portal: "service", "installs", "reagents" or "stocktake".
+
+    Service and stocktake share one view (non-reagents minus hidden parts);
+    installs narrows that to installs parts; reagents is reagents minus hidden.
+    """
+    global _catalogue_views
+    catalogue = parts_db
+    hidden_version, hidden = get_hidden_parts_state()
+    key = (catalogue.generation, hidden_version)
+    if _catalogue_views[0] != key:
+        service = CatalogueView(catalogue, [
+            p for p in catalogue.non_reagents if norm_pn(p["part_number"]) not in hidden
+        ])
+        views = {
+            "service": service,
+            "stocktake": service,
+            "installs": CatalogueView(catalogue, [p for p in service.parts if p.get("installs")]),
+            "reagents": CatalogueView(catalogue, [
+                p for p in catalogue.reagents if norm_pn(p["part_number"]) not in hidden
+            ]),
+        }
+        _catalogue_views = (key, views)
+    return _catalogue_views[1][name]
 
 
 def get_part_by_number(part_number: str):
-    return next((p for p in parts_db if p["part_number"] == part_number), None)
+    return parts_db.get(part_number)
 
 
 def get_part_colour(part_number: str) -> str:
@@ -278,6 +1507,37 @@ def get_part_colour(part_number: str) -> str:
     return (part or {}).get("colour", "") or ""
 
 
+# ── Catalogue-derived maps ───────────────────────────────────────────────────
+# part_number -> field lookups over the whole catalogue, built at most once
+# per catalogue generation (any reload or admin edit starts a new one) and
+# shared by every request in the worker.
+CATALOGUE_MAP_FIELDS = ("description", "colour", "category", "installs")
+
+# (catalogue generation, {field: {part_number: value}})
+_catalogue_maps = (None, {})
+# "<field>.hits" / "<field>.misses" since the worker started
+catalogue_map_stats = Counter()
+
+
+def catalogue_map(field: str) -> Dict[str, object]:
+    """Exact part number -> `field` (one of CATALOGUE_MAP_FIELDS) for the current catalogue."""
+    global _catalogue_maps
+    if field not in CATALOGUE_MAP_FIELDS:
+        raise ValueError(f"Unknown catalogue map field: {field}")
+    catalogue = parts_db
+    if _catalogue_maps[0] != catalogue.generation:
+        _catalogue_maps = (catalogue.generation, {})
+    maps = _catalogue_maps[1]
+    if field in maps:
+        catalogue_map_stats[f"{field}.hits"] += 1
+    else:
+        catalogue_map_stats[f"{field}.misses"] += 1
+        # From by_number, so duplicate part numbers resolve to the same
+        # (first) row as get_part_by_number
+        maps[field] = {pn: p.get(field) for pn, p in catalogue.by_number.items()}
+    return maps[field]
+
+
 def enrich_stocktake_items_with_colour(items):
     enriched = []
     for item in items:
@@ -291,30 +1551,83 @@ def enrich_stocktake_items_with_colour(items):
     return enriched
 
 
-def get_stocktake_rows_with_unfound(stocktake_id: int):
-    regular_items = (
-        StocktakeItem.query
-        .filter_by(stocktake_id=stocktake_id)
-        .order_by(StocktakeItem.part_number.asc())
-        .all()
+class StocktakeSheet:
+    """A stocktake's header and all of its lines, as read by load_stocktake_sheet()."""
+    __slots__ = (
+        "id", "run_id", "engineer_email", "status", "submitted_at", "checked_by", "checked_at",
+        "lines", "total_qty", "revision", "items", "unfound",
     )
-    rows = enrich_stocktake_items_with_colour(regular_items)
+    HEADER = __slots__[:10]
+
+    def __init__(self, header):
+        for name in self.HEADER:
+            setattr(self, name, getattr(header, name))
+        self.items = []     # rows with part_number / description / quantity
+        self.unfound = []   # rows with part_number (the code) / description / quantity
+
+    def item_qty_map(self) -> Dict[str, int]:
+        return {it.part_number: int(it.quantity or 0) for it in self.items}
+
+    def rows(self) -> List[Dict[str, object]]:
+        """Items then unfound lines as the review / leader templates list them."""
+        rows = enrich_stocktake_items_with_colour(self.items)
+        for uf in self.unfound:
+            rows.append({
+                "part_number": uf.part_number,
+                "description": uf.description,
+                "quantity": int(uf.quantity or 0),
+                "colour": "",
+                "is_unfound": True,
+            })
+        return rows
 
-    unfound_items = (
-        StocktakeUnfoundItem.query
-        .filter_by(stocktake_id=stocktake_id)
-        .order_by(StocktakeUnfoundItem.created_at.asc(), StocktakeUnfoundItem.id.asc())
-        .all()
-    )
-    for uf in unfound_items:
-        rows.append({
-            "part_number": uf.part_code,
-            "description": uf.description,
-            "quantity": int(uf.quantity or 0),
-            "colour": "",
-            "is_unfound": True,
-        })
-    return rows
+
+def load_stocktake_sheet(*criteria) -> Optional[StocktakeSheet]:
+    """One stocktake (picked by `criteria` on Stocktake) with its items and unfound
+    lines in a single query: the header LEFT JOINed to a UNION ALL of both line tables.
+    """
+    lines = union_all(
+        select(
+            StocktakeItem.stocktake_id,
+            literal(0).label("unfound"),
+            StocktakeItem.id.label("line_id"),
+            StocktakeItem.part_number.label("part_number"),
+            StocktakeItem.description.label("description"),
+            StocktakeItem.quantity.label("quantity"),
+            literal(None, db.DateTime).label("created_at"),
+        ),
+        select(
+            StocktakeUnfoundItem.stocktake_id,
+            literal(1).label("unfound"),
+            StocktakeUnfoundItem.id.label("line_id"),
+            StocktakeUnfoundItem.part_code.label("part_number"),
+            StocktakeUnfoundItem.description.label("description"),
+            StocktakeUnfoundItem.quantity.label("quantity"),
+            StocktakeUnfoundItem.created_at.label("created_at"),
+        ),
+    ).subquery()
+
+    rows = db.session.execute(
+        select(*(getattr(Stocktake, name) for name in StocktakeSheet.HEADER), lines)
+        .select_from(Stocktake)
+        .outerjoin(lines, lines.c.stocktake_id == Stocktake.id)
+        .where(*criteria)
+    ).all()
+    if not rows:
+        return None
+
+    sheet = StocktakeSheet(rows[0])
+    for row in rows:
+        if row.line_id is not None:
+            (sheet.unfound if row.unfound else sheet.items).append(row)
+    sheet.items.sort(key=lambda it: it.part_number)
+    sheet.unfound.sort(key=lambda uf: (uf.created_at, uf.line_id))
+    return sheet
+
+
+def get_stocktake_rows_with_unfound(stocktake_id: int):
+    sheet = load_stocktake_sheet(Stocktake.id == stocktake_id)
+    return sheet.rows() if sheet else []
 
 def stocktake_leader_password() -> str:
     # TODO: replace with env var later ------------------------------------------------------STOCKTAKE PASSOWRRD
@@ -361,13 +1674,32 @@ def get_last_dispatch_map(email: str):
     )
     return {row.pn: row.last_date for row in db.session.query(sub).all()}
 
-def get_older_dispatches(email: str, older_than_days: int = 7):
-    """Actual picked lines older than N days (from dispatch tables)."""
+def dispatch_cursor(row) -> str:
+    """Keyset cursor for an older-dispatch row: its (date, item id)."""
+    return f"{row.dispatch_date.isoformat()}_{row.item_id}"
+
+
+def parse_dispatch_cursor(value: Optional[str]):
+    """Inverse of dispatch_cursor(); None (first page) for anything malformed."""
+    try:
+        date_part, id_part = (value or "").rsplit("_", 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        return None
+
+
+def get_older_dispatches(email: str, older_than_days: int = 7, after=None, limit: int = DISPATCH_HISTORY_PAGE_SIZE):
+    """One page of actual picked lines older than N days (from dispatch tables).
+
+    Newest first, keyset-paginated on (date, item id): `after` is the parsed
+    cursor of the last row already shown. Returns (rows, next_cursor).
+    """
     if not email:
-        return []
+        return [], None
     cutoff = datetime.utcnow() - timedelta(days=older_than_days)
-    rows = (
+    query = (
         db.session.query(
+            DispatchItem.id.label("item_id"),
             DispatchNote.date.label("dispatch_date"),
             DispatchItem.part_number.label("part_number"),
             DispatchItem.description.label("description"),
@@ -378,15 +1710,95 @@ def get_older_dispatches(email: str, older_than_days: int = 7):
             func.lower(DispatchNote.engineer_email) == email.lower(),
             DispatchNote.date < cutoff
         )
-        .order_by(DispatchNote.date.desc(), DispatchItem.id.desc())
+    )
+    if after:
+        after_date, after_id = after
+        # The plain date bound keeps the scan on ix_dispatch_note_email_date
+        query = query.filter(
+            DispatchNote.date <= after_date,
+            tuple_(DispatchNote.date, DispatchItem.id) < tuple_(after_date, after_id),
+        )
+    rows = query.order_by(DispatchNote.date.desc(), DispatchItem.id.desc()).limit(limit + 1).all()
+    next_cursor = dispatch_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def load_my_orders(email: str, recent_days: int = 7, older_limit: int = DISPATCH_HISTORY_PAGE_SIZE) -> Dict[str, object]:
+    """Everything the My Orders page shows, in two queries.
+
+    Outstanding lines come with their orders joined in. The dispatch history
+    is read in one pass: window functions number each line within its
+    section (recent / older) and within its part, so the query returns all
+    recent lines, the first page of older lines plus one row to tell whether
+    there is more, and each part's latest dispatch.
+    """
+    outstanding_items = (
+        db.session.query(PartsOrderItem)
+        .join(PartsOrderItem.order)
+        .options(contains_eager(PartsOrderItem.order))
+        .filter(
+            PartsOrder.email == email,
+            (PartsOrderItem.quantity - func.coalesce(PartsOrderItem.quantity_sent, 0)) > 0
+        )
+        .order_by(PartsOrder.date.asc(), PartsOrderItem.id.asc())
         .all()
     )
-    return rows
+
+    is_recent = DispatchNote.date >= datetime.utcnow() - timedelta(days=recent_days)
+    newest_first = (DispatchNote.date.desc(), DispatchItem.id.desc())
+    lines = (
+        select(
+            DispatchItem.id.label("item_id"),
+            DispatchNote.date.label("dispatch_date"),
+            DispatchItem.part_number.label("part_number"),
+            DispatchItem.description.label("description"),
+            DispatchItem.quantity_sent.label("qty_sent"),
+            is_recent.label("recent"),
+            func.row_number().over(partition_by=is_recent, order_by=newest_first).label("section_rn"),
+            func.row_number().over(partition_by=DispatchItem.part_number, order_by=newest_first).label("part_rn"),
+        )
+        .join_from(DispatchNote, DispatchItem, DispatchItem.dispatch_note_id == DispatchNote.id)
+        .where(func.lower(DispatchNote.engineer_email) == email, DispatchNote.date.isnot(None))
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(lines)
+        .where(or_(lines.c.recent, lines.c.section_rn <= older_limit + 1, lines.c.part_rn == 1))
+        .order_by(lines.c.dispatch_date.desc(), lines.c.item_id.desc())
+    ).all()
+
+    recent = [r for r in rows if r.recent]
+    # Same order as before: newest first, parts A-Z within a dispatch time
+    recent.sort(key=lambda r: r.part_number or "")
+    recent.sort(key=lambda r: r.dispatch_date, reverse=True)
+    older = [r for r in rows if not r.recent and r.section_rn <= older_limit + 1]
+
+    return {
+        "outstanding_items": outstanding_items,
+        "recent_dispatches": recent,
+        "older_dispatches": older[:older_limit],
+        "older_next_cursor": dispatch_cursor(older[older_limit - 1]) if len(older) > older_limit else None,
+        "last_dispatch_for_part": {r.part_number: r.dispatch_date for r in rows if r.part_rn == 1},
+    }
+
 
 
 # ── Stocktake Helpers ─────────────────────────────────────────────────────────
 
-def get_or_create_active_stocktake_run() -> StocktakeRun:
+class ActiveStocktakeRun:
+    """The active run as a worker caches it: a plain snapshot, not tied to a session."""
+    __slots__ = ("id", "name")
+
+    def __init__(self, id: int, name: str):
+        self.id = id
+        self.name = name
+
+
+# (stocktake_run cache version, ActiveStocktakeRun) for this worker
+_active_run_cache = (None, None)
+
+
+def load_active_stocktake_run() -> StocktakeRun:
     run = StocktakeRun.query.filter_by(is_active=True).order_by(StocktakeRun.id.desc()).first()
     if run:
         return run
@@ -399,13 +1811,71 @@ def get_or_create_active_stocktake_run() -> StocktakeRun:
     )
     if existing_target:
         existing_target.is_active = True
+        bump_cache_version(STOCKTAKE_RUN_VERSION_KEY)
         db.session.commit()
         return existing_target
 
-    run = StocktakeRun(name=DEFAULT_STOCKTAKE_RUN_NAME, is_active=True)
-    db.session.add(run)
-    db.session.commit()
-    return run
+    run = StocktakeRun(name=DEFAULT_STOCKTAKE_RUN_NAME, is_active=True)
+    db.session.add(run)
+    bump_cache_version(STOCKTAKE_RUN_VERSION_KEY)
+    db.session.commit()
+    return run
+
+
+def get_or_create_active_stocktake_run(version: Optional[int] = None) -> ActiveStocktakeRun:
+    """The active run, cached per worker.
+
+    Costs one version read while the stocktake_run version is unchanged;
+    anything that renames, activates or creates a run bumps it.
+    """
+    global _active_run_cache
+    if version is None:
+        version = get_cache_version(STOCKTAKE_RUN_VERSION_KEY)
+    cached_version, run = _active_run_cache
+    if run is not None and cached_version == version:
+        return run
+
+    # Version read before the run, so a change racing this reload is seen next time
+    loaded = load_active_stocktake_run()
+    run = ActiveStocktakeRun(loaded.id, loaded.name)
+    _active_run_cache = (version, run)
+    return run
+
+
+def get_active_stocktake(engineer_email: str, lock: bool = False) -> Optional[Stocktake]:
+    """The engineer's stocktake in the active run, in one query when warm.
+
+    The stocktake_run version rides along on the row (uq_stocktake_run_engineer
+    index lookup), so a run change in another worker is noticed and the
+    lookup redone against the new run. lock=True locks the row as
+    lock_stocktake() does; mutation routes pass it.
+    """
+    email = (engineer_email or "").lower()
+
+    def locked(query):
+        return query.with_for_update(of=Stocktake, key_share=True).populate_existing() if lock else query
+
+    cached_version, run = _active_run_cache
+    if run is not None:
+        version = (
+            select(CacheVersion.version)
+            .where(CacheVersion.name == STOCKTAKE_RUN_VERSION_KEY)
+            .scalar_subquery()
+        )
+        row = locked(
+            db.session.query(Stocktake, version)
+            .filter(Stocktake.run_id == run.id, Stocktake.engineer_email == email)
+        ).first()
+        if row is not None and int(row[1] or 0) == cached_version:
+            return row[0]
+
+    run = get_or_create_active_stocktake_run()
+    return locked(Stocktake.query.filter_by(run_id=run.id, engineer_email=email)).first()
+
+
+def resolved_active_stocktake_run() -> ActiveStocktakeRun:
+    """The run the last get_active_stocktake() call resolved, without another read."""
+    return _active_run_cache[1]
 
 
 def migrate_active_stocktake_run_to_april_2026():
@@ -415,6 +1885,7 @@ def migrate_active_stocktake_run_to_april_2026():
     if april_run:
         StocktakeRun.query.update({"is_active": False})
         april_run.is_active = True
+        bump_cache_version(STOCKTAKE_RUN_VERSION_KEY)
         db.session.commit()
         return
 
@@ -423,16 +1894,309 @@ def migrate_active_stocktake_run_to_april_2026():
 
     new_run = StocktakeRun(name=DEFAULT_STOCKTAKE_RUN_NAME, is_active=True)
     db.session.add(new_run)
+    bump_cache_version(STOCKTAKE_RUN_VERSION_KEY)
     db.session.commit()
 
 
-def stocktake_counts(stocktake_id: int):
-    """Return (lines_count, total_qty) for a stocktake."""
-    items = StocktakeItem.query.filter_by(stocktake_id=stocktake_id).all()
-    unfound_items = StocktakeUnfoundItem.query.filter_by(stocktake_id=stocktake_id).all()
-    lines = len(items) + len(unfound_items)
-    total_qty = sum(int(getattr(i, "quantity", 0) or 0) for i in items) + sum(int(getattr(i, "quantity", 0) or 0) for i in unfound_items)
-    return lines, total_qty
+def dialect_insert(model):
+    """INSERT for the bound database's dialect, so ON CONFLICT clauses are available."""
+    if db.engine.dialect.name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+
+def stocktake_item_upsert(rows: List[Dict[str, object]], increment: bool = False):
+    """Multi-row INSERT of stocktake lines that sets the quantity of lines
+    already present (uq_stocktake_item_unique_part) instead of failing, or
+    with increment=True adds to it."""
+    stmt = dialect_insert(StocktakeItem).values(rows)
+    quantity = StocktakeItem.quantity + stmt.excluded.quantity if increment else stmt.excluded.quantity
+    return stmt.on_conflict_do_update(
+        index_elements=[StocktakeItem.stocktake_id, StocktakeItem.part_number],
+        set_={"quantity": quantity},
+    )
+
+
+def claim_sync_ops(stocktake_id: int, op_ids: List[str]) -> Set[str]:
+    """Record client op ids for a stocktake; returns the ones not seen before.
+
+    Concurrent claims of the same id serialise on uq_stocktake_sync_op, so an
+    op resent while the first attempt is still in flight is applied once.
+    """
+    if not op_ids:
+        return set()
+    stmt = dialect_insert(StocktakeSyncOp).values([
+        {"stocktake_id": stocktake_id, "op_id": op_id, "applied_at": datetime.utcnow()} for op_id in op_ids
+    ])
+    stmt = stmt.on_conflict_do_nothing(
+        index_elements=[StocktakeSyncOp.stocktake_id, StocktakeSyncOp.op_id]
+    ).returning(StocktakeSyncOp.op_id)
+    return set(db.session.execute(stmt).scalars())
+
+
+def adjust_stocktake_item_qty(stocktake_id: int, part: PartRecord, delta: int) -> int:
+    """Add `delta` to a stocktake line in one statement and return the new quantity.
+
+    Increments upsert (creating the line if needed) with quantity = quantity + n;
+    decrements update in place, floor at zero and drop the emptied line. Safe
+    against concurrent clicks from the engineer and the leader. Caller commits.
+    """
+    part_number = part["part_number"]
+    line = (StocktakeItem.stocktake_id == stocktake_id) & (StocktakeItem.part_number == part_number)
+
+    if delta > 0:
+        stmt = dialect_insert(StocktakeItem).values(
+            stocktake_id=stocktake_id,
+            part_number=part_number,
+            description=part.get("description", ""),
+            quantity=delta,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StocktakeItem.stocktake_id, StocktakeItem.part_number],
+            set_={"quantity": StocktakeItem.quantity + stmt.excluded.quantity},
+        ).returning(StocktakeItem.quantity)
+        return db.session.execute(stmt).scalar_one()
+
+    if delta == 0:
+        return db.session.query(StocktakeItem.quantity).filter(line).scalar() or 0
+
+    new_qty = StocktakeItem.quantity + delta
+    qty = db.session.execute(
+        update(StocktakeItem)
+        .where(line)
+        .values(quantity=case((new_qty > 0, new_qty), else_=0))
+        .returning(StocktakeItem.quantity)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if qty == 0:
+        StocktakeItem.query.filter(line, StocktakeItem.quantity <= 0).delete(synchronize_session=False)
+    return qty or 0
+
+
+def parse_qty_delta(raw) -> int:
+    """A +/- step from the client, clamped to +-STOCKTAKE_MAX_DELTA (0 if unparseable)."""
+    try:
+        delta = int(raw)
+    except (TypeError, ValueError):
+        return 0
+    return max(-STOCKTAKE_MAX_DELTA, min(STOCKTAKE_MAX_DELTA, delta))
+
+
+def merge_item_change(latest: Dict[str, tuple], part, kind: str, value: int):
+    """Fold one change into latest (part_number -> (kind, qty, part)).
+
+    kind "set" replaces the line quantity; "add" is a delta that stays atomic
+    on the server unless an earlier "set" for the same part already fixed it.
+    """
+    part_number = part["part_number"]
+    previous = latest.get(part_number, (None, 0, part))
+    if kind == "add":
+        if previous[0] == "set":
+            latest[part_number] = ("set", max(0, previous[1] + value), part)
+        else:
+            latest[part_number] = ("add", previous[1] + value, part)
+    else:
+        latest[part_number] = ("set", max(0, value), part)
+
+
+def apply_item_changes(stocktake_id: int, latest: Dict[str, tuple]) -> Dict[str, int]:
+    """Write merged changes in one go; returns part_number -> resulting quantity."""
+    upserts = [
+        {
+            "stocktake_id": stocktake_id,
+            "part_number": part_number,
+            "description": part.get("description", ""),
+            "quantity": qty,
+        }
+        for part_number, (kind, qty, part) in latest.items() if kind == "set" and qty > 0
+    ]
+    removals = [part_number for part_number, (kind, qty, _) in latest.items() if kind == "set" and qty <= 0]
+
+    if upserts:
+        db.session.execute(stocktake_item_upsert(upserts))
+    if removals:
+        StocktakeItem.query.filter(
+            StocktakeItem.stocktake_id == stocktake_id,
+            StocktakeItem.part_number.in_(removals),
+        ).delete(synchronize_session=False)
+
+    quantities = {part_number: qty for part_number, (kind, qty, _) in latest.items() if kind == "set"}
+    for part_number, (kind, delta, part) in latest.items():
+        if kind == "add":
+            quantities[part_number] = adjust_stocktake_item_qty(stocktake_id, part, delta)
+    return quantities
+
+
+def lock_stocktake(stocktake_id: int) -> Optional[Stocktake]:
+    """Load a stocktake with its row locked until commit.
+
+    Every mutation takes this before touching any of the stocktake's lines,
+    so concurrent edits of one stocktake queue here. FOR NO KEY UPDATE does
+    not conflict with the FOR KEY SHARE that each line insert's foreign-key
+    check takes on the row, so a late lock cannot deadlock against it either.
+    """
+    return (
+        Stocktake.query
+        .filter(Stocktake.id == stocktake_id)
+        .with_for_update(key_share=True)
+        .populate_existing()
+        .first()
+    )
+
+
+def recount_stocktake(stocktake_id: int):
+    """Recompute Stocktake.lines / total_qty from its lines and bump its revision;
+    returns (lines, total_qty).
+
+    Call after every item/unfound mutation, before the commit, so the counters
+    change in the same transaction. Callers should already hold the row lock
+    from lock_stocktake(); taking it again here is a no-op for them and keeps
+    the recount (a fresh statement) seeing every committed change.
+    """
+    db.session.query(Stocktake.id).filter(Stocktake.id == stocktake_id).with_for_update(key_share=True).first()
+
+    def line_count(model):
+        return select(func.count(model.id)).where(model.stocktake_id == stocktake_id).scalar_subquery()
+
+    def qty_sum(model):
+        return (
+            select(func.coalesce(func.sum(model.quantity), 0))
+            .where(model.stocktake_id == stocktake_id)
+            .scalar_subquery()
+        )
+
+    row = db.session.execute(
+        update(Stocktake)
+        .where(Stocktake.id == stocktake_id)
+        .values(
+            lines=line_count(StocktakeItem) + line_count(StocktakeUnfoundItem),
+            total_qty=qty_sum(StocktakeItem) + qty_sum(StocktakeUnfoundItem),
+            revision=Stocktake.revision + 1,
+        )
+        .returning(Stocktake.lines, Stocktake.total_qty)
+        .execution_options(synchronize_session=False)
+    ).first()
+    return (row.lines, row.total_qty) if row else (0, 0)
+
+
+# ── Run master totals ─────────────────────────────────────────────────────────
+# StocktakeRunTotal holds what build_master_totals_for_run() reports: the sum
+# of every *submitted* stocktake in the run. Rows are keyed (unfound,
+# part_number, description) and adjusted by delta whenever a stocktake enters
+# or leaves "submitted", or a leader edits a submitted one.
+
+def stocktake_total_rows(stocktake_id: int) -> List[tuple]:
+    """One stocktake's contribution as (unfound, part_number, description, qty) keys."""
+    items = (
+        db.session.query(StocktakeItem.part_number, func.sum(cast(StocktakeItem.quantity, Integer)))
+        .filter(StocktakeItem.stocktake_id == stocktake_id)
+        .group_by(StocktakeItem.part_number)
+        .all()
+    )
+    unfound_items = (
+        db.session.query(
+            StocktakeUnfoundItem.part_code,
+            StocktakeUnfoundItem.description,
+            func.sum(cast(StocktakeUnfoundItem.quantity, Integer)),
+        )
+        .filter(StocktakeUnfoundItem.stocktake_id == stocktake_id)
+        .group_by(StocktakeUnfoundItem.part_code, StocktakeUnfoundItem.description)
+        .all()
+    )
+    rows = [(False, pn, "", int(qty or 0)) for pn, qty in items]
+    rows.extend((True, code, description, int(qty or 0)) for code, description, qty in unfound_items)
+    return rows
+
+
+def add_run_totals(run_id: int, rows: List[tuple], sign: int = 1):
+    """Add (sign=1) or take away (sign=-1) rows from the run's master totals.
+
+    Atomic increments, so concurrent submits of different engineers can't
+    lose each other's quantities. Keys that fall to zero are dropped.
+    """
+    values = [
+        {"run_id": run_id, "unfound": unfound, "part_number": pn, "description": description, "total_qty": sign * qty}
+        for unfound, pn, description, qty in sorted(rows)
+        if qty
+    ]
+    if not values:
+        return
+    stmt = dialect_insert(StocktakeRunTotal).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            StocktakeRunTotal.run_id, StocktakeRunTotal.unfound,
+            StocktakeRunTotal.part_number, StocktakeRunTotal.description,
+        ],
+        set_={"total_qty": StocktakeRunTotal.total_qty + stmt.excluded.total_qty},
+    )
+    db.session.execute(stmt)
+    db.session.execute(
+        delete(StocktakeRunTotal)
+        .where(StocktakeRunTotal.run_id == run_id, StocktakeRunTotal.total_qty <= 0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def stocktake_status_changed(st: "Stocktake", old_status: str, new_status: str):
+    """Move a stocktake's lines in/out of the run totals on a status change."""
+    was_counted, is_counted = old_status == "submitted", new_status == "submitted"
+    if was_counted != is_counted:
+        add_run_totals(st.run_id, stocktake_total_rows(st.id), 1 if is_counted else -1)
+
+
+def submitted_item_changed(st: "Stocktake", part_number: str, delta: int):
+    """Carry a leader's edit of a submitted stocktake's line into the run totals."""
+    if delta and st.status == "submitted":
+        add_run_totals(st.run_id, [(False, part_number, "", delta)])
+
+
+def compute_run_totals(run_id: int) -> Dict[tuple, int]:
+    """Run totals recomputed from the stocktake lines (the verification source)."""
+    items = (
+        db.session.query(StocktakeItem.part_number, func.sum(cast(StocktakeItem.quantity, Integer)))
+        .join(Stocktake, StocktakeItem.stocktake_id == Stocktake.id)
+        .filter(Stocktake.run_id == run_id, Stocktake.status == "submitted")
+        .group_by(StocktakeItem.part_number)
+        .all()
+    )
+    unfound_items = (
+        db.session.query(
+            StocktakeUnfoundItem.part_code,
+            StocktakeUnfoundItem.description,
+            func.sum(cast(StocktakeUnfoundItem.quantity, Integer)),
+        )
+        .join(Stocktake, StocktakeUnfoundItem.stocktake_id == Stocktake.id)
+        .filter(Stocktake.run_id == run_id, Stocktake.status == "submitted")
+        .group_by(StocktakeUnfoundItem.part_code, StocktakeUnfoundItem.description)
+        .all()
+    )
+    totals = {(False, pn, ""): int(qty or 0) for pn, qty in items}
+    totals.update(((True, code, description), int(qty or 0)) for code, description, qty in unfound_items)
+    return {key: qty for key, qty in totals.items() if qty}
+
+
+def stored_run_totals(run_id: int) -> Dict[tuple, int]:
+    rows = (
+        db.session.query(
+            StocktakeRunTotal.unfound, StocktakeRunTotal.part_number,
+            StocktakeRunTotal.description, StocktakeRunTotal.total_qty,
+        )
+        .filter(StocktakeRunTotal.run_id == run_id)
+        .all()
+    )
+    return {(bool(unfound), pn, description): qty for unfound, pn, description, qty in rows}
+
+
+def rebuild_run_totals(run_id: int):
+    """Replace a run's stored totals with a fresh recompute (caller commits)."""
+    db.session.execute(
+        delete(StocktakeRunTotal)
+        .where(StocktakeRunTotal.run_id == run_id)
+        .execution_options(synchronize_session=False)
+    )
+    rows = [(unfound, pn, description, qty) for (unfound, pn, description), qty in compute_run_totals(run_id).items()]
+    add_run_totals(run_id, rows)
+
 
 def stocktake_leader_email() -> str:
     # Configure in environment on Render
@@ -462,6 +2226,15 @@ def normalize_order_email(user: str) -> str:
     return candidate
 
 
+# Applied here, once every helper a migration step calls is defined
+with app.app_context():
+    try:
+        apply_schema_migrations()
+    except Exception as ex:
+        db.session.rollback()
+        logger.warning(f"Schema migrations stopped: {ex}")
+
+
 with app.app_context():
     try:
         migrate_active_stocktake_run_to_april_2026()
@@ -470,6 +2243,13 @@ with app.app_context():
 
 
 # ── Routes ────────────────────────────────────────────────────────────────────
+@app.before_request
+def keep_parts_catalogue_current():
+    # Picks up parts admin edits made in another gunicorn worker
+    if request.endpoint != "static":
+        ensure_parts_catalogue_current()
+
+
 @app.route("/")
 def landing():
     return render_template("landing.html")
@@ -508,68 +2288,95 @@ def index():
         engineer_role = "service"
     session["parts_portal_role"] = engineer_role
 
-    # 1) Base list: non-reagents from parts_db
-    base = [p for p in parts_db if "reagent" not in (p.get("category", "").lower())]
-
-    if engineer_role == "installs":
-        base = [p for p in base if bool(p.get("installs"))]
-
-    # 2) Exclude hidden product codes
-    hidden = get_hidden_part_numbers()  # set[str], uppercased
-    parts = [p for p in base if norm_pn(p.get("part_number", "")) not in hidden]
+    # Non-reagents (installs parts only for installs), hidden codes excluded
+    view = get_catalogue_view(engineer_role)
 
-    # 3) Existing filters
     category = request.args.get("category")
     search = (request.args.get("search") or "").strip().lower()
 
-    if search:
-        filtered = [
-            p for p in parts
-            if (not category or p.get("category") == category) and (
-                search in (p.get("part_number", "").lower()) or
-                search in (p.get("description", "").lower()) or
-                search in (p.get("make", "").lower()) or
-                search in (p.get("manufacturer", "").lower())
-            )
-        ]
-    else:
-        filtered = [p for p in parts if not category or p.get("category") == category]
+    cursor, limit = parse_page_args()
+    page, next_cursor = paginate_view(view, category, search, cursor, limit)
 
     return render_template(
         "index.html",
-        parts=filtered,
-        categories=get_categories(parts),  # categories built from visible items
+        parts=page,
+        categories=view.categories,  # categories built from visible items
         selected_category=category,
         search=search,
         engineer_role=engineer_role,
+        next_cursor=next_cursor,
     )
 
 
 # Catalogue (Reagents)
 @app.route("/reagents")
 def reagents():
-    # 1) Base list: reagents only
-    base = [p for p in parts_db if "reagent" in (p.get("category", "").lower())]
+    # Reagents only, hidden codes excluded
+    view = get_catalogue_view("reagents")
+
+    search = (request.args.get("search") or "").strip().lower()
+    cursor, limit = parse_page_args()
+    page, next_cursor = paginate_view(view, search=search, cursor=cursor, limit=limit)
+
+    return render_template("reagents.html", parts=page, search=search, next_cursor=next_cursor)
+
 
-    # 2) Exclude hidden product codes
-    hidden = get_hidden_part_numbers()
-    parts = [p for p in base if norm_pn(p.get("part_number", "")) not in hidden]
+@app.route("/api/catalogue/parts")
+def catalogue_parts_api():
+    """One page of the catalogue as JSON, for incremental loading / infinite scroll.
 
-    # 3) Existing search
+    Query args: role (service | installs | reagents | stocktake), category, search,
+    cursor (next_cursor from the previous page) and limit.
+    """
+    role = (request.args.get("role") or "service").strip().lower()
+    if role not in {"service", "installs", "reagents", "stocktake"}:
+        role = "service"
+    view = get_catalogue_view(role)
+
+    category = (request.args.get("category") or "").strip() or None
     search = (request.args.get("search") or "").strip().lower()
-    if search:
-        filtered = [
-            p for p in parts if (
-                search in (p.get("part_number", "").lower()) or
-                search in (p.get("description", "").lower()) or
-                search in (p.get("make", "").lower()) or
-                search in (p.get("manufacturer", "").lower())
-            )
-        ]
-    else:
-        filtered = parts
+    cursor, limit = parse_page_args()
+    page, next_cursor = paginate_view(view, category, search, cursor, limit)
+
+    return jsonify({
+        "ok": True,
+        "parts": [part_to_json(p) for p in page],
+        "next_cursor": next_cursor,
+    })
+
+
+@app.route("/api/parts/suggest")
+def part_code_suggest_api():
+    """"Did you mean" lookup for a typed part code, cheap enough for every keystroke.
+
+    Query args: q (the typed code), role (service | installs | reagents |
+    stocktake, limits answers to that portal's visible parts) and limit.
+    """
+    role = (request.args.get("role") or "service").strip().lower()
+    if role not in {"service", "installs", "reagents", "stocktake"}:
+        role = "service"
+    view = get_catalogue_view(role)
+    try:
+        limit = min(max(int(request.args.get("limit") or 8), 1), 25)
+    except ValueError:
+        limit = 8
 
-    return render_template("reagents.html", parts=filtered, search=search)
+    matches = parts_db.suggest(
+        request.args.get("q") or "",
+        limit=limit,
+        accept=lambda p: id(p) in view.ids,
+    )
+    suggestions = []
+    for match, part in matches:
+        data = part_to_json(part)
+        data["match"] = match
+        suggestions.append(data)
+
+    return jsonify({
+        "ok": True,
+        "exact": bool(matches) and matches[0][0] == "exact",
+        "suggestions": suggestions,
+    })
 
 # Basket views
 @app.route("/parts_basket")
@@ -590,6 +2397,7 @@ def add_to_basket(part_number):
     part = get_part_by_number(part_number)
     if not part:
         return redirect(url_for("index"))
+    part_number = part["part_number"]
 
     role = session.get("parts_portal_role", "service")
     is_reagent = "reagent" in (part.get("category", "").lower())
@@ -843,84 +2651,81 @@ def stocktake_start():
     return redirect(url_for("stocktake_page", engineer_email=engineer_email))
 
 
+def own_line_parts(view: CatalogueView, item_qty_map: Dict[str, int], page, category=None, search: str = ""):
+    """Catalogue parts for a stocktake's own lines that are not on `page`.
+
+    The own lines always get a card, so "My Stocktake" is complete before the
+    catalogue pages they sit on have been loaded.
+    """
+    on_page = {p.part_number for p in page}
+    return sorted(
+        (
+            part for part in map(view.catalogue.by_number.get, item_qty_map)
+            if part is not None and part.part_number not in on_page
+            and view.contains(part, category, search)
+        ),
+        key=view.catalogue.position,
+    )
+
+
 @app.route("/stocktake/<engineer_email>", methods=["GET"])
 def stocktake_page(engineer_email):
     run = get_or_create_active_stocktake_run()
 
-    # Get or create engineer stocktake for this run
-    st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
-    if not st:
-        st = Stocktake(run_id=run.id, engineer_email=engineer_email.lower(), status="draft")
-        db.session.add(st)
+    # Engineer stocktake for this run with all its lines (created on first visit)
+    email = engineer_email.lower()
+    sheet = load_stocktake_sheet(Stocktake.run_id == run.id, Stocktake.engineer_email == email)
+    if not sheet:
+        db.session.add(Stocktake(run_id=run.id, engineer_email=email, status="draft"))
         try:
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
-            st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
+        sheet = load_stocktake_sheet(Stocktake.run_id == run.id, Stocktake.engineer_email == email)
 
-    submitted = st.status in {"submitted", "checked"}
-    submitted_at = st.submitted_at.strftime("%Y-%m-%d %H:%M UTC") if st.submitted_at else None
+    submitted = sheet.status in {"submitted", "checked"}
+    submitted_at = sheet.submitted_at.strftime("%Y-%m-%d %H:%M UTC") if sheet.submitted_at else None
 
     # Catalogue filtering mirrors /catalogue but excludes reagents (same as your parts catalogue base) :contentReference[oaicite:5]{index=5}
-    base = [p for p in parts_db if "reagent" not in (p.get("category", "").lower())]
-    hidden = get_hidden_part_numbers()
-    parts = [p for p in base if norm_pn(p.get("part_number", "")) not in hidden]
+    view = get_catalogue_view("stocktake")
 
     category = request.args.get("category")
     search = (request.args.get("search") or "").strip().lower()
 
-    if search:
-        filtered = [
-            p for p in parts
-            if (not category or p.get("category") == category) and (
-                search in (p.get("part_number", "").lower()) or
-                search in (p.get("description", "").lower()) or
-                search in (p.get("make", "").lower()) or
-                search in (p.get("manufacturer", "").lower())
-            )
-        ]
-    else:
-        filtered = [p for p in parts if not category or p.get("category") == category]
-
-    items = (
-        StocktakeItem.query
-        .filter_by(stocktake_id=st.id)
-        .order_by(StocktakeItem.part_number.asc())
-        .all()
-    )
-    stocktake_rows = get_stocktake_rows_with_unfound(st.id)
+    # First page of cards only; the rest load from /api/catalogue/parts
+    cursor, limit = parse_page_args()
+    page, next_cursor = paginate_view(view, category, search, cursor, limit)
 
     # remember last engineer on this device/browser
-    session["last_stocktake_email"] = engineer_email.lower()
+    session["last_stocktake_email"] = email
 
     # map of qtys for fast UI display in catalogue list
-    item_qty_map = {it.part_number: int(it.quantity or 0) for it in items}
+    item_qty_map = sheet.item_qty_map()
 
-    # counts for badge / remote count display
-    mine_lines, mine_total_qty = stocktake_counts(st.id)
+    mine_parts = own_line_parts(view, item_qty_map, page, category, search)
 
     return render_template(
         "stocktake_page.html",
-        engineer_email=engineer_email.lower(),
+        engineer_email=email,
         run_name=run.name,
         submitted=submitted,
         submitted_at=submitted_at,
-        parts=filtered,
-        categories=get_categories(parts),
+        parts=page,
+        mine_parts=mine_parts,
+        next_cursor=next_cursor,
+        categories=view.categories,
         selected_category=category,
         search=search,
-        items=items,
-        stocktake_rows=stocktake_rows,
         item_qty_map=item_qty_map,
-        mine_lines=mine_lines,
-        mine_total_qty=mine_total_qty,
+        mine_lines=sheet.lines,
+        mine_total_qty=sheet.total_qty,
+        sync_revision=sheet.revision,
     )
 
 
 @app.route("/stocktake/<engineer_email>/add-unfound", methods=["POST"])
 def stocktake_add_unfound(engineer_email):
-    run = get_or_create_active_stocktake_run()
-    st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
+    st = get_active_stocktake(engineer_email, lock=True)
     if not st:
         flash("Stocktake not found. Start again.", "warning")
         return redirect(url_for("stocktake_start"))
@@ -946,6 +2751,7 @@ def stocktake_add_unfound(engineer_email):
         description=description,
         quantity=quantity,
     ))
+    recount_stocktake(st.id)
     db.session.commit()
     flash("Part unfound line added.", "success")
     return redirect(url_for("stocktake_page", engineer_email=engineer_email, view="mine"))
@@ -953,41 +2759,76 @@ def stocktake_add_unfound(engineer_email):
 
 @app.route("/stocktake/<engineer_email>/add/<path:part_number>")
 def stocktake_add_item(engineer_email, part_number):
-    run = get_or_create_active_stocktake_run()
-    st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
+    wants_json = request.headers.get("X-Requested-With") == "XMLHttpRequest"
+    st = get_active_stocktake(engineer_email, lock=True)
     if not st:
+        if wants_json:
+            return jsonify({"ok": False, "error": "Stocktake not found."}), 404
         flash("Stocktake not found. Start again.", "warning")
         return redirect(url_for("stocktake_start"))
 
     if st.status in {"submitted", "checked"}:
+        if wants_json:
+            return jsonify({"ok": False, "error": "This stocktake is submitted and locked."}), 400
         flash("This stocktake is already submitted and locked.", "warning")
         return redirect(url_for("stocktake_page", engineer_email=engineer_email))
 
-    part = next((p for p in parts_db if p["part_number"] == part_number), None)
+    part = get_part_by_number(part_number)
     if not part:
+        if wants_json:
+            return jsonify({"ok": False, "error": "Part not found."}), 404
         flash("Part not found.", "warning")
         return redirect(url_for("stocktake_page", engineer_email=engineer_email))
 
-    item = StocktakeItem.query.filter_by(stocktake_id=st.id, part_number=part_number).first()
-    if item:
-        item.quantity += 1
-    else:
-        item = StocktakeItem(
-            stocktake_id=st.id,
-            part_number=part_number,
-            description=part.get("description", ""),
-            quantity=1
-        )
-        db.session.add(item)
-
+    qty = adjust_stocktake_item_qty(st.id, part, 1)
+    items_count, total_qty = recount_stocktake(st.id)
     db.session.commit()
+
+    if wants_json:
+        return jsonify({
+            "ok": True,
+            "part_number": part["part_number"],
+            "quantity": qty,
+            "items_count": items_count,
+            "total_qty": total_qty,
+        })
     return redirect(request.referrer or url_for("stocktake_page", engineer_email=engineer_email))
 
 
+@app.route("/stocktake/<engineer_email>/adjust/<path:part_number>", methods=["POST"])
+def stocktake_adjust_item_qty(engineer_email, part_number):
+    """Atomic +/- on one line; form field `delta` (e.g. 1 or -1)."""
+    st = get_active_stocktake(engineer_email, lock=True)
+
+    if not st:
+        return jsonify({"ok": False, "error": "Stocktake not found."}), 404
+
+    if st.status in {"submitted", "checked"}:
+        return jsonify({"ok": False, "error": "This stocktake is submitted and locked."}), 400
+
+    delta = parse_qty_delta(request.form.get("delta"))
+
+    part = get_part_by_number(part_number)
+    if not part:
+        return jsonify({"ok": False, "error": "Part not found."}), 404
+
+    qty = adjust_stocktake_item_qty(st.id, part, delta)
+    items_count, total_qty = recount_stocktake(st.id)
+    db.session.commit()
+
+    return jsonify({
+        "ok": True,
+        "part_number": part["part_number"],
+        "quantity": qty,
+        "removed": qty == 0,
+        "items_count": items_count,
+        "total_qty": total_qty,
+    })
+
+
 @app.route("/stocktake/<engineer_email>/update/<path:part_number>", methods=["POST"])
 def stocktake_update_item(engineer_email, part_number):
-    run = get_or_create_active_stocktake_run()
-    st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
+    st = get_active_stocktake(engineer_email, lock=True)
     if not st:
         if request.headers.get("X-Requested-With") == "XMLHttpRequest":
             return jsonify({"ok": False, "error": "Stocktake not found."}), 404
@@ -1019,16 +2860,17 @@ def stocktake_update_item(engineer_email, part_number):
     else:
         item.quantity = qty
 
+    items_count, total_qty = recount_stocktake(st.id)
     db.session.commit()
 
     if request.headers.get("X-Requested-With") == "XMLHttpRequest":
-        items_count = StocktakeItem.query.filter_by(stocktake_id=st.id).count()
         return jsonify({
             "ok": True,
             "removed": removed,
             "part_number": part_number,
-            "quantity": None if removed else item.quantity,
-            "items_count": items_count
+            "quantity": None if removed else qty,
+            "items_count": items_count,
+            "total_qty": total_qty,
         })
 
     return redirect(url_for("stocktake_page", engineer_email=engineer_email))
@@ -1036,8 +2878,7 @@ def stocktake_update_item(engineer_email, part_number):
 
 @app.route("/stocktake/<engineer_email>/remove/<path:part_number>")
 def stocktake_remove_item(engineer_email, part_number):
-    run = get_or_create_active_stocktake_run()
-    st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
+    st = get_active_stocktake(engineer_email, lock=True)
     if not st:
         flash("Stocktake not found.", "warning")
         return redirect(url_for("stocktake_start"))
@@ -1049,6 +2890,7 @@ def stocktake_remove_item(engineer_email, part_number):
     item = StocktakeItem.query.filter_by(stocktake_id=st.id, part_number=part_number).first()
     if item:
         db.session.delete(item)
+        recount_stocktake(st.id)
         db.session.commit()
 
     return redirect(url_for("stocktake_page", engineer_email=engineer_email))
@@ -1056,8 +2898,7 @@ def stocktake_remove_item(engineer_email, part_number):
 
 @app.route("/stocktake/<engineer_email>/set/<path:part_number>", methods=["POST"])
 def stocktake_set_item_qty(engineer_email, part_number):
-    run = get_or_create_active_stocktake_run()
-    st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
+    st = get_active_stocktake(engineer_email, lock=True)
 
     if not st:
         return jsonify({"ok": False, "error": "Stocktake not found."}), 404
@@ -1071,9 +2912,10 @@ def stocktake_set_item_qty(engineer_email, part_number):
         qty = 0
     qty = max(0, qty)
 
-    part = next((p for p in parts_db if p["part_number"] == part_number), None)
+    part = get_part_by_number(part_number)
     if not part:
         return jsonify({"ok": False, "error": "Part not found."}), 404
+    part_number = part["part_number"]
 
     item = StocktakeItem.query.filter_by(stocktake_id=st.id, part_number=part_number).first()
 
@@ -1094,15 +2936,223 @@ def stocktake_set_item_qty(engineer_email, part_number):
             )
             db.session.add(item)
 
+    items_count, total_qty = recount_stocktake(st.id)
+    db.session.commit()
+
+
+    return jsonify({
+        "ok": True,
+        "part_number": part_number,
+        "quantity": 0 if removed else qty,
+        "removed": removed,
+        "items_count": items_count,
+        "total_qty": total_qty,
+    })
+
+
+@app.route("/stocktake/<engineer_email>/sync", methods=["POST"])
+def stocktake_sync(engineer_email):
+    """Apply a batch of the page's offline change log and return server state.
+
+    Body: {"since": <revision the client last saw>, "ops": [
+        {"op_id": ..., "type": "set", "part_number": ..., "quantity": n},
+        {"op_id": ..., "type": "add", "part_number": ..., "delta": n},
+        {"op_id": ..., "type": "remove", "part_number": ...},
+        {"op_id": ..., "type": "add_unfound", "part_code": ..., "description": ..., "quantity": n},
+    ]}
+    Ops apply in order, in one transaction, at most once per op_id: a client
+    that lost a response just resends its log. Every line of the stocktake
+    comes back as "state" whenever its revision has moved past "since".
+    """
+    st = get_active_stocktake(engineer_email, lock=True)
+
+    if not st:
+        return jsonify({"ok": False, "error": "Stocktake not found."}), 404
+
+    if st.status in {"submitted", "checked"}:
+        return jsonify({"ok": False, "locked": True, "error": "This stocktake is submitted and locked."}), 400
+
+    payload = request.get_json(silent=True) or {}
+    ops = payload.get("ops") or []
+    if not isinstance(ops, list):
+        return jsonify({"ok": False, "error": "ops must be a list."}), 400
+    if len(ops) > STOCKTAKE_BATCH_MAX_CHANGES:
+        return jsonify({"ok": False, "error": f"Send at most {STOCKTAKE_BATCH_MAX_CHANGES} ops at once."}), 400
+    try:
+        since = int(payload.get("since"))
+    except (TypeError, ValueError):
+        since = -1
+
+    ops = [op for op in ops if isinstance(op, dict) and str(op.get("op_id") or "")]
+    fresh = claim_sync_ops(st.id, list(dict.fromkeys(str(op["op_id"])[:64] for op in ops)))
+
+    latest = {}
+    unfound_lines = []
+    applied, duplicate, rejected = [], [], []
+    for op in ops:
+        op_id = str(op["op_id"])[:64]
+        if op_id not in fresh:
+            duplicate.append(op_id)
+            continue
+        fresh.discard(op_id)
+
+        kind = op.get("type")
+        if kind == "add_unfound":
+            part_code = str(op.get("part_code") or "").strip()
+            description = str(op.get("description") or "").strip()
+            try:
+                quantity = int(op.get("quantity", 0))
+            except (TypeError, ValueError):
+                quantity = 0
+            if not part_code or not description or quantity <= 0:
+                rejected.append({"op_id": op_id, "error": "Unfound lines need a code, description and quantity."})
+                continue
+            unfound_lines.append(StocktakeUnfoundItem(
+                stocktake_id=st.id,
+                part_code=part_code[:64],
+                description=description[:256],
+                quantity=quantity,
+            ))
+        elif kind in {"set", "add", "remove"}:
+            part = get_part_by_number(str(op.get("part_number") or ""))
+            if not part:
+                rejected.append({"op_id": op_id, "error": "Part not found."})
+                continue
+            if kind == "add":
+                merge_item_change(latest, part, "add", parse_qty_delta(op.get("delta")))
+            elif kind == "remove":
+                merge_item_change(latest, part, "set", 0)
+            else:
+                try:
+                    qty = int(op.get("quantity", 0))
+                except (TypeError, ValueError):
+                    qty = 0
+                merge_item_change(latest, part, "set", qty)
+        else:
+            rejected.append({"op_id": op_id, "error": "Unknown op type."})
+            continue
+        applied.append(op_id)
+
+    if latest:
+        apply_item_changes(st.id, latest)
+    if unfound_lines:
+        db.session.add_all(unfound_lines)
+    if latest or unfound_lines:
+        recount_stocktake(st.id)
+    db.session.commit()
+
+    state = None
+    if st.revision != since:
+        items = (
+            db.session.query(StocktakeItem.part_number, StocktakeItem.quantity)
+            .filter(StocktakeItem.stocktake_id == st.id)
+            .order_by(StocktakeItem.part_number)
+            .all()
+        )
+        unfound_items = (
+            db.session.query(
+                StocktakeUnfoundItem.id, StocktakeUnfoundItem.part_code,
+                StocktakeUnfoundItem.description, StocktakeUnfoundItem.quantity,
+            )
+            .filter(StocktakeUnfoundItem.stocktake_id == st.id)
+            .order_by(StocktakeUnfoundItem.created_at, StocktakeUnfoundItem.id)
+            .all()
+        )
+        state = {
+            "items": [{"part_number": pn, "quantity": qty} for pn, qty in items],
+            "unfound": [
+                {"id": uf_id, "part_code": code, "description": description, "quantity": qty}
+                for uf_id, code, description, qty in unfound_items
+            ],
+        }
+
+    return jsonify({
+        "ok": True,
+        "revision": st.revision,
+        "applied": applied,
+        "duplicate": duplicate,
+        "rejected": rejected,
+        "items_count": st.lines,
+        "total_qty": st.total_qty,
+        "state": state,
+    })
+
+
+@app.route("/stocktake/<engineer_email>/scan", methods=["POST"])
+def stocktake_scan(engineer_email):
+    """Scan mode: count a batch of scanned codes, one physical item per code.
+
+    Body: {"codes": [...], "batch_id": ...}. Codes resolve through the
+    catalogue's exact / normalised / compact code lookups, repeats collapse
+    into one increment per part, and every part goes up in one multi-row
+    upsert. A batch_id is applied at most once, so the page can resend a
+    batch whose response it never saw. Unrecognised codes come back with
+    their counts for Part Unfound capture.
+    """
+    st = get_active_stocktake(engineer_email, lock=True)
+
+    if not st:
+        return jsonify({"ok": False, "error": "Stocktake not found."}), 404
+
+    if st.status in {"submitted", "checked"}:
+        return jsonify({"ok": False, "locked": True, "error": "This stocktake is submitted and locked."}), 400
+
+    payload = request.get_json(silent=True) or {}
+    codes = payload.get("codes")
+    if not isinstance(codes, list) or not codes:
+        return jsonify({"ok": False, "error": "No codes sent."}), 400
+    if len(codes) > STOCKTAKE_BATCH_MAX_CHANGES:
+        return jsonify({"ok": False, "error": f"Send at most {STOCKTAKE_BATCH_MAX_CHANGES} codes at once."}), 400
+
+    batch_id = str(payload.get("batch_id") or "")[:64]
+    if batch_id and not claim_sync_ops(st.id, [batch_id]):
+        return jsonify({
+            "ok": True,
+            "duplicate": True,
+            "results": [],
+            "unknown": [],
+            "items_count": st.lines,
+            "total_qty": st.total_qty,
+        })
+
+    scanned = Counter()
+    unknown = Counter()
+    parts = {}
+    for code, count in Counter(str(raw or "").strip() for raw in codes).items():
+        if not code:
+            continue
+        part = get_part_by_number(code)
+        if part:
+            parts[part["part_number"]] = part
+            scanned[part["part_number"]] += count
+        else:
+            unknown[code[:64]] += count
+
+    quantities = {}
+    if scanned:
+        rows = [
+            {
+                "stocktake_id": st.id,
+                "part_number": part_number,
+                "description": parts[part_number].get("description", ""),
+                "quantity": count,
+            }
+            for part_number, count in sorted(scanned.items())
+        ]
+        stmt = stocktake_item_upsert(rows, increment=True).returning(StocktakeItem.part_number, StocktakeItem.quantity)
+        quantities = dict(db.session.execute(stmt).all())
+        items_count, total_qty = recount_stocktake(st.id)
+    else:
+        items_count, total_qty = st.lines, st.total_qty
     db.session.commit()
 
-    items_count, total_qty = stocktake_counts(st.id)
-
     return jsonify({
         "ok": True,
-        "part_number": part_number,
-        "quantity": 0 if removed else qty,
-        "removed": removed,
+        "results": [
+            {"part_number": part_number, "scanned": count, "quantity": quantities.get(part_number, 0)}
+            for part_number, count in scanned.items()
+        ],
+        "unknown": [{"code": code, "count": count} for code, count in unknown.items()],
         "items_count": items_count,
         "total_qty": total_qty,
     })
@@ -1110,22 +3160,34 @@ def stocktake_set_item_qty(engineer_email, part_number):
 
 @app.route("/stocktake/<engineer_email>/counts")
 def stocktake_counts_api(engineer_email):
-    """Small polling endpoint so the engineer UI can show a live 'items in box' count."""
-    run = get_or_create_active_stocktake_run()
-    st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
-    if not st:
-        return jsonify({"ok": True, "items_count": 0, "total_qty": 0})
-    items_count, total_qty = stocktake_counts(st.id)
-    return jsonify({"ok": True, "items_count": items_count, "total_qty": total_qty})
+    """Small polling endpoint so the engineer UI can show a live 'items in box' count.
+
+    Conditional on If-None-Match: the ETag is built from the stocktake's
+    counters, so an unchanged poll is one indexed read and an empty 304.
+    Polling (rather than SSE/long-poll) keeps gunicorn's sync workers free.
+    """
+    row = (
+        db.session.query(Stocktake.id, Stocktake.lines, Stocktake.total_qty)
+        .join(StocktakeRun, StocktakeRun.id == Stocktake.run_id)
+        .filter(StocktakeRun.is_active.is_(True), Stocktake.engineer_email == engineer_email.lower())
+        .order_by(StocktakeRun.id.desc())
+        .first()
+    )
+    items_count, total_qty = (row.lines, row.total_qty) if row else (0, 0)
+
+    resp = jsonify({"ok": True, "items_count": items_count, "total_qty": total_qty})
+    resp.set_etag(f"st-{row.id if row else 0}-{items_count}-{total_qty}")
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
 
 
 @app.route("/stocktake/<engineer_email>/review", methods=["GET"])
 def stocktake_review(engineer_email):
-    run = get_or_create_active_stocktake_run()
-    st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
+    st = get_active_stocktake(engineer_email)
     if not st:
         flash("Stocktake not found.", "warning")
         return redirect(url_for("stocktake_start"))
+    run = resolved_active_stocktake_run()
 
     stocktake_rows = get_stocktake_rows_with_unfound(st.id)
     total_qty = sum([int(i.get("quantity") or 0) for i in stocktake_rows])
@@ -1146,11 +3208,11 @@ def stocktake_review(engineer_email):
 
 @app.route("/stocktake/<engineer_email>/submit", methods=["POST"])
 def stocktake_submit(engineer_email):
-    run = get_or_create_active_stocktake_run()
-    st = Stocktake.query.filter_by(run_id=run.id, engineer_email=engineer_email.lower()).first()
+    st = get_active_stocktake(engineer_email, lock=True)
     if not st:
         flash("Stocktake not found.", "warning")
         return redirect(url_for("stocktake_start"))
+    run = resolved_active_stocktake_run()
 
     if st.status in {"submitted", "checked"}:
         flash("Already submitted.", "success")
@@ -1168,11 +3230,13 @@ def stocktake_submit(engineer_email):
         return redirect(url_for("stocktake_review", engineer_email=engineer_email))
 
     # Lock it first (so refresh/double-click can’t double-submit)
+    old_status = st.status
     st.status = "submitted"
     st.submitted_at = datetime.utcnow()
     # If it was previously checked, clear check-off so it can be re-checked
     st.checked_by = None
     st.checked_at = None
+    stocktake_status_changed(st, old_status, st.status)
     db.session.commit()
 
     # Build email body
@@ -1240,33 +3304,22 @@ def stocktake_parts_search():
     category = (request.args.get("category") or "").strip()
 
     # Match your existing logic (exclude reagents, remove hidden parts)
-    base = [p for p in parts_db if "reagent" not in (p.get("category", "").lower())]
-    hidden = get_hidden_part_numbers()
-
-    results = []
-    for p in base:
-        pn = p.get("part_number", "") or ""
-        if not pn:
-            continue
-        if norm_pn(pn) in hidden:
-            continue
-        if category and (p.get("category") or "") != category:
-            continue
+    view = get_catalogue_view("stocktake")
 
-        if q:
-            hay = f"{pn} {p.get('description','')} {p.get('make','')} {p.get('manufacturer','')}".lower()
-            if q not in hay:
-                continue
+    # Safety limit so you don't return thousands every keystroke
+    if q:
+        parts = view.search(q, category, limit=STOCKTAKE_SEARCH_LIMIT)
+    else:
+        parts = view.filter(category)[:STOCKTAKE_SEARCH_LIMIT]
 
-        results.append({
-            "part_number": pn,
+    results = [
+        {
+            "part_number": p["part_number"],
             "description": p.get("description", "") or "",
             "colour": p.get("colour", "") or "",
-        })
-
-        # Safety limit so you don't return thousands every keystroke
-        if len(results) >= 250:
-            break
+        }
+        for p in parts
+    ]
 
     return jsonify({"ok": True, "parts": results})
 
@@ -1281,6 +3334,17 @@ def require_parts_admin():
     return redirect(url_for("parts_admin"))
 
 
+def fill_part_from_form(part: Part, part_number: str):
+    part.part_number = part_number
+    part.description = (request.form.get("description") or "").strip()
+    part.category = (request.form.get("category") or "").strip()
+    part.make = (request.form.get("make") or "").strip()
+    part.manufacturer = (request.form.get("manufacturer") or "").strip()
+    part.image = (request.form.get("image") or "").strip()
+    part.colour = normalize_colour(request.form.get("colour", ""))
+    part.installs = request.form.get("installs") == "on"
+
+
 @app.route("/parts-admin", methods=["GET", "POST"])
 def parts_admin():
     if request.method == "POST":
@@ -1304,8 +3368,6 @@ def parts_admin():
             flash("Signed out.", "success")
             return redirect(url_for("parts_admin"))
 
-        working = [dict(p) for p in parts_db]
-
         if action == "update":
             original_part_number = (request.form.get("original_part_number") or "").strip()
             updated_part_number = (request.form.get("part_number") or "").strip()
@@ -1314,27 +3376,22 @@ def parts_admin():
                 return redirect(url_for("parts_admin"))
 
             if original_part_number != updated_part_number:
-                duplicate = next((p for p in working if p["part_number"] == updated_part_number), None)
-                if duplicate:
+                if Part.query.filter_by(part_number=updated_part_number).first():
                     flash("Cannot change part code because the new code already exists.", "warning")
                     return redirect(url_for("parts_admin"))
 
-            target = next((p for p in working if p["part_number"] == original_part_number), None)
+            target = Part.query.filter_by(part_number=original_part_number).first()
             if not target:
                 flash("Part to update was not found.", "warning")
                 return redirect(url_for("parts_admin"))
 
-            target["part_number"] = updated_part_number
-            target["description"] = (request.form.get("description") or "").strip()
-            target["category"] = (request.form.get("category") or "").strip()
-            target["make"] = (request.form.get("make") or "").strip()
-            target["manufacturer"] = (request.form.get("manufacturer") or "").strip()
-            target["image"] = (request.form.get("image") or "").strip()
-            target["colour"] = normalize_colour(request.form.get("colour", ""))
-            target["installs"] = request.form.get("installs") == "on"
-
-            save_parts_catalogue(working)
-            refresh_parts_catalogue()
+            fill_part_from_form(target, updated_part_number)
+            try:
+                save_part(target)
+            except IntegrityError:
+                db.session.rollback()
+                flash("Cannot change part code because the new code already exists.", "warning")
+                return redirect(url_for("parts_admin"))
             flash(f"Updated {updated_part_number}.", "success")
             return redirect(url_for("parts_admin"))
 
@@ -1344,54 +3401,147 @@ def parts_admin():
                 flash("Part code is required for new part.", "warning")
                 return redirect(url_for("parts_admin"))
 
-            duplicate = next((p for p in working if p["part_number"] == new_part_number), None)
-            if duplicate:
+            if Part.query.filter_by(part_number=new_part_number).first():
                 flash("That part code already exists.", "warning")
                 return redirect(url_for("parts_admin"))
 
-            working.append({
-                "part_number": new_part_number,
-                "description": (request.form.get("description") or "").strip(),
-                "category": (request.form.get("category") or "").strip(),
-                "make": (request.form.get("make") or "").strip(),
-                "manufacturer": (request.form.get("manufacturer") or "").strip(),
-                "image": (request.form.get("image") or "").strip(),
-                "colour": normalize_colour(request.form.get("colour", "")),
-                "installs": request.form.get("installs") == "on",
-            })
-
-            save_parts_catalogue(working)
-            refresh_parts_catalogue()
+            part = Part()
+            fill_part_from_form(part, new_part_number)
+            try:
+                save_part(part)
+            except IntegrityError:
+                db.session.rollback()
+                flash("That part code already exists.", "warning")
+                return redirect(url_for("parts_admin"))
             flash(f"Added {new_part_number}.", "success")
             return redirect(url_for("parts_admin"))
 
     if not session.get("parts_admin_authed"):
         return render_template("parts_admin.html", authed=False)
 
+    catalogue = parts_db
     search = (request.args.get("search") or "").strip().lower()
     if search:
-        visible_parts = [
-            p for p in parts_db
-            if (
-                search in (p.get("part_number", "").lower())
-                or search in (p.get("description", "").lower())
-                or search in (p.get("category", "").lower())
-            )
-        ]
+        matches = {id(p): p for p in catalogue.search(search)}
+        for cat in catalogue.categories:
+            if search in cat.lower():
+                for p in catalogue.by_category[cat]:
+                    matches.setdefault(id(p), p)
+        visible_parts = list(matches.values())
     else:
-        visible_parts = list(parts_db)
+        visible_parts = list(catalogue)
 
-    visible_parts.sort(key=lambda x: (x.get("part_number") or "").lower())
+    visible_parts.sort(key=catalogue.admin_sort_key)
+    cursor, limit = parse_page_args(PARTS_ADMIN_PAGE_SIZE)
+    page, next_cursor = paginate_parts(catalogue, visible_parts, cursor, limit, key=catalogue.admin_sort_key)
 
     return render_template(
         "parts_admin.html",
         authed=True,
-        parts=visible_parts,
+        parts=page,
         search=search,
         colours=ALLOWED_COLOURS,
+        next_cursor=next_cursor,
+        total_parts=len(visible_parts),
     )
 
 
+@app.route("/parts-admin/export.csv")
+def parts_admin_export():
+    guard = require_parts_admin()
+    if guard:
+        return guard
+
+    rows = (list(part_to_csv_row(p).values()) for p in parts_db)
+    header = ["Product Code", "Description", "Category", "Make", "Manufacturer", "image", "Colour", "Installs"]
+    return csv_response("parts.csv", rows, header)
+
+
+@app.route("/parts-admin/catalogue-map-stats")
+def parts_admin_catalogue_map_stats():
+    """This worker's catalogue_map() hit/miss counters, as JSON."""
+    guard = require_parts_admin()
+    if guard:
+        return guard
+
+    generation, maps = _catalogue_maps
+    return jsonify({
+        "ok": True,
+        "pid": os.getpid(),
+        "catalogue_generation": parts_db.generation,
+        "maps_generation": generation,
+        "built": sorted(maps),
+        "stats": dict(catalogue_map_stats),
+    })
+
+
+@app.cli.command("import-parts-csv")
+def import_parts_csv_command():
+    """Bulk import parts.csv into the part table (existing codes are skipped)."""
+    imported = import_parts_csv()
+    print(f"Imported {imported} parts from {PARTS_CSV_PATH}")
+
+
+@app.cli.command("export-parts-csv")
+def export_parts_csv_command():
+    """Write the part table back out to parts.csv."""
+    refresh_parts_catalogue()
+    save_parts_catalogue(parts_db.parts)
+    print(f"Exported {len(parts_db)} parts to {PARTS_CSV_PATH}")
+
+
+@app.cli.command("migrate-schema")
+@click.option("--status", is_flag=True, help="List migrations and whether each is applied, without applying any.")
+def migrate_schema_command(status):
+    """Apply pending schema migrations (also run on every app start)."""
+    if status:
+        done = applied_schema_migrations()
+        for version, description, _ in SCHEMA_MIGRATIONS:
+            print(f"{version:>4} {'applied' if version in done else 'pending':<8} {description}")
+        return
+    applied = apply_schema_migrations()
+    print(f"Applied {len(applied)} migrations" + (f": {', '.join(map(str, applied))}" if applied else ""))
+
+
+@app.cli.command("recount-stocktakes")
+def recount_stocktakes_command():
+    """Recompute every stocktake's lines / total_qty counters and report drift."""
+    def counters():
+        rows = db.session.query(Stocktake.id, Stocktake.lines, Stocktake.total_qty)
+        return {sid: (lines, qty) for sid, lines, qty in rows}
+
+    before = counters()
+    db.session.execute(text(STOCKTAKE_RECOUNT_ALL_SQL))
+    db.session.commit()
+    after = counters()
+    drifted = sorted(sid for sid, counts in after.items() if before.get(sid) != counts)
+    for sid in drifted:
+        print(f"Stocktake {sid}: lines/qty {before.get(sid)} -> {after[sid]}")
+    print(f"Recounted {len(after)} stocktakes, {len(drifted)} had drifted")
+
+
+@app.cli.command("verify-run-totals")
+@click.option("--fix", is_flag=True, help="Rebuild the stored totals of runs that have drifted.")
+def verify_run_totals_command(fix):
+    """Recompute every run's master totals from scratch and report drift."""
+    drifted_runs = 0
+    for run in StocktakeRun.query.order_by(StocktakeRun.id).all():
+        expected, stored = compute_run_totals(run.id), stored_run_totals(run.id)
+        drift = sorted(key for key in expected.keys() | stored.keys() if expected.get(key) != stored.get(key))
+        if not drift:
+            continue
+        drifted_runs += 1
+        print(f"Run {run.id} ({run.name}): {len(drift)} totals drifted")
+        for unfound, pn, description in drift:
+            label = f"[UNFOUND] {pn} {description}" if unfound else pn
+            key = (unfound, pn, description)
+            print(f"  {label}: stored {stored.get(key, 0)}, expected {expected.get(key, 0)}")
+        if fix:
+            rebuild_run_totals(run.id)
+    db.session.commit()
+    print(f"{drifted_runs} runs drifted" + (" (rebuilt)" if fix and drifted_runs else ""))
+
+
 @app.route("/stocktake-leader", methods=["GET", "POST"])
 def stocktake_leader_login():
     if request.method == "GET":
@@ -1434,47 +3584,51 @@ def stocktake_leader_dashboard():
 
     run = get_or_create_active_stocktake_run()
 
-    # Get ALL stocktakes for this run (draft + submitted)
-    all_stocktakes = (
-        Stocktake.query
-        .filter_by(run_id=run.id)
+    # ALL stocktakes for this run (draft + submitted) in one query, totals from
+    # the counter columns. Pending first, then newest submitted first.
+    rows = (
+        db.session.query(
+            Stocktake.id,
+            Stocktake.engineer_email,
+            Stocktake.status,
+            Stocktake.submitted_at,
+            Stocktake.checked_by,
+            Stocktake.checked_at,
+            Stocktake.lines,
+            Stocktake.total_qty,
+        )
+        .filter(Stocktake.run_id == run.id)
+        .order_by(Stocktake.submitted_at.desc().nulls_first(), Stocktake.id)
         .all()
     )
 
-    submissions = []
-    for st in all_stocktakes:
-        items = StocktakeItem.query.filter_by(stocktake_id=st.id).all()
-        unfound_items = StocktakeUnfoundItem.query.filter_by(stocktake_id=st.id).all()
-
-        # IMPORTANT: use submitted_at (not submitted_at_str) so templates can detect it
-        submitted_at = (
-            st.submitted_at.strftime("%Y-%m-%d %H:%M UTC")
-            if st.submitted_at else None
-        )
-
-        submissions.append({
-            "id": st.id,
-            "engineer_email": st.engineer_email,
-            "submitted_at": submitted_at,     # <-- template-friendly
-            "lines": len(items) + len(unfound_items),
-            "total_qty": sum(int(i.quantity or 0) for i in items) + sum(int(i.quantity or 0) for i in unfound_items),
-            "status": st.status,
-            "checked_by": st.checked_by,
-            "checked_at": st.checked_at.strftime("%Y-%m-%d %H:%M UTC") if st.checked_at else None,
-        })
-
-    # Sort: submitted first, then pending, newest submitted first
-    def sort_key(x):
-        is_pending = (x.get("submitted_at") is None)
-        # pending goes after submitted, submitted sorted by time desc (string is fine here)
-        return (is_pending, "" if x.get("submitted_at") is None else x.get("submitted_at"))
+    submissions = [
+        {
+            "id": row.id,
+            "engineer_email": row.engineer_email,
+            # IMPORTANT: use submitted_at (not submitted_at_str) so templates can detect it
+            "submitted_at": row.submitted_at.strftime("%Y-%m-%d %H:%M UTC") if row.submitted_at else None,
+            "lines": row.lines,
+            "total_qty": row.total_qty,
+            "status": row.status,
+            "checked_by": row.checked_by,
+            "checked_at": row.checked_at.strftime("%Y-%m-%d %H:%M UTC") if row.checked_at else None,
+        }
+        for row in rows
+    ]
 
-    submissions.sort(key=sort_key, reverse=True)
+    run_parts, run_qty = (
+        db.session.query(func.count(StocktakeRunTotal.id), func.coalesce(func.sum(StocktakeRunTotal.total_qty), 0))
+        .filter(StocktakeRunTotal.run_id == run.id)
+        .one()
+    )
 
     return render_template(
         "stocktake_leader_dashboard.html",
         run_name=run.name,
-        submissions=submissions
+        submissions=submissions,
+        run_parts=run_parts,
+        run_qty=run_qty,
     )
 
 
@@ -1491,7 +3645,8 @@ def stocktake_leader_update_run_name():
         flash("Run name cannot be empty.", "warning")
         return redirect(url_for("stocktake_leader_dashboard"))
     
-    run.name = new_name
+    StocktakeRun.query.filter_by(id=run.id).update({"name": new_name})
+    bump_cache_version(STOCKTAKE_RUN_VERSION_KEY)
     db.session.commit()
     flash(f"Stock take name updated to '{new_name}'.", "success")
     return redirect(url_for("stocktake_leader_dashboard"))
@@ -1529,7 +3684,9 @@ def stocktake_leader_edit_engineer(stocktake_id):
         return guard
 
     run = get_or_create_active_stocktake_run()
-    st = Stocktake.query.get_or_404(stocktake_id)
+    st = load_stocktake_sheet(Stocktake.id == stocktake_id)
+    if not st:
+        abort(404)
 
     # Optional: keep edits on active run only
     if st.run_id != run.id:
@@ -1537,30 +3694,16 @@ def stocktake_leader_edit_engineer(stocktake_id):
         return redirect(url_for("stocktake_leader_dashboard"))
 
     # Catalogue filtering (same logic as stocktake_page)
-    base = [p for p in parts_db if "reagent" not in (p.get("category", "").lower())]
-    hidden = get_hidden_part_numbers()
-    parts = [p for p in base if norm_pn(p.get("part_number", "")) not in hidden]
+    view = get_catalogue_view("stocktake")
 
     category = request.args.get("category")
     search = (request.args.get("search") or "").strip().lower()
 
-    if search:
-        filtered = [
-            p for p in parts
-            if (not category or p.get("category") == category) and (
-                search in (p.get("part_number", "").lower()) or
-                search in (p.get("description", "").lower()) or
-                search in (p.get("make", "").lower()) or
-                search in (p.get("manufacturer", "").lower())
-            )
-        ]
-    else:
-        filtered = [p for p in parts if not category or p.get("category") == category]
-
-    items = StocktakeItem.query.filter_by(stocktake_id=st.id).order_by(StocktakeItem.part_number.asc()).all()
-    stocktake_rows = get_stocktake_rows_with_unfound(st.id)
-
-    item_qty_map = {it.part_number: int(it.quantity or 0) for it in items}
+    # First page of cards plus the engineer's own lines; the rest load from
+    # /api/catalogue/parts
+    cursor, limit = parse_page_args()
+    page, next_cursor = paginate_view(view, category, search, cursor, limit)
+    item_qty_map = st.item_qty_map()
 
     return render_template(
         "stocktake_leader_engineer_edit.html",
@@ -1571,11 +3714,12 @@ def stocktake_leader_edit_engineer(stocktake_id):
         status=st.status,
         checked_by=st.checked_by,
         checked_at=st.checked_at.strftime("%Y-%m-%d %H:%M UTC") if st.checked_at else None,
-        items=items,
-        stocktake_rows=stocktake_rows,
+        stocktake_rows=st.rows(),
         item_qty_map=item_qty_map,
-        parts=filtered,
-        categories=get_categories(parts),
+        parts=page,
+        mine_parts=own_line_parts(view, item_qty_map, page, category, search),
+        next_cursor=next_cursor,
+        categories=view.categories,
         selected_category=category,
         search=search
     )
@@ -1587,37 +3731,82 @@ def stocktake_leader_add_item(stocktake_id, part_number):
     if guard:
         return guard
 
-    st = Stocktake.query.get_or_404(stocktake_id)
+    wants_json = request.headers.get("X-Requested-With") == "XMLHttpRequest"
+    st = lock_stocktake(stocktake_id)
+    if not st:
+        abort(404)
 
-    part = next((p for p in parts_db if p["part_number"] == part_number), None)
+    part = get_part_by_number(part_number)
     if not part:
+        if wants_json:
+            return jsonify({"ok": False, "error": "Part not found."}), 404
         flash("Part not found.", "warning")
         return redirect(url_for("stocktake_leader_edit_engineer", stocktake_id=stocktake_id))
 
-    item = StocktakeItem.query.filter_by(stocktake_id=st.id, part_number=part_number).first()
-    if item:
-        item.quantity += 1
-    else:
-        db.session.add(StocktakeItem(
-            stocktake_id=st.id,
-            part_number=part_number,
-            description=part.get("description", ""),
-            quantity=1
-        ))
-
+    qty = adjust_stocktake_item_qty(st.id, part, 1)
+    submitted_item_changed(st, part["part_number"], 1)
+    items_count, total_qty = recount_stocktake(st.id)
     db.session.commit()
+
+    if wants_json:
+        return jsonify({
+            "ok": True,
+            "part_number": part["part_number"],
+            "quantity": qty,
+            "items_count": items_count,
+            "total_qty": total_qty,
+        })
     return redirect(request.referrer or url_for("stocktake_leader_edit_engineer", stocktake_id=stocktake_id))
 
 
+@app.route("/stocktake-leader/engineer/<int:stocktake_id>/adjust/<path:part_number>", methods=["POST"])
+def stocktake_leader_adjust_item_qty(stocktake_id, part_number):
+    """Atomic +/- on one line of an engineer's stocktake; form field `delta`."""
+    guard = require_stocktake_leader()
+    if guard:
+        return guard
+
+    st = lock_stocktake(stocktake_id)
+    if not st:
+        abort(404)
+    delta = parse_qty_delta(request.form.get("delta"))
+
+    part = get_part_by_number(part_number)
+    if not part:
+        return jsonify({"ok": False, "error": "Part not found."}), 404
+
+    old_qty = (
+        db.session.query(StocktakeItem.quantity)
+        .filter_by(stocktake_id=st.id, part_number=part["part_number"])
+        .scalar()
+    ) or 0
+    qty = adjust_stocktake_item_qty(st.id, part, delta)
+    submitted_item_changed(st, part["part_number"], qty - old_qty)
+    items_count, total_qty = recount_stocktake(st.id)
+    db.session.commit()
+
+    return jsonify({
+        "ok": True,
+        "part_number": part["part_number"],
+        "quantity": qty,
+        "removed": qty == 0,
+        "items_count": items_count,
+        "total_qty": total_qty,
+    })
+
+
 @app.route("/stocktake-leader/engineer/<int:stocktake_id>/remove/<path:part_number>")
 def stocktake_leader_remove_item(stocktake_id, part_number):
     guard = require_stocktake_leader()
     if guard:
         return guard
 
+    lock_stocktake(stocktake_id)
     item = StocktakeItem.query.filter_by(stocktake_id=stocktake_id, part_number=part_number).first()
     if item:
+        submitted_item_changed(item.stocktake, item.part_number, -int(item.quantity or 0))
         db.session.delete(item)
+        recount_stocktake(stocktake_id)
         db.session.commit()
 
     return redirect(url_for("stocktake_leader_edit_engineer", stocktake_id=stocktake_id))
@@ -1629,6 +3818,7 @@ def stocktake_leader_update_item(stocktake_id, part_number):
     if guard:
         return guard
 
+    lock_stocktake(stocktake_id)
     item = StocktakeItem.query.filter_by(stocktake_id=stocktake_id, part_number=part_number).first()
     if not item:
         return jsonify({"ok": False, "error": "Item not found."}), 404
@@ -1638,21 +3828,24 @@ def stocktake_leader_update_item(stocktake_id, part_number):
     except ValueError:
         qty = 0
 
+    old_qty = int(item.quantity or 0)
     removed = False
     if qty <= 0:
         db.session.delete(item)
         removed = True
     else:
         item.quantity = qty
+    submitted_item_changed(item.stocktake, item.part_number, (0 if removed else qty) - old_qty)
 
+    items_count, total_qty = recount_stocktake(stocktake_id)
     db.session.commit()
 
-    items_count = StocktakeItem.query.filter_by(stocktake_id=stocktake_id).count()
     return jsonify({
         "ok": True,
         "removed": removed,
         "quantity": None if removed else qty,
-        "items_count": items_count
+        "items_count": items_count,
+        "total_qty": total_qty,
     })
 
 
@@ -1662,7 +3855,9 @@ def stocktake_leader_set_item_qty(stocktake_id, part_number):
     if guard:
         return guard
 
-    st = Stocktake.query.get_or_404(stocktake_id)
+    st = lock_stocktake(stocktake_id)
+    if not st:
+        abort(404)
 
     try:
         qty = int(request.form.get("quantity", 0))
@@ -1670,12 +3865,14 @@ def stocktake_leader_set_item_qty(stocktake_id, part_number):
         qty = 0
     qty = max(0, qty)
 
-    part = next((p for p in parts_db if p["part_number"] == part_number), None)
+    part = get_part_by_number(part_number)
     if not part:
         return jsonify({"ok": False, "error": "Part not found."}), 404
+    part_number = part["part_number"]
 
     item = StocktakeItem.query.filter_by(stocktake_id=st.id, part_number=part_number).first()
 
+    old_qty = int(item.quantity or 0) if item else 0
     removed = False
     if qty <= 0:
         if item:
@@ -1691,15 +3888,17 @@ def stocktake_leader_set_item_qty(stocktake_id, part_number):
                 description=part.get("description", ""),
                 quantity=qty
             ))
+    submitted_item_changed(st, part_number, qty - old_qty)
 
+    items_count, total_qty = recount_stocktake(st.id)
     db.session.commit()
 
-    items_count = StocktakeItem.query.filter_by(stocktake_id=st.id).count()
     return jsonify({
         "ok": True,
         "removed": removed,
         "quantity": 0 if removed else qty,
-        "items_count": items_count
+        "items_count": items_count,
+        "total_qty": total_qty,
     })
 
 
@@ -1709,13 +3908,17 @@ def stocktake_leader_unlock(stocktake_id):
     if guard:
         return guard
 
-    st = Stocktake.query.get_or_404(stocktake_id)
+    st = lock_stocktake(stocktake_id)
+    if not st:
+        abort(404)
 
     # unlock (draft again)
+    old_status = st.status
     st.status = "draft"
     st.submitted_at = None
     st.checked_by = None
     st.checked_at = None
+    stocktake_status_changed(st, old_status, st.status)
 
     db.session.commit()
     flash(f"Unlocked {st.engineer_email} stocktake.", "success")
@@ -1728,7 +3931,9 @@ def stocktake_leader_delete(stocktake_id):
     if guard:
         return guard
 
-    st = Stocktake.query.get_or_404(stocktake_id)
+    st = lock_stocktake(stocktake_id)
+    if not st:
+        abort(404)
 
     # Only allow delete if status is submitted or checked, not if pending (draft)
     if st.status == "draft":
@@ -1736,10 +3941,12 @@ def stocktake_leader_delete(stocktake_id):
         return redirect(url_for("stocktake_leader_dashboard"))
 
     engineer_email = st.engineer_email
-    
+    stocktake_status_changed(st, st.status, "deleted")
+
     # Delete all items for that stocktake (cascade handles this, but be explicit)
     StocktakeItem.query.filter_by(stocktake_id=st.id).delete(synchronize_session=False)
     StocktakeUnfoundItem.query.filter_by(stocktake_id=st.id).delete(synchronize_session=False)
+    StocktakeSyncOp.query.filter_by(stocktake_id=st.id).delete(synchronize_session=False)
     
     # Delete the stocktake itself
     db.session.delete(st)
@@ -1756,7 +3963,9 @@ def stocktake_leader_check(stocktake_id):
     if guard:
         return guard
 
-    st = Stocktake.query.get_or_404(stocktake_id)
+    st = lock_stocktake(stocktake_id)
+    if not st:
+        abort(404)
 
     checker = (request.form.get("checked_by") or "").strip()
     if not checker:
@@ -1768,9 +3977,11 @@ def stocktake_leader_check(stocktake_id):
     #     flash("Only submitted stocktakes can be checked.", "warning")
     #     return redirect(url_for("stocktake_leader_edit_engineer", stocktake_id=stocktake_id))
 
+    old_status = st.status
     st.status = "checked"
     st.checked_by = checker
     st.checked_at = datetime.utcnow()
+    stocktake_status_changed(st, old_status, st.status)
 
     db.session.commit()
     flash(f"Marked as checked by {checker}.", "success")
@@ -1778,13 +3989,29 @@ def stocktake_leader_check(stocktake_id):
 
 
 # CSV export helper and routes for stocktake leader
-def csv_response(filename: str, rows: list, header: list):
-    sio = StringIO()
-    writer = csv.writer(sio)
-    writer.writerow(header)
-    writer.writerows(rows)
-    output = make_response(sio.getvalue())
-    output.headers["Content-Type"] = "text/csv"
+class _CsvLineSink:
+    """Write target that hands csv.writer's formatted line straight back."""
+
+    def write(self, line):
+        return line
+
+
+def iter_csv(rows, header: list):
+    """Yield CSV text lazily, CSV_STREAM_CHUNK_ROWS rows per chunk."""
+    writer = csv.writer(_CsvLineSink())
+    chunk = [writer.writerow(header)]
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= CSV_STREAM_CHUNK_ROWS:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def csv_response(filename: str, rows, header: list):
+    """Stream rows (any iterable, consumed while the response is sent) as a CSV download."""
+    output = Response(stream_with_context(iter_csv(rows, header)), mimetype="text/csv")
     output.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
     return output
 
@@ -1792,66 +4019,59 @@ def csv_response(filename: str, rows: list, header: list):
 def build_master_totals_for_run(run_id: int):
     """
     Returns list of dicts: [{part_number, description, total_qty}]
-    Totals are computed from DB (single source of truth).
-    Only includes submitted stocktakes for the given run.
+    Read from the run's StocktakeRunTotal rows (submitted stocktakes only).
     """
-    # IMPORTANT: cast quantity -> Integer so SUM is correct even if stored as text
-    rows = (
-        db.session.query(
+    out = []
+    descriptions = catalogue_map("description")
+    for (unfound, pn, description), total_qty in stored_run_totals(run_id).items():
+        if unfound:
+            out.append({"part_number": pn, "description": f"[UNFOUND] {description}", "total_qty": total_qty})
+        else:
+            pn_clean = (pn or "").strip()
+            out.append({"part_number": pn_clean, "description": descriptions.get(pn_clean) or "", "total_qty": total_qty})
+
+    out.sort(key=lambda x: (str(x.get("part_number") or "").lower(), str(x.get("description") or "").lower()))
+    return out
+
+
+def submitted_stocktake_lines_query(run_id: int):
+    """Items and unfound lines of a run's submitted stocktakes as one ordered select.
+
+    Ordered by submission time, then per stocktake: items by part number,
+    then unfound lines by code.
+    """
+    items = (
+        select(
+            Stocktake.id.label("stocktake_id"),
+            Stocktake.engineer_email,
+            Stocktake.submitted_at,
+            literal(0).label("unfound"),
             StocktakeItem.part_number.label("part_number"),
-            func.sum(cast(StocktakeItem.quantity, Integer)).label("total_qty"),
+            StocktakeItem.description.label("description"),
+            StocktakeItem.quantity.label("quantity"),
+            StocktakeItem.id.label("line_id"),
         )
         .join(Stocktake, StocktakeItem.stocktake_id == Stocktake.id)
-        .filter(
-            Stocktake.run_id == run_id,
-            Stocktake.status == "submitted",
-        )
-        .group_by(StocktakeItem.part_number)
-        .order_by(StocktakeItem.part_number.asc())
-        .all()
+        .where(Stocktake.run_id == run_id, Stocktake.status == "submitted")
     )
-
-    # Optional: description lookup (works if you have parts_db list/dict in memory)
-    # If you don't have parts_db, you can remove the description column.
-    desc_map = {}
-    try:
-        # parts_db: list of dicts (part_number, description)
-        desc_map = { (p.get("part_number") or "").strip(): (p.get("description") or "") for p in parts_db }
-    except Exception:
-        desc_map = {}
-
-    out = []
-    for pn, total_qty in rows:
-        pn_clean = (pn or "").strip()
-        out.append({
-            "part_number": pn_clean,
-            "description": desc_map.get(pn_clean, ""),
-            "total_qty": int(total_qty or 0),
-        })
-
-    unfound_rows = (
-        db.session.query(
+    unfound = (
+        select(
+            Stocktake.id.label("stocktake_id"),
+            Stocktake.engineer_email,
+            Stocktake.submitted_at,
+            literal(1).label("unfound"),
             StocktakeUnfoundItem.part_code.label("part_number"),
             StocktakeUnfoundItem.description.label("description"),
-            func.sum(cast(StocktakeUnfoundItem.quantity, Integer)).label("total_qty")
+            StocktakeUnfoundItem.quantity.label("quantity"),
+            StocktakeUnfoundItem.id.label("line_id"),
         )
         .join(Stocktake, StocktakeUnfoundItem.stocktake_id == Stocktake.id)
-        .filter(
-            Stocktake.run_id == run_id,
-            Stocktake.status == "submitted",
-        )
-        .group_by(StocktakeUnfoundItem.part_code, StocktakeUnfoundItem.description)
-        .all()
+        .where(Stocktake.run_id == run_id, Stocktake.status == "submitted")
+    )
+    lines = union_all(items, unfound).subquery()
+    return select(lines).order_by(
+        lines.c.submitted_at, lines.c.stocktake_id, lines.c.unfound, lines.c.part_number, lines.c.line_id
     )
-    for uf in unfound_rows:
-        out.append({
-            "part_number": uf.part_number,
-            "description": f"[UNFOUND] {uf.description}",
-            "total_qty": int(uf.total_qty or 0),
-        })
-
-    out.sort(key=lambda x: (str(x.get("part_number") or "").lower(), str(x.get("description") or "").lower()))
-    return out
 
 
 @app.route("/stocktake-leader/export/master.csv")
@@ -1861,21 +4081,10 @@ def stocktake_leader_export_master():
         return guard
 
     run = get_or_create_active_stocktake_run()
+    # One row per distinct part, so this stays as small as the catalogue
     master = build_master_totals_for_run(run.id)
-
-    # Build CSV
-    buf = StringIO()
-    w = csv.writer(buf)
-    w.writerow(["Part Number", "Description", "Total Qty"])
-    for row in master:
-        w.writerow([row["part_number"], row["description"], row["total_qty"]])
-
-    filename = f"stocktake_master_run_{run.id}.csv"
-    return Response(
-        buf.getvalue(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    rows = ((row["part_number"], row["description"], row["total_qty"]) for row in master)
+    return csv_response(f"stocktake_master_run_{run.id}.csv", rows, ["Part Number", "Description", "Total Qty"])
 
 
 @app.route("/stocktake-leader/export/all.csv")
@@ -1886,82 +4095,62 @@ def stocktake_leader_export_all():
 
     run = get_or_create_active_stocktake_run()
 
-    # Pull all submitted stocktakes for this run
-    submissions = (
-        Stocktake.query
-        .filter_by(run_id=run.id, status="submitted")
-        .order_by(Stocktake.submitted_at.asc())
-        .all()
-    )
+    run_id, run_name = run.id, run.name
 
-    # Optional: description lookup from parts_db (safe fallback)
-    desc_map = {}
-    try:
-        desc_map = {(p.get("part_number") or "").strip(): (p.get("description") or "") for p in parts_db}
-    except Exception:
-        desc_map = {}
+    def rows():
+        # One file, all engineers, one row per item: every submitted stocktake's
+        # items then unfound lines, from one ordered query on a server-side cursor
+        result = db.session.execute(
+            submitted_stocktake_lines_query(run_id).execution_options(yield_per=EXPORT_YIELD_PER)
+        )
+        descriptions = catalogue_map("description")
+        for line in result:
+            submitted_at_str = line.submitted_at.strftime("%Y-%m-%d %H:%M:%S") if line.submitted_at else ""
+            if line.unfound:
+                pn, description = line.part_number, f"[UNFOUND] {line.description}"
+            else:
+                pn = (line.part_number or "").strip()
+                description = descriptions.get(pn) or ""
+            yield [line.engineer_email or "", submitted_at_str, pn, description, int(line.quantity or 0), run_name]
+
+    return csv_response(
+        f"stocktake_all_{run_name.replace(' ', '_')}.csv",
+        rows(),
+        ["Engineer Email", "Submitted At", "Part Number", "Description", "Quantity", "Run"],
+    )
 
-    buf = StringIO()
-    w = csv.writer(buf)
 
-    # One file, all engineers, one row per item
-    w.writerow(["Engineer Email", "Submitted At", "Part Number", "Description", "Quantity", "Run"])
+@app.route("/stocktake-leader/export/engineer/<int:stocktake_id>.csv")
+def stocktake_leader_export_engineer(stocktake_id):
+    guard = require_stocktake_leader()
+    if guard:
+        return guard
 
-    for sub in submissions:
-        engineer = getattr(sub, "engineer_email", None) or ""
-        submitted_at = getattr(sub, "submitted_at", None)
-        submitted_at_str = submitted_at.strftime("%Y-%m-%d %H:%M:%S") if submitted_at else ""
+    st = Stocktake.query.get_or_404(stocktake_id)
+    stocktake_id, engineer_email = st.id, st.engineer_email
 
+    def rows():
         items = (
             StocktakeItem.query
-            .filter_by(stocktake_id=sub.id)
+            .filter_by(stocktake_id=stocktake_id)
             .order_by(StocktakeItem.part_number.asc())
-            .all()
+            .yield_per(EXPORT_YIELD_PER)
         )
-
         for it in items:
-            pn = (it.part_number or "").strip()
-            qty = int(it.quantity or 0)
-            w.writerow([engineer, submitted_at_str, pn, desc_map.get(pn, ""), qty, run.name])
+            yield (engineer_email, it.part_number, it.description, it.quantity)
 
         unfound_items = (
             StocktakeUnfoundItem.query
-            .filter_by(stocktake_id=sub.id)
+            .filter_by(stocktake_id=stocktake_id)
             .order_by(StocktakeUnfoundItem.part_code.asc(), StocktakeUnfoundItem.id.asc())
-            .all()
+            .yield_per(EXPORT_YIELD_PER)
         )
         for uf in unfound_items:
-            w.writerow([engineer, submitted_at_str, uf.part_code, f"[UNFOUND] {uf.description}", int(uf.quantity or 0), run.name])
-
-    filename = f"stocktake_all_{run.name.replace(' ', '_')}.csv"
-    return Response(
-        buf.getvalue(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+            yield (engineer_email, uf.part_code, f"[UNFOUND] {uf.description}", uf.quantity)
 
-
-@app.route("/stocktake-leader/export/engineer/<int:stocktake_id>.csv")
-def stocktake_leader_export_engineer(stocktake_id):
-    guard = require_stocktake_leader()
-    if guard:
-        return guard
-
-    st = Stocktake.query.get_or_404(stocktake_id)
-    items = StocktakeItem.query.filter_by(stocktake_id=st.id).order_by(StocktakeItem.part_number.asc()).all()
-
-    rows = [(st.engineer_email, it.part_number, it.description, it.quantity) for it in items]
-
-    unfound_items = (
-        StocktakeUnfoundItem.query
-        .filter_by(stocktake_id=st.id)
-        .order_by(StocktakeUnfoundItem.part_code.asc(), StocktakeUnfoundItem.id.asc())
-        .all()
-    )
-    rows.extend([(st.engineer_email, uf.part_code, f"[UNFOUND] {uf.description}", uf.quantity) for uf in unfound_items])
     return csv_response(
-        f"stocktake_{st.engineer_email}.csv",
-        rows,
+        f"stocktake_{engineer_email}.csv",
+        rows(),
         ["engineer_email", "part_number", "description", "quantity"]
     )
 
@@ -1977,93 +4166,54 @@ def my_orders():
     - Sent Items (Last 7 Days / Over 7 Days): from dispatch notes/items
     - last_dispatch_for_part: map for the "Last Dispatched" column
     """
-    email = (request.args.get("email") or "").strip()
+    email = (request.args.get("email") or "").strip().lower()
     if not email:
         # First load or missing email: show the form only
         return render_template("my_orders.html", email=None)
 
-    # -------- outstanding items (remaining > 0) --------
-    # Pull ALL outstanding lines for this engineer (regardless of back_order flag)
-    outstanding_items = (
-        db.session.query(PartsOrderItem)
-        .join(PartsOrder, PartsOrder.id == PartsOrderItem.order_id)
-        .filter(
-            PartsOrder.email == email,
-            (PartsOrderItem.quantity - func.coalesce(PartsOrderItem.quantity_sent, 0)) > 0
-        )
-        .order_by(PartsOrder.date.asc(), PartsOrderItem.id.asc())
-        .all()
-    )
+    data = load_my_orders(email)
 
     # Split: explicit back orders vs other active items
+    outstanding_items = data["outstanding_items"]
     back_orders = [i for i in outstanding_items if bool(getattr(i, "back_order", False))]
     active_orders = [i for i in outstanding_items if not bool(getattr(i, "back_order", False))]
 
-    # -------- dispatch history (recent vs older) --------
-    now = datetime.utcnow()
-    last_7 = now - timedelta(days=7)
-
-    # Recent (≤ 7 days)
-    recent_dispatches = (
-        db.session.query(
-            DispatchNote.date.label("dispatch_date"),
-            DispatchItem.part_number.label("part_number"),
-            DispatchItem.description.label("description"),
-            DispatchItem.quantity_sent.label("qty_sent"),
-        )
-        .join(DispatchItem, DispatchItem.dispatch_note_id == DispatchNote.id)
-        .filter(
-            DispatchNote.engineer_email == email,
-            DispatchNote.date >= last_7,
-        )
-        .order_by(DispatchNote.date.desc(), DispatchItem.part_number.asc())
-        .all()
-    )
-
-    # Older (> 7 days)
-    older_dispatches = (
-        db.session.query(
-            DispatchNote.date.label("dispatch_date"),
-            DispatchItem.part_number.label("part_number"),
-            DispatchItem.description.label("description"),
-            DispatchItem.quantity_sent.label("qty_sent"),
-        )
-        .join(DispatchItem, DispatchItem.dispatch_note_id == DispatchNote.id)
-        .filter(
-            DispatchNote.engineer_email == email,
-            DispatchNote.date < last_7,
-        )
-        .order_by(DispatchNote.date.desc(), DispatchItem.part_number.asc())
-        .all()
-    )
-
-    # -------- last dispatch per part (for the table badges) --------
-    last_dispatch_results = (
-        db.session.query(
-            DispatchItem.part_number.label("part_number"),
-            func.max(DispatchNote.date).label("last_date"),
-        )
-        .join(DispatchNote, DispatchNote.id == DispatchItem.dispatch_note_id)
-        .filter(DispatchNote.engineer_email == email)
-        .group_by(DispatchItem.part_number)
-        .all()
-    )
-    last_dispatch_for_part = {row.part_number: row.last_date for row in last_dispatch_results}
-
-    colour_for_part = {p.get("part_number", ""): p.get("colour", "") for p in parts_db}
-
     # Render
     return render_template(
         "my_orders.html",
         email=email,
         back_orders=back_orders,
         active_orders=active_orders,
-        recent_dispatches=recent_dispatches,
-        older_dispatches=older_dispatches,
-        last_dispatch_for_part=last_dispatch_for_part,
-        colour_for_part=colour_for_part,
+        recent_dispatches=data["recent_dispatches"],
+        older_dispatches=data["older_dispatches"],
+        older_next_cursor=data["older_next_cursor"],
+        last_dispatch_for_part=data["last_dispatch_for_part"],
+        colour_for_part=catalogue_map("colour"),
     )
 
+
+@app.route("/api/my-orders/older")
+def my_orders_older_api():
+    """Next page of My Orders' older dispatch lines as JSON.
+
+    Query args: email, cursor (next_cursor from the previous page) and limit.
+    """
+    email = (request.args.get("email") or "").strip().lower()
+    _, limit = parse_page_args(DISPATCH_HISTORY_PAGE_SIZE)
+    rows, next_cursor = get_older_dispatches(email, after=parse_dispatch_cursor(request.args.get("cursor")), limit=limit)
+    colours = catalogue_map("colour")
+    return jsonify({
+        "ok": True,
+        "rows": [{
+            "dispatch_date": row.dispatch_date.strftime("%d %b %Y %H:%M"),
+            "part_number": row.part_number,
+            "colour": colours.get(row.part_number) or "",
+            "description": row.description or "",
+            "qty_sent": row.qty_sent,
+        } for row in rows],
+        "next_cursor": next_cursor,
+    })
+
 # ──────────────────────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+# bench_catalogue_boot.py
+# Worker boot cost of the parts catalogue against catalogue size: building it
+# from parts.csv (parse + index) versus loading the pickled snapshot, and the
+# part-table boot path (load_parts_catalogue) cold and from its snapshot.
+#
+#   SQLALCHEMY_DATABASE_URI=sqlite:///bench.db python bench_catalogue_boot.py [size ...]
+#
+# Importing app runs its start-up work (migrations, parts import) against the
+# configured database, so this refuses to run without a local one. The part
+# table of that database is replaced with the synthetic parts of each size.
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy.engine import make_url
+
+_db_uri = os.environ.get("SQLALCHEMY_DATABASE_URI")
+if not _db_uri or make_url(_db_uri).host not in (None, "", "localhost", "127.0.0.1", "::1"):
+    sys.exit("Set SQLALCHEMY_DATABASE_URI to a local database (e.g. sqlite:///bench.db) to run this benchmark.")
+
+import app as parts_app
+from app import Part, PartRecord, PartsCatalogue, db, import_parts_csv, read_parts_csv, save_parts_catalogue
+
+SIZES = [int(n) for n in sys.argv[1:]] or [1_000, 10_000, 50_000, 100_000]
+
+
+def synthetic_parts(n):
+    """n parts cloned from the real catalogue with unique codes."""
+    base = parts_app.parts_db.parts
+    parts = []
+    for i in range(n):
+        p = base[i % len(base)]
+        parts.append(PartRecord(
+            part_number=p.part_number if i < len(base) else f"{p.part_number}-{i}",
+            description=p.description,
+            category=p.category,
+            make=p.make,
+            manufacturer=p.manufacturer,
+            image=p.image,
+            colour=p.colour,
+            installs=p.installs,
+        ))
+    return parts
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def build_from_csv(path):
+    parts, stamp = read_parts_csv(path)
+    return PartsCatalogue(parts, source_stamp=stamp)
+
+
+def load_from_db(cold):
+    """load_parts_catalogue(); cold drops the snapshot first (query + index + write)."""
+    if cold and os.path.exists(parts_app.PARTS_SNAPSHOT_PATH):
+        os.remove(parts_app.PARTS_SNAPSHOT_PATH)
+    return parts_app.load_parts_catalogue()
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    csv_path = os.path.join(tmp, "parts.csv")
+    parts_app.PARTS_SNAPSHOT_PATH = os.path.join(tmp, "parts.snapshot")
+
+    print(f"{'parts':>8} {'csv build ms':>13} {'snapshot load ms':>17} {'snapshot MB':>12}"
+          f" {'db build ms':>12} {'db snapshot ms':>15}")
+    for size in SIZES:
+        save_parts_catalogue(synthetic_parts(size), csv_path)
+
+        catalogue, build_ms = timed(lambda: build_from_csv(csv_path))
+        key, _ = parts_app.parts_csv_snapshot_key(csv_path)
+        parts_app.write_parts_snapshot(catalogue, key)
+
+        def load_snapshot():
+            snapshot_key, _ = parts_app.parts_csv_snapshot_key(csv_path)
+            return parts_app.read_parts_snapshot(snapshot_key)
+
+        loaded, load_ms = timed(load_snapshot)
+        assert loaded is not None and len(loaded) == len(catalogue)
+        snapshot_mb = os.path.getsize(parts_app.PARTS_SNAPSHOT_PATH) / 1e6
+
+        with parts_app.app.app_context():
+            db.session.query(Part).delete()
+            import_parts_csv(csv_path)
+            db_catalogue, db_build_ms = timed(lambda: load_from_db(cold=True))
+            db_loaded, db_load_ms = timed(lambda: load_from_db(cold=False))
+        assert db_catalogue.version is not None and len(db_loaded) == len(db_catalogue) == size
+
+        print(f"{size:>8} {build_ms:>13.1f} {load_ms:>17.1f} {snapshot_mb:>12.1f}"
+              f" {db_build_ms:>12.1f} {db_load_ms:>15.1f}")
@@ -20,15 +20,169 @@ function hideToast() {
   toast.style.display = 'none';
 }
 
-(function () {
-  function escapeHtml(str) {
-    return (str || "").replace(/[&<>"']/g, function (m) {
-      return ({
-        "&": "&amp;", "<": "&lt;", ">": "&gt;", "\"": "&quot;", "'": "&#039;"
-      })[m];
-    });
+/* =========================
+   Shared markup helpers for cards and rows built from JSON
+   ========================= */
+function escapeHtml(str) {
+  return String(str == null ? "" : str).replace(/[&<>"']/g, function (m) {
+    return ({
+      "&": "&amp;", "<": "&lt;", ">": "&gt;", "\"": "&quot;", "'": "&#039;"
+    })[m];
+  });
+}
+
+function colourPillHtml(colour) {
+  return colour
+    ? `<span class="colour-pill colour-${escapeHtml(colour.toLowerCase())}">${escapeHtml(colour)}</span>`
+    : `<span class="colour-pill colour-none">No colour</span>`;
+}
+
+// Same markup as the cards in stocktake_page.html
+function stocktakeCardHtml(p, qty, submitted) {
+  const controls = submitted
+    ? `<input class="form-control text-center" value="${qty}" disabled>`
+    : `<div class="d-flex justify-content-center align-items-center gap-2">
+         <button type="button" class="btn btn-outline-secondary st-minus" aria-label="Decrease">−</button>
+         <input type="number" min="0" value="${qty}" class="form-control text-center st-qty" inputmode="numeric" aria-label="Quantity">
+         <button type="button" class="btn btn-outline-secondary st-plus" aria-label="Increase">+</button>
+       </div>
+       <div class="small text-muted text-center mt-2 st-status"></div>`;
+
+  return `
+    <div class="col-12 col-md-6">
+      <div class="card h-100 stocktake-part-card" data-part="${escapeHtml(p.part_number)}" data-desc="${escapeHtml(p.description)}">
+        <div class="card-body d-flex flex-column">
+          <div class="d-flex justify-content-between align-items-start gap-2">
+            <div>
+              <div class="d-flex align-items-center gap-2">
+                <div class="fw-semibold">${escapeHtml(p.part_number)}</div>
+                ${colourPillHtml(p.colour)}
+              </div>
+              <div class="text-muted small st-desc">${escapeHtml(p.description)}</div>
+            </div>
+            ${submitted ? `<span class="badge bg-secondary">Locked</span>` : ""}
+          </div>
+          <div class="mt-3">${controls}</div>
+        </div>
+      </div>
+    </div>
+  `;
+}
+
+// Same markup as the cards in stocktake_leader_engineer_edit.html
+function leaderCardHtml(p, qty) {
+  return `
+    <div class="col-12 col-md-6">
+      <div class="card h-100 leader-part-card" data-part="${escapeHtml(p.part_number)}" data-desc="${escapeHtml(p.description)}">
+        <div class="card-body d-flex flex-column">
+          <div class="d-flex justify-content-between align-items-start gap-2">
+            <div>
+              <div class="d-flex align-items-center gap-2">
+                <div class="fw-semibold">${escapeHtml(p.part_number)}</div>
+                ${colourPillHtml(p.colour)}
+              </div>
+              <div class="text-muted small st-desc">${escapeHtml(p.description)}</div>
+            </div>
+          </div>
+          <div class="mt-3">
+            <div class="d-flex justify-content-center align-items-center gap-2">
+              <button type="button" class="btn btn-outline-secondary lead-minus" aria-label="Decrease">−</button>
+              <input type="number" min="0" value="${qty}" class="form-control text-center lead-qty" inputmode="numeric" aria-label="Quantity">
+              <button type="button" class="btn btn-outline-secondary lead-plus" aria-label="Increase">+</button>
+            </div>
+            <div class="small text-muted text-center mt-2 lead-status"></div>
+          </div>
+        </div>
+      </div>
+    </div>
+  `;
+}
+
+function catalogueCardHtml(p, showImages) {
+  const make = p.make ? `<p class="card-text"><strong>Make:</strong> ${escapeHtml(p.make)}</p>` : "";
+  const manufacturer = p.manufacturer
+    ? `<p class="card-text"><strong>Manufacturer:</strong> ${escapeHtml(p.manufacturer)}</p>`
+    : "";
+  const image = (showImages && p.image_url)
+    ? `<div class="image-square mb-2"><img src="${escapeHtml(p.image_url)}" alt="${escapeHtml(p.description)}" loading="lazy"></div>`
+    : "";
+
+  return `
+    <div class="col-12 col-md-6">
+      <div class="card h-100">
+        <div class="card-body d-flex flex-column">
+          <div class="d-flex justify-content-between align-items-center gap-2">
+            <h5 class="card-title mb-0">${escapeHtml(p.part_number)}</h5>
+            ${colourPillHtml(p.colour)}
+          </div>
+          <h6 class="card-subtitle text-muted mb-2">${escapeHtml(p.description)}</h6>
+          <p class="card-text"><strong>Category:</strong> ${escapeHtml(p.category)}</p>
+          ${make}
+          ${manufacturer}
+          ${image}
+          <button class="btn btn-primary mt-auto" type="button" data-add-part="${escapeHtml(p.part_number)}">Add to Basket</button>
+        </div>
+      </div>
+    </div>
+  `;
+}
+
+// Load more button + infinite scroll over /api/catalogue/parts pages;
+// addParts(parts) puts each page's parts into the grid
+function initLoadMore(more, addParts) {
+  const apiUrl = more.dataset.apiUrl || "";
+  let cursor = more.dataset.nextCursor || "";
+  let loading = false;
+  let observer = null;
+
+  function finish() {
+    cursor = "";
+    if (observer) observer.disconnect();
+    if (more.parentElement) more.parentElement.remove();
+  }
+
+  async function loadMore() {
+    if (loading || !cursor) return;
+    loading = true;
+    more.textContent = "Loading…";
+
+    try {
+      const url = new URL(apiUrl, window.location.origin);
+      url.searchParams.set("cursor", cursor);
+      const res = await fetch(url.toString(), { headers: { "X-Requested-With": "XMLHttpRequest" } });
+      if (!res.ok) throw new Error("Bad response");
+      const data = await res.json();
+      if (!data || !data.ok) throw new Error("Bad payload");
+
+      addParts(data.parts || []);
+
+      if (data.next_cursor === null || typeof data.next_cursor === "undefined") {
+        finish();
+      } else {
+        cursor = String(data.next_cursor);
+        more.textContent = "Load more";
+      }
+    } catch (e) {
+      more.textContent = "Load more";
+    } finally {
+      loading = false;
+    }
   }
 
+  more.addEventListener("click", function (e) {
+    e.preventDefault();
+    loadMore();
+  });
+
+  if ("IntersectionObserver" in window) {
+    observer = new IntersectionObserver(function (entries) {
+      if (entries.some(en => en.isIntersecting)) loadMore();
+    }, { rootMargin: "600px 0px" });
+    observer.observe(more);
+  }
+}
+
+(function () {
   async function fetchPartsIntoTable(opts) {
     const {
       searchInput,
@@ -68,7 +222,7 @@ function hideToast() {
 
       const action = submitted
         ? `<button class="btn btn-sm btn-secondary" disabled>Locked</button>`
-        : `<a class="btn btn-sm btn-dark" href="${addUrl}">Add</a>`;
+        : `<a class="btn btn-sm btn-dark" href="${addUrl}" data-ajax-add>Add</a>`;
 
       return `
         <tr>
@@ -682,9 +836,155 @@ function hideToast() {
     return data; // { quantity, items_count, ... }
   }
 
-  // --- bind all cards
-  const cards = document.querySelectorAll(".stocktake-part-card");
-  cards.forEach((card) => {
+  // --- offline-first change log: every edit is an op kept in localStorage
+  // until /sync acknowledges it, so counts survive dead signal and reloads.
+  // The server applies each op_id once, so resending the log is always safe.
+  const syncUrl = body.dataset.syncUrl || "";
+  const logKey = "st_sync_" + engineer;
+  const SYNC_WINDOW_MS = 300;
+  const SYNC_MAX_OPS = 200;
+  const RETRY_MIN_MS = 2000;
+  const RETRY_MAX_MS = 30000;
+  let log = loadLog();
+  let syncTimer = null;
+  let syncing = false;
+  let retryMs = RETRY_MIN_MS;
+
+  function loadLog() {
+    const since = parseInt(body.dataset.syncRevision || "-1", 10);
+    try {
+      const saved = JSON.parse(localStorage.getItem(logKey) || "null");
+      if (saved && Array.isArray(saved.ops)) return { since, ops: saved.ops };
+    } catch (e) {}
+    return { since, ops: [] };
+  }
+
+  function saveLog() {
+    try { localStorage.setItem(logKey, JSON.stringify(log)); } catch (e) {}
+  }
+
+  function newOpId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2, 10);
+  }
+
+  function queueOp(op) {
+    op.op_id = newOpId();
+    log.ops.push(op);
+    saveLog();
+    scheduleSync(SYNC_WINDOW_MS);
+  }
+
+  function scheduleSync(ms) {
+    if (syncTimer || !syncUrl) return;
+    syncTimer = setTimeout(sync, ms);
+  }
+
+  async function sync(keepalive) {
+    clearTimeout(syncTimer);
+    syncTimer = null;
+    if (syncing || (keepalive && !log.ops.length)) return;
+    syncing = true;
+
+    const batch = log.ops.slice(0, SYNC_MAX_OPS);
+    let data = null;
+    try {
+      const res = await fetch(syncUrl, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "X-Requested-With": "XMLHttpRequest"
+        },
+        body: JSON.stringify({ since: log.since, ops: batch }),
+        keepalive: !!keepalive
+      });
+      data = await res.json().catch(() => null);
+      if (data && data.locked) {
+        // Submitted (e.g. from another device): nothing more can be saved
+        log.ops = [];
+        saveLog();
+        showToast(data.error || "This stocktake is locked");
+        return;
+      }
+      if (!res.ok || !data || !data.ok) throw new Error((data && data.error) || "Sync failed");
+    } catch (e) {
+      markOffline();
+      syncTimer = setTimeout(sync, retryMs);
+      retryMs = Math.min(retryMs * 2, RETRY_MAX_MS);
+      return;
+    } finally {
+      syncing = false;
+    }
+
+    retryMs = RETRY_MIN_MS;
+    const acked = new Set([...(data.applied || []), ...(data.duplicate || [])]);
+    const rejected = new Map((data.rejected || []).map(r => [r.op_id, r.error]));
+    const sent = batch.filter(op => acked.has(op.op_id) || rejected.has(op.op_id));
+    log.ops = log.ops.filter(op => !acked.has(op.op_id) && !rejected.has(op.op_id));
+    log.since = data.revision;
+    saveLog();
+
+    if (data.state) applyServerState(data.state);
+    sent.forEach(op => {
+      const error = rejected.get(op.op_id);
+      if (op.type === "add_unfound") {
+        showToast(error || `Part unfound line added (${op.part_code})`);
+      } else if (error) {
+        const card = cardsByPart.get(op.part_number);
+        const status = card && card.querySelector(".st-status");
+        if (status) status.textContent = error;
+      }
+    });
+    if (log.ops.length) scheduleSync(0);
+  }
+
+  function pendingParts() {
+    return new Set(log.ops.map(op => op.part_number).filter(Boolean));
+  }
+
+  function markOffline() {
+    pendingParts().forEach(part => {
+      const card = cardsByPart.get(part);
+      const status = card && card.querySelector(".st-status");
+      if (status) status.textContent = "Offline, will sync";
+    });
+  }
+
+  // Server lines win, except on cards that still have unsent edits
+  function applyServerState(state) {
+    const quantities = new Map((state.items || []).map(i => [i.part_number, i.quantity]));
+    const pending = pendingParts();
+    cardsByPart.forEach((card, part) => {
+      if (pending.has(part)) return;
+      const qtyInput = card.querySelector(".st-qty");
+      const badge = card.querySelector(".st-qty-badge");
+      const status = card.querySelector(".st-status");
+      const qty = quantities.get(part) || 0;
+      const wasSaving = status && status.textContent !== "";
+      if (qtyInput) qtyInput.value = String(qty);
+      if (badge) badge.textContent = String(qty);
+      if (status) status.textContent = "";
+      if (wasSaving) showToast(`Saved ${part} = ${qty}`);
+    });
+  }
+
+  window.addEventListener("online", () => sync());
+  document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "hidden") sync(true);
+    else if (log.ops.length) sync();
+  });
+
+  // delta is set for +/- taps so the server adds rather than overwrites
+  function saveQty(partNumber, qty, delta) {
+    if (typeof delta === "number") queueOp({ type: "add", part_number: partNumber, delta });
+    else if (qty <= 0) queueOp({ type: "remove", part_number: partNumber });
+    else queueOp({ type: "set", part_number: partNumber, quantity: qty });
+  }
+
+  // --- bind cards (rendered now, or added later by "Load more")
+  const cardsByPart = new Map();
+
+  function bindCard(card) {
     const part = card.getAttribute("data-part");
     if (!part) return;
 
@@ -695,44 +995,79 @@ function hideToast() {
     const badge = card.querySelector(".st-qty-badge");
 
     if (!minusBtn || !plusBtn || !qtyInput) return;
+    cardsByPart.set(part, card);
 
-    let busy = false;
-
-    async function applyQty(next) {
-      if (busy) return;
-      busy = true;
+    // Without the sync endpoint each edit is saved on its own
+    let seq = 0;
 
+    async function applyQty(next, delta) {
       next = Math.max(0, parseInt(next || "0", 10) || 0);
       qtyInput.value = String(next);
       if (status) status.textContent = "Saving…";
+      if (syncUrl) return saveQty(part, next, delta);
 
+      const mine = ++seq;
       try {
         const data = await setQty(part, next);
+        if (mine !== seq) return;
         qtyInput.value = String(data.quantity);
         if (badge) badge.textContent = String(data.quantity);
         if (status) status.textContent = "";
         showToast(`Saved ${part} = ${data.quantity}`);
       } catch (e) {
+        if (mine !== seq) return;
         if (status) status.textContent = "Save failed";
-      } finally {
-        busy = false;
       }
     }
 
     plusBtn.addEventListener("click", () => {
       const cur = parseInt(qtyInput.value || "0", 10) || 0;
-      applyQty(cur + 1);
+      applyQty(cur + 1, 1);
     });
 
     minusBtn.addEventListener("click", () => {
       const cur = parseInt(qtyInput.value || "0", 10) || 0;
-      applyQty(Math.max(0, cur - 1));
+      if (cur <= 0) return;
+      applyQty(cur - 1, -1);
     });
 
     qtyInput.addEventListener("change", () => {
       applyQty(qtyInput.value);
     });
+  }
+
+  document.querySelectorAll(".stocktake-part-card").forEach(bindCard);
+  document.addEventListener("stocktake:cards-added", (e) => e.detail.cards.forEach(bindCard));
+
+  // Lines changed outside the log (scan mode): show the server quantities
+  document.addEventListener("stocktake:lines-changed", (e) => {
+    const pending = pendingParts();
+    Object.entries(e.detail.quantities || {}).forEach(([part, qty]) => {
+      const card = cardsByPart.get(part);
+      if (!card || pending.has(part)) return;
+      const qtyInput = card.querySelector(".st-qty");
+      const badge = card.querySelector(".st-qty-badge");
+      if (qtyInput) qtyInput.value = String(qty);
+      if (badge) badge.textContent = String(qty);
+    });
   });
+
+  // --- "Part unfound" lines go through the same log
+  const unfoundForm = document.getElementById("unfoundForm");
+  if (unfoundForm && syncUrl) {
+    unfoundForm.addEventListener("submit", (e) => {
+      e.preventDefault();
+      const field = (name) => (unfoundForm.elements[name] ? unfoundForm.elements[name].value.trim() : "");
+      const quantity = parseInt(field("quantity"), 10) || 0;
+      if (!field("part_code") || !field("description") || quantity <= 0) return;
+      queueOp({ type: "add_unfound", part_code: field("part_code"), description: field("description"), quantity });
+      unfoundForm.reset();
+      if (!navigator.onLine) showToast("Saved offline, will sync");
+    });
+  }
+
+  // Edits left over from an earlier visit (e.g. the tab closed offline)
+  if (log.ops.length) scheduleSync(0);
 })();
 
 
@@ -753,8 +1088,8 @@ function hideToast() {
   const mineEmpty = document.getElementById("mineEmpty");
   const mineCountBadge = document.getElementById("mineCountBadge");
 
-  const cards = Array.from(document.querySelectorAll(".stocktake-part-card"));
-  if (!allBtn || !mineBtn || !cards.length) return;
+  if (!allBtn || !mineBtn || !document.getElementById("stocktakeCardsGrid")) return;
+  const cards = () => Array.from(document.querySelectorAll(".stocktake-part-card"));
 
   const viewKey = "st_view_" + engineer;
 
@@ -769,7 +1104,7 @@ function hideToast() {
 
   function countSelectedCards() {
     let count = 0;
-    for (const card of cards) {
+    for (const card of cards()) {
       if (getCardQty(card) > 0) count++;
     }
     return count;
@@ -782,9 +1117,10 @@ function hideToast() {
 
     // Filter visibility
     let visibleCount = 0;
-    for (const card of cards) {
+    for (const card of cards()) {
       const qty = getCardQty(card);
-      const show = !isMine || qty > 0;
+      // mine-only cards wait in "All Parts" until their catalogue page loads
+      const show = isMine ? qty > 0 : card.dataset.mineOnly !== "1";
       card.parentElement.style.display = show ? "" : "none"; // parent col-12/col-md-6
       if (show) visibleCount++;
     }
@@ -806,7 +1142,7 @@ function hideToast() {
 
   // Observe qty changes and re-apply filter automatically (so it feels live)
   function hookQtyInputs() {
-    cards.forEach(card => {
+    cards().forEach(card => {
       const qtyInput = card.querySelector(".st-qty");
       if (!qtyInput) return;
 
@@ -825,6 +1161,15 @@ function hideToast() {
 
   hookQtyInputs();
 
+  document.addEventListener("stocktake:lines-changed", () => {
+    try { setActiveView(localStorage.getItem(viewKey) || "all"); } catch (e) { setActiveView("all"); }
+  });
+
+  document.addEventListener("stocktake:cards-added", () => {
+    hookQtyInputs();
+    try { setActiveView(localStorage.getItem(viewKey) || "all"); } catch (e) { setActiveView("all"); }
+  });
+
   // Also re-apply view after plus/minus clicks, because those update input values
   document.addEventListener("click", (e) => {
     const t = e.target;
@@ -847,6 +1192,190 @@ function hideToast() {
 })();
 
 
+/* =========================
+   Stocktake cards: further catalogue pages from /api/catalogue/parts
+   (Load more button + infinite scroll; own lines already have cards)
+   ========================= */
+(function () {
+  const more = document.getElementById("stocktakeLoadMore");
+  const grid = document.getElementById("stocktakeCardsGrid");
+  if (!more || !grid) return;
+
+  const submitted = (document.body.dataset.submitted || "0") === "1";
+
+  const qtyMap = (() => {
+    try { return JSON.parse(document.getElementById("stQtyMap").textContent) || {}; } catch (e) { return {}; }
+  })();
+
+  function existingCard(partNumber) {
+    return Array.from(grid.querySelectorAll(".stocktake-part-card"))
+      .find(card => card.getAttribute("data-part") === partNumber);
+  }
+
+  initLoadMore(more, function (parts) {
+    const added = [];
+    parts.forEach(p => {
+      const mine = existingCard(p.part_number);
+      if (mine) {
+        // An own line rendered up front: move it into catalogue order
+        delete mine.dataset.mineOnly;
+        grid.appendChild(mine.parentElement);
+        return;
+      }
+      grid.insertAdjacentHTML("beforeend", stocktakeCardHtml(p, qtyMap[p.part_number] || 0, submitted));
+      added.push(grid.lastElementChild.querySelector(".stocktake-part-card"));
+    });
+    // Mine-only cards stay after the loaded pages
+    grid.querySelectorAll('.stocktake-part-card[data-mine-only="1"]').forEach(card => grid.appendChild(card.parentElement));
+    document.dispatchEvent(new CustomEvent("stocktake:cards-added", { detail: { cards: added } }));
+  });
+})();
+
+
+/* =========================
+   Stocktake scan mode: every scanned code is one item. Codes are buffered
+   briefly and posted in batches; a batch keeps its batch_id across retries
+   so the server never counts it twice.
+   ========================= */
+(function () {
+  const input = document.getElementById("scanInput");
+  if (!input) return;
+
+  const scanUrl = input.dataset.scanUrl || "";
+  const statusEl = document.getElementById("scanStatus");
+  const unknownEl = document.getElementById("scanUnknown");
+  const queueKey = "st_scan_" + (document.body.dataset.engineer || "");
+  const SCAN_WINDOW_MS = 400;
+  const SCAN_MAX_CODES = 200;
+  const RETRY_MAX_MS = 30000;
+  const unknownCounts = new Map();
+  let retryMs = 1000;
+  let timer = null;
+  let sending = false;
+
+  // { codes: [...waiting], batch: { batch_id, codes } | null (sent, not yet acknowledged) }
+  let state = (() => {
+    try {
+      const saved = JSON.parse(localStorage.getItem(queueKey) || "null");
+      if (saved && Array.isArray(saved.codes)) return saved;
+    } catch (e) {}
+    return { codes: [], batch: null };
+  })();
+
+  function save() {
+    try { localStorage.setItem(queueKey, JSON.stringify(state)); } catch (e) {}
+  }
+
+  function setStatus(text) {
+    if (statusEl) statusEl.textContent = text;
+  }
+
+  function newBatchId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2, 10);
+  }
+
+  function schedule(ms) {
+    if (timer) return;
+    timer = setTimeout(send, ms);
+  }
+
+  // Unknown codes: one button each to pre-fill the Part Unfound form
+  function renderUnknown() {
+    if (!unknownEl) return;
+    unknownEl.innerHTML = Array.from(unknownCounts, ([code, count]) => `
+      <button type="button" class="btn btn-sm btn-outline-warning me-1 mb-1" data-unfound-code="${escapeHtml(code)}" data-unfound-qty="${count}">
+        ${escapeHtml(code)} × ${count} · add as unfound
+      </button>
+    `).join("");
+  }
+
+  if (unknownEl) {
+    unknownEl.addEventListener("click", (e) => {
+      const btn = e.target.closest("[data-unfound-code]");
+      const form = document.getElementById("unfoundForm");
+      if (!btn || !form) return;
+      form.elements.part_code.value = btn.getAttribute("data-unfound-code");
+      form.elements.quantity.value = btn.getAttribute("data-unfound-qty");
+      unknownCounts.delete(btn.getAttribute("data-unfound-code"));
+      renderUnknown();
+      form.scrollIntoView({ behavior: "smooth", block: "center" });
+      form.elements.description.focus();
+    });
+  }
+
+  async function send() {
+    clearTimeout(timer);
+    timer = null;
+    if (sending || !scanUrl) return;
+    if (!state.batch) {
+      if (!state.codes.length) return;
+      state.batch = { batch_id: newBatchId(), codes: state.codes.splice(0, SCAN_MAX_CODES) };
+      save();
+    }
+    sending = true;
+
+    let data = null;
+    try {
+      const res = await fetch(scanUrl, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", "X-Requested-With": "XMLHttpRequest" },
+        body: JSON.stringify(state.batch)
+      });
+      data = await res.json().catch(() => null);
+      if (data && data.locked) {
+        state = { codes: [], batch: null };
+        save();
+        setStatus(data.error || "This stocktake is locked");
+        return;
+      }
+      if (!res.ok || !data || !data.ok) throw new Error((data && data.error) || "Scan failed");
+    } catch (e) {
+      const waiting = state.codes.length + state.batch.codes.length;
+      setStatus(`Offline, ${waiting} scan${waiting === 1 ? "" : "s"} waiting`);
+      timer = setTimeout(send, retryMs);
+      retryMs = Math.min(retryMs * 2, RETRY_MAX_MS);
+      return;
+    } finally {
+      sending = false;
+    }
+
+    retryMs = 1000;
+    state.batch = null;
+    save();
+
+    const quantities = {};
+    (data.results || []).forEach(r => { quantities[r.part_number] = r.quantity; });
+    (data.unknown || []).forEach(u => unknownCounts.set(u.code, (unknownCounts.get(u.code) || 0) + u.count));
+    renderUnknown();
+    document.dispatchEvent(new CustomEvent("stocktake:lines-changed", { detail: { quantities } }));
+
+    const last = (data.results || []).slice(-1)[0];
+    if (last) setStatus(`${last.part_number}: ${last.quantity} counted`);
+    else if (data.unknown && data.unknown.length) setStatus(`Not in catalogue: ${data.unknown[0].code}`);
+    if (state.codes.length || state.batch) schedule(0);
+  }
+
+  input.addEventListener("keydown", (e) => {
+    if (e.key !== "Enter") return;
+    e.preventDefault();
+    const code = input.value.trim();
+    input.value = "";
+    if (!code) return;
+    state.codes.push(code);
+    save();
+    setStatus(`${code} scanned`);
+    if (state.codes.length >= SCAN_MAX_CODES) send();
+    else schedule(SCAN_WINDOW_MS);
+  });
+
+  window.addEventListener("online", () => send());
+
+  // Scans left over from an earlier visit
+  if (state.codes.length || state.batch) schedule(0);
+})();
+
+
 /* =========================
    Stocktake filters: submit only on button press
    ========================= */
@@ -862,6 +1391,7 @@ function hideToast() {
 
   const stocktakeId = body.dataset.stocktakeId;
   const setUrlTemplate = body.dataset.leaderSetUrlTemplate; // .../__PN__
+  const adjustUrlTemplate = body.dataset.leaderAdjustUrlTemplate || ""; // .../__PN__
   if (!stocktakeId || !setUrlTemplate) return; // only run on leader edit page
 
   const form = document.getElementById("leadStocktakeFilters");
@@ -873,7 +1403,7 @@ function hideToast() {
   const mineEmpty = document.getElementById("leadMineEmpty");
   const mineCountBadge = document.getElementById("leadMineCountBadge");
 
-  const cards = Array.from(document.querySelectorAll(".leader-part-card"));
+  const cards = () => Array.from(document.querySelectorAll(".leader-part-card"));
 
   // ---- toast
   const toast = document.getElementById("leadToast");
@@ -903,7 +1433,7 @@ function hideToast() {
 
   function countSelected() {
     let n = 0;
-    cards.forEach(c => { if (getQty(c) > 0) n++; });
+    cards().forEach(c => { if (getQty(c) > 0) n++; });
     return n;
   }
 
@@ -912,9 +1442,10 @@ function hideToast() {
     if (allBtn) allBtn.classList.toggle("active", !isMine);
     if (mineBtn) mineBtn.classList.toggle("active", isMine);
 
-    cards.forEach(card => {
+    cards().forEach(card => {
       const qty = getQty(card);
-      const show = !isMine || qty > 0;
+      // mine-only cards wait in "All Parts" until their catalogue page loads
+      const show = isMine ? qty > 0 : card.dataset.mineOnly !== "1";
       card.parentElement.style.display = show ? "" : "none";
     });
 
@@ -951,8 +1482,27 @@ function hideToast() {
     return data; // quantity, items_count
   }
 
+  // +/- go through the atomic adjust endpoint, so a leader tap and an
+  // engineer tap on the same line both count
+  async function adjustQty(partNumber, delta) {
+    const url = adjustUrlTemplate.replace("__PN__", encodeURIComponent(partNumber));
+    const body = new URLSearchParams();
+    body.set("delta", String(delta));
+
+    const res = await fetch(url, {
+      method: "POST",
+      headers: { "Content-Type": "application/x-www-form-urlencoded", "X-Requested-With": "XMLHttpRequest" },
+      body
+    });
+
+    if (!res.ok) throw new Error("Bad response");
+    const data = await res.json();
+    if (!data.ok) throw new Error(data.error || "Save failed");
+    return data; // quantity, items_count
+  }
+
   // ---- bind controls
-  cards.forEach(card => {
+  function bindCard(card) {
     const part = card.getAttribute("data-part");
     if (!part) return;
 
@@ -966,7 +1516,7 @@ function hideToast() {
 
     let busy = false;
 
-    async function applyQty(next) {
+    async function applyQty(next, delta) {
       if (busy) return;
       busy = true;
 
@@ -975,7 +1525,9 @@ function hideToast() {
       if (status) status.textContent = "Saving…";
 
       try {
-        const data = await setQty(part, next);
+        const data = (typeof delta === "number" && adjustUrlTemplate)
+          ? await adjustQty(part, delta)
+          : await setQty(part, next);
         qtyInput.value = String(data.quantity);
         if (badge) badge.textContent = String(data.quantity);
         if (status) status.textContent = "";
@@ -996,15 +1548,227 @@ function hideToast() {
 
     plusBtn.addEventListener("click", () => {
       const cur = parseInt(qtyInput.value || "0", 10) || 0;
-      applyQty(cur + 1);
+      applyQty(cur + 1, 1);
     });
 
     minusBtn.addEventListener("click", () => {
       const cur = parseInt(qtyInput.value || "0", 10) || 0;
-      applyQty(Math.max(0, cur - 1));
+      if (cur <= 0) return;
+      applyQty(cur - 1, -1);
     });
 
     qtyInput.addEventListener("change", () => applyQty(qtyInput.value));
+  }
+
+  cards().forEach(bindCard);
+
+  // ---- further catalogue pages from /api/catalogue/parts (own lines already have cards)
+  const more = document.getElementById("leadLoadMore");
+  const grid = document.getElementById("leadCardsGrid");
+  if (more && grid) {
+    const qtyMap = (() => {
+      try { return JSON.parse(document.getElementById("leadQtyMap").textContent) || {}; } catch (e) { return {}; }
+    })();
+
+    initLoadMore(more, function (parts) {
+      parts.forEach(p => {
+        const mine = cards().find(card => card.getAttribute("data-part") === p.part_number);
+        if (mine) {
+          // An own line rendered up front: move it into catalogue order
+          delete mine.dataset.mineOnly;
+          grid.appendChild(mine.parentElement);
+          return;
+        }
+        grid.insertAdjacentHTML("beforeend", leaderCardHtml(p, qtyMap[p.part_number] || 0));
+        bindCard(grid.lastElementChild.querySelector(".leader-part-card"));
+      });
+      // Mine-only cards stay after the loaded pages
+      grid.querySelectorAll('.leader-part-card[data-mine-only="1"]').forEach(card => grid.appendChild(card.parentElement));
+      try { setView(localStorage.getItem(viewKey) || "mine"); } catch (e) { setView("mine"); }
+    });
+  }
+
+})();
+
+
+/* =========================
+   Catalogue / Reagents: load more pages from /api/catalogue/parts
+   (Load more button + infinite scroll)
+   ========================= */
+(function () {
+  const more = document.getElementById("catalogueLoadMore");
+  const grid = document.getElementById("catalogueGrid");
+  if (!more || !grid) return;
+
+  const showImages = more.dataset.showImages === "1";
+
+  initLoadMore(more, function (parts) {
+    grid.insertAdjacentHTML("beforeend", parts.map(p => catalogueCardHtml(p, showImages)).join(""));
   });
 
+  // Cards added from JSON use data-add-part instead of inline onclick
+  grid.addEventListener("click", function (e) {
+    const btn = e.target.closest("[data-add-part]");
+    if (btn) addToBasket(btn.getAttribute("data-add-part"));
+  });
+})();
+
+// ------------------------------
+// Part code "did you mean" (catalogue search, reagents, stocktake unfound)
+// ------------------------------
+(function () {
+  const inputs = document.querySelectorAll("input[data-suggest-url]");
+  if (!inputs.length) return;
+
+  function partPath(partNumber) {
+    // Route takes a <path:...> segment, so keep the slashes
+    return String(partNumber).split("/").map(encodeURIComponent).join("/");
+  }
+
+  inputs.forEach(function (input) {
+    const target = document.getElementById(input.dataset.suggestTarget || "");
+    if (!target) return;
+
+    const addUrl = input.dataset.suggestAddUrl || "";
+    let timer = null;
+    let controller = null;
+
+    function clear() {
+      target.innerHTML = "";
+    }
+
+    function itemHtml(p) {
+      const label = `<span><strong>${escapeHtml(p.part_number)}</strong> <span class="text-muted">${escapeHtml(p.description)}</span></span>`;
+      if (addUrl) {
+        const href = addUrl.replace("__PART__", partPath(p.part_number));
+        return `<a class="list-group-item list-group-item-action d-flex justify-content-between align-items-center gap-2" href="${escapeHtml(href)}" data-ajax-add>${label}<span class="badge bg-primary">Add</span></a>`;
+      }
+      return `<button type="button" class="list-group-item list-group-item-action d-flex justify-content-between align-items-center gap-2" data-add-part="${escapeHtml(p.part_number)}">${label}<span class="badge bg-primary">Add</span></button>`;
+    }
+
+    async function lookup() {
+      const q = input.value.trim();
+      if (q.replace(/[^0-9a-z]/gi, "").length < 2) {
+        clear();
+        return;
+      }
+
+      if (controller) controller.abort();
+      controller = new AbortController();
+
+      try {
+        const url = new URL(input.dataset.suggestUrl, window.location.origin);
+        url.searchParams.set("q", q);
+        const res = await fetch(url.toString(), { signal: controller.signal });
+        const data = await res.json();
+        if (!data || data.ok !== true || !(data.suggestions || []).length) {
+          clear();
+          return;
+        }
+
+        const heading = data.exact ? "Catalogue match" : "Did you mean";
+        target.innerHTML = `
+          <div class="list-group shadow-sm">
+            <div class="list-group-item small text-muted">${heading}</div>
+            ${data.suggestions.map(itemHtml).join("")}
+          </div>
+        `;
+      } catch (e) {
+        if (e.name !== "AbortError") clear();
+      }
+    }
+
+    input.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(lookup, 120);
+    });
+
+    target.addEventListener("click", function (e) {
+      const btn = e.target.closest("[data-add-part]");
+      if (!btn) return;
+      addToBasket(btn.getAttribute("data-add-part"));
+      clear();
+    });
+  });
+})();
+
+
+// ------------------------------
+// Stocktake "Add" links (+1): AJAX instead of redirect-and-rerender
+// Plain links still work without JS.
+// ------------------------------
+(function () {
+  document.addEventListener("click", async function (e) {
+    const link = e.target.closest("a[data-ajax-add]");
+    if (!link || e.metaKey || e.ctrlKey || e.shiftKey) return;
+    e.preventDefault();
+    if (link.dataset.busy === "1") return;
+    link.dataset.busy = "1";
+
+    try {
+      const res = await fetch(link.href, { headers: { "X-Requested-With": "XMLHttpRequest" } });
+      const data = await res.json();
+      if (!data || !data.ok) throw new Error((data && data.error) || "Add failed");
+
+      // Keep any card for the same part on this page in step
+      document.querySelectorAll(".stocktake-part-card, .leader-part-card").forEach(card => {
+        if (card.getAttribute("data-part") !== data.part_number) return;
+        const input = card.querySelector(".st-qty, .lead-qty");
+        const badge = card.querySelector(".st-qty-badge, .lead-qty-badge");
+        if (input) input.value = String(data.quantity);
+        if (badge) badge.textContent = String(data.quantity);
+      });
+
+      link.classList.add("active");
+      link.setAttribute("title", `Added (${data.quantity} in stocktake)`);
+      const pill = link.querySelector(".badge");
+      if (pill) pill.textContent = `Added ✔ ${data.quantity}`;
+      else link.textContent = `Added ✔ ${data.quantity}`;
+    } catch (err) {
+      // Fall back to the normal link behaviour
+      window.location.href = link.href;
+    } finally {
+      link.dataset.busy = "";
+    }
+  });
+})();
+
+// ------------------------------
+// My Orders: append the next keyset page of older dispatch lines
+// ------------------------------
+(function () {
+  const btn = document.getElementById("olderDispatchMore");
+  const tbody = document.getElementById("olderDispatchRows");
+  if (!btn || !tbody) return;
+
+  function rowHtml(row) {
+    return `<tr>
+      <td>${escapeHtml(row.dispatch_date)}</td>
+      <td>${escapeHtml(row.part_number)}</td>
+      <td>${colourPillHtml(row.colour)}</td>
+      <td>${escapeHtml(row.description)}</td>
+      <td class="text-end">${escapeHtml(row.qty_sent)}</td>
+    </tr>`;
+  }
+
+  btn.addEventListener("click", async () => {
+    btn.disabled = true;
+    try {
+      const url = new URL(btn.dataset.apiUrl, window.location.origin);
+      url.searchParams.set("cursor", btn.dataset.cursor);
+      const res = await fetch(url, { headers: { "X-Requested-With": "XMLHttpRequest" } });
+      const data = await res.json();
+      if (!res.ok || !data.ok) throw new Error("Load failed");
+      tbody.insertAdjacentHTML("beforeend", data.rows.map(rowHtml).join(""));
+      if (data.next_cursor) {
+        btn.dataset.cursor = data.next_cursor;
+        btn.disabled = false;
+      } else {
+        btn.remove();
+      }
+    } catch (e) {
+      btn.disabled = false;
+      btn.textContent = "Load more (retry)";
+    }
+  });
 })();
@@ -0,0 +1,70 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app does its start-up work (schema, migrations, parts import, catalogue
+# snapshot) at import time, relative to the working directory, so give it a
+# scratch one. Point SQLALCHEMY_DATABASE_URI at a local Postgres to run the
+# suite against the production dialect; the default is a SQLite file.
+WORKDIR = tempfile.mkdtemp(prefix="servitech-tests-")
+shutil.copy(os.path.join(ROOT, "parts.csv"), WORKDIR)
+os.chdir(WORKDIR)
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite:///{os.path.join(WORKDIR, 'test.db')}")
+
+import app as app_module  # noqa: E402
+
+app_module.app.extensions["mail"].suppress = True
+
+# Reference and bookkeeping tables that keep their rows between tests
+KEEP_TABLES = {"part", "cache_version", "schema_migration", "stocktake_run", "hidden_part"}
+
+ENGINEER = "tom@servitech.co.uk"
+
+
+@pytest.fixture
+def app():
+    return app_module
+
+
+@pytest.fixture(autouse=True)
+def clean_tables():
+    yield
+    with app_module.app.app_context():
+        for table in reversed(app_module.db.metadata.sorted_tables):
+            if table.name not in KEEP_TABLES:
+                app_module.db.session.execute(table.delete())
+        app_module.db.session.commit()
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def leader_client():
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["stocktake_leader_authed"] = True
+    return client
+
+
+@pytest.fixture
+def stocktake(client):
+    """The engineer's draft stocktake in the active run (created by visiting the page)."""
+    client.get(f"/stocktake/{ENGINEER}")
+    with app_module.app.app_context():
+        return app_module.get_active_stocktake(ENGINEER).id
+
+
+@pytest.fixture
+def part_numbers():
+    """A few catalogue part numbers visible on the stocktake page."""
+    with app_module.app.app_context():
+        return [p.part_number for p in app_module.get_catalogue_view("stocktake").parts[:5]]
@@ -0,0 +1,21 @@
+def test_duplicate_part_numbers_keep_the_first_row(app, monkeypatch):
+    catalogue = app.PartsCatalogue([
+        app.PartRecord("DUP/001", description="first", colour="red"),
+        app.PartRecord("ONE/001", description="only"),
+        app.PartRecord("DUP/001", description="second", colour="blue"),
+    ])
+    monkeypatch.setattr(app, "parts_db", catalogue)
+
+    descriptions = app.catalogue_map("description")
+    assert descriptions == {"DUP/001": "first", "ONE/001": "only"}
+    assert descriptions["DUP/001"] == app.get_part_by_number("DUP/001").description
+    assert app.catalogue_map("colour")["DUP/001"] == "red"
+
+
+def test_maps_are_rebuilt_for_a_new_generation(app, monkeypatch):
+    monkeypatch.setattr(app, "parts_db", app.PartsCatalogue([app.PartRecord("A/1", description="old")]))
+    assert app.catalogue_map("description") == {"A/1": "old"}
+    assert app.catalogue_map("description") is app.catalogue_map("description")
+
+    monkeypatch.setattr(app, "parts_db", app.PartsCatalogue([app.PartRecord("A/1", description="new")]))
+    assert app.catalogue_map("description") == {"A/1": "new"}
@@ -0,0 +1,66 @@
+import pytest
+
+
+@pytest.fixture
+def catalogue(app):
+    return app.PartsCatalogue([
+        app.PartRecord("VAL/002", description="Pinch valve spare", make="Genie"),
+        app.PartRecord("XVAL-1", description="Bracket for Genie arm"),
+        app.PartRecord("VAL", description="Valve body"),
+        app.PartRecord("PMP/001", description="Pump with valve", manufacturer="Valco"),
+        app.PartRecord("VAL/001", description="Pinch valve"),
+        app.PartRecord("FLT/010", description="Filter 10 micron", manufacturer="Acme Ab"),
+    ])
+
+
+def codes(parts):
+    return [p.part_number for p in parts]
+
+
+def test_results_are_ranked_then_kept_in_catalogue_order(catalogue):
+    # exact code, code prefixes, code hit, description hit
+    assert codes(catalogue.search("val")) == ["VAL", "VAL/002", "VAL/001", "XVAL-1", "PMP/001"]
+    assert codes(catalogue.search("pinch")) == ["VAL/002", "VAL/001"]
+    # make/manufacturer hits come last
+    assert codes(catalogue.search("genie")) == ["XVAL-1", "VAL/002"]
+
+
+def test_multi_word_queries_match_every_word(catalogue):
+    assert codes(catalogue.search("pinch spare")) == ["VAL/002"]
+    assert codes(catalogue.search("filter 10")) == ["FLT/010"]
+    assert catalogue.search("pinch filter") == []
+
+
+def test_two_character_tokens_use_the_index(catalogue):
+    assert codes(catalogue.search("pu")) == ["PMP/001"]
+    # The last characters of a part are found too
+    assert codes(catalogue.search("ab")) == ["FLT/010"]
+    assert codes(catalogue.search("10 fi")) == ["FLT/010"]
+    assert catalogue.search("qq") == []
+
+
+def test_single_characters_alone_match_nothing(catalogue):
+    assert catalogue.search("v") == []
+    assert catalogue.search("v a") == []
+    assert codes(catalogue.search("val 1")) == ["XVAL-1", "PMP/001", "VAL/001"]
+
+
+def test_limit_and_after_page_through_the_ranking(catalogue):
+    ranked = catalogue.search("val")
+    pages, after = [], None
+    while True:
+        page = catalogue.search("val", limit=2, after=after)
+        if not page:
+            break
+        pages.append(codes(page))
+        after = catalogue.position(page[-1])
+    assert pages == [["VAL", "VAL/002"], ["VAL/001", "XVAL-1"], ["PMP/001"]]
+    assert sum(pages, []) == codes(ranked)
+
+    # A cursor part that is no longer a result ends the listing
+    assert catalogue.search("val", after=catalogue.position(catalogue.get("FLT/010"))) == []
+
+
+def test_where_filters_before_the_limit(catalogue):
+    no_slash = catalogue.search("val", limit=2, where=lambda p: "/" not in p.part_number)
+    assert codes(no_slash) == ["VAL", "XVAL-1"]
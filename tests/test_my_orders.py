@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+EMAIL = "tom@servitech.co.uk"
+
+
+@pytest.fixture
+def dispatches(app):
+    """Two recent dispatch lines and seven older ones, three of them sharing a date.
+
+    Returns the older lines' descriptions newest first, in (date, item id) order.
+    """
+    now = datetime.utcnow()
+    notes = [
+        (EMAIL, 1, ["r1", "r2"]),
+        # Stored with the Stock System's capitalisation
+        ("Tom@Servitech.co.uk", 10, ["a1", "a2", "a3"]),
+        (EMAIL, 20, ["b1"]),
+        (EMAIL, 30, ["c1", "c2"]),
+        (EMAIL, 40, ["d1"]),
+        ("someone.else@servitech.co.uk", 15, ["x1"]),
+    ]
+    with app.app.app_context():
+        for email, days_ago, lines in notes:
+            note = app.DispatchNote(engineer_email=email, date=now - timedelta(days=days_ago))
+            note.items = [
+                app.DispatchItem(part_number=f"PN-{line[0]}", description=line, quantity_sent=1)
+                for line in lines
+            ]
+            app.db.session.add(note)
+        app.db.session.commit()
+    return ["a3", "a2", "a1", "b1", "c2", "c1", "d1"]
+
+
+def older_pages(app, limit):
+    """Every page of get_older_dispatches, following its cursors."""
+    pages, after = [], None
+    while True:
+        rows, next_cursor = app.get_older_dispatches(EMAIL, after=after, limit=limit)
+        pages.append([row.description for row in rows])
+        if next_cursor is None:
+            return pages
+        after = app.parse_dispatch_cursor(next_cursor)
+
+
+def test_first_page_matches_the_older_query(app, dispatches):
+    with app.app.app_context():
+        data = app.load_my_orders(EMAIL, older_limit=2)
+        rows, next_cursor = app.get_older_dispatches(EMAIL, limit=2)
+
+    assert sorted(r.description for r in data["recent_dispatches"]) == ["r1", "r2"]
+    assert [r.description for r in data["older_dispatches"]] == [r.description for r in rows] == ["a3", "a2"]
+    assert data["older_next_cursor"] == next_cursor
+    assert set(data["last_dispatch_for_part"]) == {"PN-r", "PN-a", "PN-b", "PN-c", "PN-d"}
+
+
+def test_pages_cover_every_older_line_once(app, dispatches):
+    with app.app.app_context():
+        # Limit 2 puts a page boundary inside the three lines sharing a date
+        pages = older_pages(app, limit=2)
+        assert pages == [["a3", "a2"], ["a1", "b1"], ["c2", "c1"], ["d1"]]
+        assert [line for page in older_pages(app, limit=50) for line in page] == dispatches
+
+
+def test_last_page_has_no_cursor(app, dispatches):
+    with app.app.app_context():
+        data = app.load_my_orders(EMAIL, older_limit=len(dispatches))
+    assert [r.description for r in data["older_dispatches"]] == dispatches
+    assert data["older_next_cursor"] is None
+
+
+def test_api_follows_the_page_cursor(app, client, dispatches):
+    with app.app.app_context():
+        cursor = app.load_my_orders(EMAIL, older_limit=3)["older_next_cursor"]
+
+    seen = []
+    while cursor:
+        data = client.get("/api/my-orders/older", query_string={"email": EMAIL, "cursor": cursor, "limit": 3}).get_json()
+        seen += [row["description"] for row in data["rows"]]
+        cursor = data["next_cursor"]
+    assert seen == dispatches[3:]
+
+
+def test_malformed_cursor_starts_from_the_first_page(app, client, dispatches):
+    data = client.get("/api/my-orders/older", query_string={"email": EMAIL, "cursor": "junk", "limit": 2}).get_json()
+    assert [row["description"] for row in data["rows"]] == ["a3", "a2"]
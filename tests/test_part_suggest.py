@@ -0,0 +1,55 @@
+import pytest
+
+
+@pytest.fixture
+def catalogue(app):
+    return app.PartsCatalogue([
+        app.PartRecord("2KE/ABL/001", description="Cable"),
+        app.PartRecord("2KE/ABL/002", description="Cable, long"),
+        app.PartRecord("2KE/SIR/001", description="Pinch valve"),
+        app.PartRecord("FLT-010", description="Filter"),
+    ])
+
+
+def suggestions(catalogue, query, **kwargs):
+    return [(match, part.part_number) for match, part in catalogue.suggest(query, **kwargs)]
+
+
+def test_exact_code_ignores_case_and_punctuation(catalogue):
+    assert suggestions(catalogue, "2ke-abl 001")[0] == ("exact", "2KE/ABL/001")
+    assert catalogue.get("2keabl001").part_number == "2KE/ABL/001"
+
+
+def test_prefix_matches_in_code_order(catalogue):
+    assert suggestions(catalogue, "2keabl") == [("prefix", "2KE/ABL/001"), ("prefix", "2KE/ABL/002")]
+
+
+@pytest.mark.parametrize("typed", [
+    "FLT011",   # substitution
+    "FLT0100",  # insertion
+    "FLT10",    # deletion
+    "FTL010",   # neighbours swapped
+])
+def test_one_edit_away_is_a_typo_match(catalogue, typed):
+    assert suggestions(catalogue, typed) == [("typo", "FLT-010")]
+
+
+def test_two_edits_and_short_codes_get_no_typo_matches(catalogue):
+    assert suggestions(catalogue, "FTL011") == []
+    assert suggestions(catalogue, "FX") == []
+
+
+def test_limit_and_accept(catalogue):
+    assert len(catalogue.suggest("2ke", limit=2)) == 2
+    only_sir = suggestions(catalogue, "2KESIR002", accept=lambda p: "SIR" in p.part_number)
+    assert only_sir == [("typo", "2KE/SIR/001")]
+
+
+def test_suggest_api_reports_exact_hits(app, client):
+    with app.app.test_request_context():
+        part = app.get_catalogue_view("service").parts[0]
+    data = client.get("/api/parts/suggest", query_string={"q": part.part_number.lower()}).get_json()
+    assert data["exact"] and data["suggestions"][0]["part_number"] == part.part_number
+
+    data = client.get("/api/parts/suggest", query_string={"q": "ZZZZZZZZZZ"}).get_json()
+    assert not data["exact"] and data["suggestions"] == []
@@ -0,0 +1,53 @@
+import pytest
+
+API = "/api/catalogue/parts"
+
+
+def edit_elsewhere(app, part_number, description):
+    """Edit a part row as another worker's save_part does, leaving this
+    worker's catalogue alone: new version, row update, signal file."""
+    with app.app.app_context():
+        part = app.Part.query.filter_by(part_number=part_number).one()
+        app.bump_cache_version(app.PARTS_CATALOGUE_VERSION_KEY)
+        part.version = app.get_cache_version(app.PARTS_CATALOGUE_VERSION_KEY)
+        part.description = description
+        app.db.session.commit()
+        app.signal_parts_catalogue_change(part.version)
+
+
+@pytest.fixture
+def edited_part(app):
+    """A service part whose description the test may change; restored afterwards."""
+    with app.app.test_request_context():
+        part = app.get_catalogue_view("service").parts[3]
+    yield part.part_number
+    edit_elsewhere(app, part.part_number, part.description)
+    with app.app.app_context():
+        app.sync_parts_catalogue()
+
+
+def test_next_request_picks_up_another_workers_edit(app, client, edited_part):
+    before = app.parts_db
+    edit_elsewhere(app, edited_part, "Renamed elsewhere zqx")
+
+    data = client.get(API, query_string={"role": "service", "search": "zqx"}).get_json()
+    assert [p["part_number"] for p in data["parts"]] == [edited_part]
+    assert app.parts_db.get(edited_part).description == "Renamed elsewhere zqx"
+    assert app.parts_db.version > before.version
+
+    # The catalogue a request may still be reading was replaced, not patched
+    assert app.parts_db is not before
+    assert before.get(edited_part).description != "Renamed elsewhere zqx"
+    assert before.search("zqx") == []
+
+
+def test_patched_catalogue_matches_a_full_rebuild(app, edited_part):
+    edit_elsewhere(app, edited_part, "Pinch valve zqx")
+    with app.app.app_context():
+        app.sync_parts_catalogue()
+
+    patched = app.parts_db
+    rebuilt = app.PartsCatalogue(list(patched.parts))
+    for query in ("zqx", "valve", "pi", "pinch valve"):
+        assert [p.part_number for p in patched.search(query)] == [p.part_number for p in rebuilt.search(query)]
+    assert patched.categories == rebuilt.categories
@@ -0,0 +1,47 @@
+from conftest import ENGINEER
+
+
+def submit(client, part_numbers):
+    base = f"/stocktake/{ENGINEER}"
+    client.post(f"{base}/set/{part_numbers[0]}", data={"quantity": "3"})
+    client.post(f"{base}/set/{part_numbers[1]}", data={"quantity": "2"})
+    client.post(f"{base}/add-unfound", data={"part_code": "ZZ-1", "description": "thing", "quantity": "1"})
+    client.post(f"{base}/submit", data={"ack": "yes", "confirm_text": "SUBMIT"})
+
+
+def verify(app, *args):
+    result = app.app.test_cli_runner().invoke(args=["verify-run-totals", *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_totals_kept_in_step_report_no_drift(app, client, leader_client, stocktake, part_numbers):
+    submit(client, part_numbers)
+    # Leader edits to a submitted stocktake move the totals too
+    leader_client.post(f"/stocktake-leader/engineer/{stocktake}/adjust/{part_numbers[0]}", data={"delta": "2"})
+
+    with app.app.app_context():
+        run_id = app.get_active_stocktake(ENGINEER).run_id
+        assert app.stored_run_totals(run_id) == {
+            (False, part_numbers[0], ""): 5,
+            (False, part_numbers[1], ""): 2,
+            (True, "ZZ-1", "thing"): 1,
+        }
+    assert verify(app).strip().endswith("0 runs drifted")
+
+
+def test_drift_is_reported_and_fixed(app, client, stocktake, part_numbers):
+    submit(client, part_numbers)
+    with app.app.app_context():
+        run_id = app.get_active_stocktake(ENGINEER).run_id
+        app.StocktakeRunTotal.query.filter_by(run_id=run_id, part_number=part_numbers[0]).update({"total_qty": 7})
+        app.db.session.commit()
+
+    output = verify(app)
+    assert f"{part_numbers[0]}: stored 7, expected 3" in output
+    assert output.strip().endswith("1 runs drifted")
+    # Reporting alone leaves the stored totals as they were
+    assert "1 runs drifted" in verify(app)
+
+    assert verify(app, "--fix").strip().endswith("1 runs drifted (rebuilt)")
+    assert verify(app).strip().endswith("0 runs drifted")
@@ -0,0 +1,55 @@
+from conftest import ENGINEER
+
+XHR = {"X-Requested-With": "XMLHttpRequest"}
+
+
+def stored_counters(app, stocktake_id):
+    with app.app.app_context():
+        st = app.db.session.get(app.Stocktake, stocktake_id)
+        return st.lines, st.total_qty
+
+
+def test_responses_report_the_recount(app, client, leader_client, stocktake, part_numbers):
+    base = f"/stocktake/{ENGINEER}"
+    client.post(f"{base}/add-unfound", data={"part_code": "ZZ-1", "description": "thing", "quantity": "2"})
+    client.post(f"{base}/set/{part_numbers[0]}", data={"quantity": "3"})
+
+    data = client.post(f"{base}/update/{part_numbers[0]}", data={"quantity": "5"}, headers=XHR).get_json()
+    assert (data["quantity"], data["items_count"], data["total_qty"]) == (5, 2, 7)
+
+    leader = f"/stocktake-leader/engineer/{stocktake}"
+    data = leader_client.post(f"{leader}/adjust/{part_numbers[1]}", data={"delta": "4"}).get_json()
+    # Unfound lines count as lines, as on the engineer's page
+    assert (data["items_count"], data["total_qty"]) == (3, 11)
+    assert stored_counters(app, stocktake) == (3, 11)
+
+    data = leader_client.post(f"{leader}/set/{part_numbers[1]}", data={"quantity": "0"}).get_json()
+    assert data["removed"] and (data["items_count"], data["total_qty"]) == (2, 7)
+
+    data = leader_client.post(f"{leader}/update/{part_numbers[0]}", data={"quantity": "1"}).get_json()
+    assert (data["items_count"], data["total_qty"]) == (2, 3)
+    assert stored_counters(app, stocktake) == (2, 3)
+
+
+def test_recount_matches_lines_after_mixed_edits(app, client, stocktake, part_numbers):
+    base = f"/stocktake/{ENGINEER}"
+    for part in part_numbers[:3]:
+        client.get(f"{base}/add/{part}", headers=XHR)
+    client.post(f"{base}/adjust/{part_numbers[0]}", data={"delta": "4"})
+    client.post(f"{base}/adjust/{part_numbers[1]}", data={"delta": "-1"})
+    client.post(f"{base}/scan", json={"batch_id": "b-1", "codes": [part_numbers[2]] * 3 + ["NOT-A-PART"]})
+    client.post(f"{base}/add-unfound", data={"part_code": "ZZ-2", "description": "other", "quantity": "2"})
+
+    with app.app.app_context():
+        db = app.db
+        quantities = dict(
+            db.session.query(app.StocktakeItem.part_number, app.StocktakeItem.quantity).filter_by(stocktake_id=stocktake)
+        )
+        unfound = db.session.query(app.StocktakeUnfoundItem.quantity).filter_by(stocktake_id=stocktake).all()
+        assert quantities == {part_numbers[0]: 5, part_numbers[2]: 4}
+
+        expected = (len(quantities) + len(unfound), sum(quantities.values()) + sum(q for (q,) in unfound))
+        assert stored_counters(app, stocktake) == expected
+        # A full recount from scratch finds no drift
+        assert app.recount_stocktake(stocktake) == expected
+        db.session.rollback()
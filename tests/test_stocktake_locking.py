@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+from conftest import ENGINEER
+
+LINE_TABLES = ("stocktake_item", "stocktake_unfound_item")
+
+
+@pytest.fixture
+def statement_log(app):
+    """Ordered log of ("lock", sql) for ORM statements that lock a row and
+    ("sql", sql) for every statement sent to the database."""
+    log = []
+
+    def on_orm_execute(state):
+        if not state.is_select:
+            return
+        sql = str(state.statement.compile(dialect=postgresql.dialect()))
+        if "FOR NO KEY UPDATE" in sql or "FOR UPDATE" in sql:
+            log.append(("lock", sql))
+
+    def on_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        log.append(("sql", statement))
+
+    with app.app.app_context():
+        engine = app.db.engine
+    session_class = app.db.session.session_factory.class_
+    event.listen(session_class, "do_orm_execute", on_orm_execute)
+    event.listen(engine, "before_cursor_execute", on_cursor_execute)
+    yield log
+    event.remove(session_class, "do_orm_execute", on_orm_execute)
+    event.remove(engine, "before_cursor_execute", on_cursor_execute)
+
+
+def first_line_write(log):
+    for i, (kind, sql) in enumerate(log):
+        words = sql.split()
+        if kind == "sql" and words and words[0].upper() in {"INSERT", "UPDATE", "DELETE"}:
+            if any(table in sql for table in LINE_TABLES):
+                return i
+    return None
+
+
+def engineer_requests(part):
+    base = f"/stocktake/{ENGINEER}"
+    return {
+        "add": lambda c: c.get(f"{base}/add/{part}", headers={"X-Requested-With": "XMLHttpRequest"}),
+        "adjust": lambda c: c.post(f"{base}/adjust/{part}", data={"delta": "2"}),
+        "set": lambda c: c.post(f"{base}/set/{part}", data={"quantity": "3"}),
+        "sync": lambda c: c.post(f"{base}/sync", json={"ops": [{"op_id": "op-1", "type": "add", "part_number": part, "delta": 1}]}),
+        "scan": lambda c: c.post(f"{base}/scan", json={"batch_id": "b-1", "codes": [part, part]}),
+        "add-unfound": lambda c: c.post(f"{base}/add-unfound", data={"part_code": "ZZ-1", "description": "thing", "quantity": "1"}),
+    }
+
+
+@pytest.mark.parametrize("action", ["add", "adjust", "set", "sync", "scan", "add-unfound"])
+def test_engineer_mutations_lock_stocktake_before_lines(client, stocktake, part_numbers, statement_log, action):
+    engineer_requests(part_numbers[0])[action](client)
+
+    write = first_line_write(statement_log)
+    assert write is not None, "request did not write any stocktake line"
+    locks = [i for i, (kind, sql) in enumerate(statement_log) if kind == "lock" and "stocktake" in sql]
+    assert locks and locks[0] < write
+    assert "FOR NO KEY UPDATE" in statement_log[locks[0]][1]
+
+
+@pytest.mark.parametrize("action", ["add", "adjust", "set"])
+def test_leader_mutations_lock_stocktake_before_lines(leader_client, stocktake, part_numbers, statement_log, action):
+    base = f"/stocktake-leader/engineer/{stocktake}"
+    part = part_numbers[0]
+    {
+        "add": lambda: leader_client.get(f"{base}/add/{part}", headers={"X-Requested-With": "XMLHttpRequest"}),
+        "adjust": lambda: leader_client.post(f"{base}/adjust/{part}", data={"delta": "1"}),
+        "set": lambda: leader_client.post(f"{base}/set/{part}", data={"quantity": "4"}),
+    }[action]()
+
+    write = first_line_write(statement_log)
+    locks = [i for i, (kind, _) in enumerate(statement_log) if kind == "lock"]
+    assert write is not None and locks and locks[0] < write
+
+
+def test_concurrent_edits_from_two_sessions(app, stocktake, part_numbers):
+    """Two sessions (engineer and leader) adding to the same lines at once:
+    every request succeeds and the counters match the lines afterwards."""
+    rounds = 15
+    errors = []
+    barrier = threading.Barrier(2)
+
+    def engineer():
+        client = app.app.test_client()
+        barrier.wait()
+        for i in range(rounds):
+            resp = client.post(f"/stocktake/{ENGINEER}/adjust/{part_numbers[i % 2]}", data={"delta": "1"})
+            if resp.status_code != 200:
+                errors.append(("engineer", resp.status_code, resp.get_data(as_text=True)[:200]))
+
+    def leader():
+        client = app.app.test_client()
+        with client.session_transaction() as session:
+            session["stocktake_leader_authed"] = True
+        barrier.wait()
+        for i in range(rounds):
+            resp = client.post(f"/stocktake-leader/engineer/{stocktake}/adjust/{part_numbers[(i + 1) % 2]}", data={"delta": "1"})
+            if resp.status_code != 200:
+                errors.append(("leader", resp.status_code, resp.get_data(as_text=True)[:200]))
+
+    threads = [threading.Thread(target=engineer), threading.Thread(target=leader)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    with app.app.app_context():
+        st = app.db.session.get(app.Stocktake, stocktake)
+        quantities = dict(
+            app.db.session.query(app.StocktakeItem.part_number, app.StocktakeItem.quantity)
+            .filter_by(stocktake_id=stocktake)
+        )
+        assert sum(quantities.values()) == 2 * rounds
+        assert (st.lines, st.total_qty) == (len(quantities), 2 * rounds)
@@ -0,0 +1,46 @@
+from conftest import ENGINEER
+
+SCAN = f"/stocktake/{ENGINEER}/scan"
+
+
+def scan(client, codes, batch_id=None):
+    res = client.post(SCAN, json={"codes": codes, "batch_id": batch_id})
+    assert res.status_code == 200
+    return res.get_json()
+
+
+def scanned(data):
+    return {r["part_number"]: (r["scanned"], r["quantity"]) for r in data["results"]}
+
+
+def test_repeats_and_spellings_coalesce_per_part(app, client, stocktake, part_numbers):
+    first, second = part_numbers[:2]
+    compact = app.compact_pn(first).lower()
+    data = scan(client, [first, second, f" {first} ", compact, "NOT-A-PART", "NOT-A-PART", ""], "b-1")
+
+    assert scanned(data) == {first: (3, 3), second: (1, 1)}
+    assert data["unknown"] == [{"code": "NOT-A-PART", "count": 2}]
+    assert (data["items_count"], data["total_qty"]) == (2, 4)
+
+    # A later batch adds on to the counted lines
+    data = scan(client, [second, second], "b-2")
+    assert scanned(data) == {second: (2, 3)}
+    assert (data["items_count"], data["total_qty"]) == (2, 6)
+
+
+def test_resent_batch_counts_once(client, stocktake, part_numbers):
+    codes = [part_numbers[0]] * 2
+    assert scanned(scan(client, codes, "b-1")) == {part_numbers[0]: (2, 2)}
+
+    # The reply was lost and the page sends the same batch again
+    data = scan(client, codes, "b-1")
+    assert data["duplicate"] and data["results"] == []
+    assert (data["items_count"], data["total_qty"]) == (1, 2)
+
+
+def test_rejected_batches(app, client, stocktake, part_numbers):
+    assert client.post(SCAN, json={"codes": []}).status_code == 400
+    too_many = [part_numbers[0]] * (app.STOCKTAKE_BATCH_MAX_CHANGES + 1)
+    assert client.post(SCAN, json={"codes": too_many, "batch_id": "b-1"}).status_code == 400
+    # A rejected batch has not spent its id
+    assert scanned(scan(client, [part_numbers[0]], "b-1")) == {part_numbers[0]: (1, 1)}
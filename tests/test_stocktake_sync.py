@@ -0,0 +1,81 @@
+from conftest import ENGINEER
+
+SYNC = f"/stocktake/{ENGINEER}/sync"
+
+
+def sync(client, ops, since=-1):
+    res = client.post(SYNC, json={"since": since, "ops": ops})
+    assert res.status_code == 200
+    return res.get_json()
+
+
+def quantities(data):
+    return {line["part_number"]: line["quantity"] for line in data["state"]["items"]}
+
+
+def test_resent_ops_apply_once(client, stocktake, part_numbers):
+    first, second = part_numbers[:2]
+    ops = [
+        {"op_id": "op-1", "type": "add", "part_number": first, "delta": 2},
+        {"op_id": "op-2", "type": "set", "part_number": second, "quantity": 3},
+    ]
+    data = sync(client, ops)
+    assert data["applied"] == ["op-1", "op-2"] and data["duplicate"] == []
+    assert quantities(data) == {first: 2, second: 3}
+
+    # The reply was lost: the page resends its log with one new op on the end
+    data = sync(client, ops + [{"op_id": "op-3", "type": "add", "part_number": first, "delta": 1}])
+    assert data["applied"] == ["op-3"]
+    assert data["duplicate"] == ["op-1", "op-2"]
+    assert quantities(data) == {first: 3, second: 3}
+    assert (data["items_count"], data["total_qty"]) == (2, 6)
+
+
+def test_repeated_op_id_within_a_batch_applies_once(client, stocktake, part_numbers):
+    op = {"op_id": "op-1", "type": "add", "part_number": part_numbers[0], "delta": 1}
+    data = sync(client, [op, op])
+    assert data["applied"] == ["op-1"] and data["duplicate"] == ["op-1"]
+    assert quantities(data) == {part_numbers[0]: 1}
+
+
+def test_rejected_ops_are_reported_and_not_retried(client, stocktake, part_numbers):
+    ops = [
+        {"op_id": "op-1", "type": "add", "part_number": "NOT-A-PART", "delta": 1},
+        {"op_id": "op-2", "type": "rename", "part_number": part_numbers[0]},
+        {"op_id": "op-3", "type": "add_unfound", "part_code": "ZZ-1", "description": "", "quantity": 1},
+        {"op_id": "op-4", "type": "add_unfound", "part_code": "ZZ-1", "description": "thing", "quantity": 2},
+    ]
+    data = sync(client, ops)
+    assert [r["op_id"] for r in data["rejected"]] == ["op-1", "op-2", "op-3"]
+    assert data["applied"] == ["op-4"]
+    assert [(u["part_code"], u["quantity"]) for u in data["state"]["unfound"]] == [("ZZ-1", 2)]
+
+    # A rejected op id is spent too, so resending it is only a duplicate
+    data = sync(client, ops[:1], since=data["revision"])
+    assert data["duplicate"] == ["op-1"] and data["rejected"] == []
+
+
+def test_state_only_when_the_client_is_behind(client, stocktake, part_numbers):
+    data = sync(client, [{"op_id": "op-1", "type": "set", "part_number": part_numbers[0], "quantity": 4}])
+    revision = data["revision"]
+
+    data = sync(client, [], since=revision)
+    assert data["state"] is None and data["revision"] == revision
+
+    # Another device (or the leader) changed a line since
+    client.post(f"/stocktake/{ENGINEER}/set/{part_numbers[1]}", data={"quantity": "2"})
+    data = sync(client, [], since=revision)
+    assert data["revision"] > revision
+    assert quantities(data) == {part_numbers[0]: 4, part_numbers[1]: 2}
+
+    data = sync(client, [{"op_id": "op-2", "type": "remove", "part_number": part_numbers[0]}], since=data["revision"])
+    # Its own op moved the revision on, so the reply carries the lines again
+    assert quantities(data) == {part_numbers[1]: 2}
+
+
+def test_submitted_stocktake_refuses_ops(app, client, stocktake, part_numbers):
+    with app.app.app_context():
+        app.db.session.get(app.Stocktake, stocktake).status = "submitted"
+        app.db.session.commit()
+    res = client.post(SYNC, json={"ops": [{"op_id": "op-1", "type": "add", "part_number": part_numbers[0]}]})
+    assert res.status_code == 400 and res.get_json()["locked"]